@@ -3,13 +3,14 @@ import aiohttp
 import datetime
 from urllib.parse import urlencode
 from GoogleScraper.parsing import get_parser_by_search_engine, parse_serp
-from GoogleScraper.http_mode import get_GET_params_for_search_engine, headers
-from GoogleScraper.scraping import get_base_search_url_by_search_engine
+from GoogleScraper.http_mode import get_GET_params_for_search_engine, headers, CAPTCHA_SNIFF_SIZE
+from GoogleScraper.scraping import get_base_search_url_by_search_engine, malicious_request_detected
 from GoogleScraper.utils import get_some_words
 from GoogleScraper.config import Config
 from GoogleScraper.output_converter import store_serp_result
 from GoogleScraper.caching import cache_results
 from GoogleScraper.log import out
+from GoogleScraper.database import serp_rows
 
 
 class AsyncHttpScrape(object):
@@ -65,6 +66,10 @@ class AsyncHttpScrape(object):
                 ), lvl=3)
 
             if response.status == 200:
+                if Config['HTTP'].getboolean('streaming_parse', False):
+                    self.parser = yield from self.stream_response(response)
+                    return self if self.parser else None
+
                 body = yield from response.read_and_close(decode=False)
                 self.parser = self.parser(body)
                 return self
@@ -73,19 +78,56 @@ class AsyncHttpScrape(object):
 
         return request
 
+    @asyncio.coroutine
+    def stream_response(self, response):
+        """Feed the body of the response to a parser in chunks as they arrive.
+
+        Args:
+            response: The response of the search request.
+
+        Returns:
+            The parser that parsed the page or None if the response turned
+            out to be a captcha page.
+        """
+        parser = self.parser()
+        chunks = []
+        received = 0
+        chunk_size = Config['HTTP'].getint('stream_chunk_size', 16384)
+
+        try:
+            while True:
+                chunk = yield from response.content.read(chunk_size)
+                if not chunk:
+                    break
+
+                if received < CAPTCHA_SNIFF_SIZE and malicious_request_detected(
+                        self.search_engine_name, response.url, b''.join(chunks) + chunk):
+                    self.status = 'Malicious request detected'
+                    return None
+
+                chunks.append(chunk)
+                received += len(chunk)
+                parser.feed(chunk)
+        finally:
+            response.close()
+
+        parser.parse(b''.join(chunks))
+        return parser
+
 
 class AsyncScrapeScheduler(object):
     """Processes the single requests in an asynchroneous way.
 
     """
 
-    def __init__(self, scrape_jobs, session=None, scraper_search=None, db_lock=None):
+    def __init__(self, scrape_jobs, session=None, scraper_search=None, db_lock=None, serp_writer=None):
 
         self.max_concurrent_requests = Config['HTTP_ASYNC'].getint('max_concurrent_requests')
         self.scrape_jobs = scrape_jobs
         self.session = session
         self.scraper_search = scraper_search
         self.db_lock = db_lock
+        self.serp_writer = serp_writer
         self.scrape_method = 'async'
 
         self.loop = asyncio.get_event_loop()
@@ -128,8 +170,12 @@ class AsyncScrapeScheduler(object):
                     cache_results(scrape.parser, scrape.query, scrape.search_engine_name, scrape.scrape_method,
                                   scrape.page_number)
 
-                    if scrape.parser:
-                        serp = parse_serp(parser=scrape.parser, scraper=scrape, query=scrape.query)
+                    if scrape.parser and self.serp_writer is not None:
+                        self.serp_writer.add(serp_rows(parser=scrape.parser, scraper=scrape, query=scrape.query))
+
+                    elif scrape.parser:
+                        serp = parse_serp(parser=scrape.parser, scraper=scrape, query=scrape.query,
+                                         session=self.session)
 
                         self.scraper_search.serps.append(serp)
                         self.session.add(serp)
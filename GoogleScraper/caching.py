@@ -8,10 +8,14 @@ import bz2
 import re
 import logging
 import functools
+import datetime
+from collections import deque, defaultdict, namedtuple
+from html import unescape
+from urllib.parse import urlencode, parse_qs
 from sqlalchemy.orm.exc import NoResultFound
 from GoogleScraper.config import Config
-from GoogleScraper.database import SearchEngineResultsPage
-from GoogleScraper.parsing import parse_serp
+from GoogleScraper.database import SearchEngineResultsPage, BulkSerpWriter, serp_rows
+from GoogleScraper.parsing import parse_serp, parse_many, strip_bloat
 from GoogleScraper.log import out
 from GoogleScraper.output_converter import store_serp_result
 
@@ -45,6 +49,28 @@ logger = logging.getLogger('GoogleScraper')
 
 ALLOWED_COMPRESSION_ALGORITHMS = ('gz', 'bz2')
 
+SCRAPE_METHODS = ('http', 'selenium', 'http-async')
+
+# The first line of a cache file records the search of the page, the names of the files are hashes.
+CACHE_HEADER = re.compile(rb'<!-- GoogleScraper (?P<search>\S*) -->\n')
+
+# How many bytes of the start of a cache file are read to find out which search it holds.
+CACHE_HEAD_SIZE = 2 ** 16
+
+# The titles of the serp pages, for the cache files that were written without the header.
+CACHE_TITLE_PATTERNS = {
+    'google': re.compile(rb'<title>(?P<query>.*?) - Google[ -]', re.DOTALL),
+    'bing': re.compile(rb'<title>(?P<query>.*?) - Bing</title>', re.DOTALL),
+    'yahoo': re.compile(rb'<title>(?P<query>.*?) - Yahoo', re.DOTALL),
+    'duckduckgo': re.compile(rb'<title>(?P<query>.*?) at DuckDuckGo</title>', re.DOTALL),
+    'ask': re.compile(rb'<title>(?P<query>.*?) - Ask\.com', re.DOTALL),
+    'baidu': re.compile('<title>(?P<query>.*?)_百度搜索</title>'.encode(), re.DOTALL),
+}
+
+# The request of a cached page, in the shape serp_rows() expects of a scraper.
+CachedPage = namedtuple('CachedPage', ['query', 'search_engine_name', 'scrape_method', 'page_number',
+                                       'requested_at', 'requested_by', 'status', 'autocomplete'])
+
 
 class InvalidConfigurationFileException(Exception):
     """
@@ -125,6 +151,12 @@ class CompressedFile(object):
             data = data.encode()
         return self.writers[self.algorithm](data)
 
+    def compress(self, data):
+        """Get the data compressed like write() writes it, without writing it."""
+        if not isinstance(data, bytes):
+            data = data.encode()
+        return {'gz': gzip.compress, 'bz2': bz2.compress}[self.algorithm](data)
+
 
 def get_path(filename):
     return os.path.join(Config['GLOBAL'].get('cachedir', '.scrapecache'), filename)
@@ -245,7 +277,7 @@ def read_cached_file(path):
         path: The path to the cached file.
 
     Returns:
-        The data of the cached file.
+        The raw bytes of the cached file.
 
     Raises:
         InvalidConfigurationFileException: When the type of the cached file
@@ -260,17 +292,8 @@ def read_cached_file(path):
     assert ext in ALLOWED_COMPRESSION_ALGORITHMS or ext == 'cache', 'Invalid extension: {}'.format(ext)
 
     if ext == 'cache':
-        with open(path, 'r') as fd:
-            try:
-                data = fd.read()
-                return data
-            except UnicodeDecodeError:
-                # If we get this error, the cache files are probably
-                # compressed but the 'compress_cached_files' flag was
-                # set to False. Try to decompress them, but this may
-                # lead to a infinite recursion. This isn't proper coding,
-                # but convenient for the end user.
-                Config.set('GLOBAL', 'compress_cached_files', True)
+        with open(path, 'rb') as fd:
+            return fd.read()
     elif ext in ALLOWED_COMPRESSION_ALGORITHMS:
         f = CompressedFile(path)
         return f.read()
@@ -278,15 +301,71 @@ def read_cached_file(path):
         raise InvalidConfigurationFileException('"{path}" is a invalid configuration file.')
 
 
+def read_cached_file_head(path, size=CACHE_HEAD_SIZE):
+    """Read the first size bytes of a compressed or uncompressed cache file, see read_cached_file()."""
+    ext = path.split('.')[-1]
+    assert ext in ALLOWED_COMPRESSION_ALGORITHMS or ext == 'cache', 'Invalid extension: {}'.format(ext)
+
+    opener = {'cache': open, 'gz': gzip.open, 'bz2': bz2.open}[ext]
+    with opener(path, 'rb') as fd:
+        return fd.read(size)
+
+
+def cache_file_header(query, search_engine, scrape_mode, page_number):
+    """The first line of a cache file, it records the search of the page. See cached_search()."""
+    search = urlencode([('query', query), ('search_engine', search_engine), ('scrape_method', scrape_mode),
+                        ('page_number', page_number)])
+    return '<!-- GoogleScraper {} -->\n'.format(search).encode()
+
+
+def cached_search(path, head):
+    """Find out which search a cache file holds.
+
+    The search is read from the header of the file. Files that were cached without
+    it are attributed by the query in the title of the page, if the hash of the
+    query, search engine, scrape method and page number matches the name of the file.
+
+    Args:
+        path: The path to the cache file.
+        head: The start of the content of the file, see read_cached_file_head().
+
+    Returns:
+        A scrape job dict with the query, search_engine, scrape_method and page_number
+        of the page or None if the search can't be told.
+    """
+    header = CACHE_HEADER.match(head)
+    if header:
+        search = {key: values[0] for key, values in
+                  parse_qs(header.group('search').decode(), keep_blank_values=True).items()}
+        search['page_number'] = int(search['page_number'])
+        return search
+
+    fname = _strip_compression_extension(os.path.split(path)[1])
+    max_page = max(10, Config['SCRAPING'].getint('num_pages_for_keyword', 1))
+
+    for search_engine, pattern in CACHE_TITLE_PATTERNS.items():
+        title = pattern.search(head)
+        if not title:
+            continue
+        query = unescape(title.group('query').decode('utf-8', 'replace')).strip()
+        for scrape_method in SCRAPE_METHODS:
+            for page_number in range(1, max_page + 1):
+                if cached_file_name(query, search_engine, scrape_method, page_number) == fname:
+                    return {'query': query, 'search_engine': search_engine, 'scrape_method': scrape_method,
+                            'page_number': page_number}
+
+    return None
+
+
 @if_caching
-def cache_results(parser, query, search_engine, scrape_mode, page_number, db_lock=None):
+def cache_results(parser, query, search_engine, scrape_mode, page_number, lock=None):
     """Stores the html of an parser in a file.
 
     The file name is determined by the parameters query, search_engine, scrape_mode and page_number.
     See cached_file_name() for more information.
 
-    This will always write(overwrite) the cached file. If compress_cached_files is
-    True, the page is written in bytes (obviously).
+    This will always write(overwrite) the cached file. The page is written in bytes,
+    html that is given as string is encoded in utf-8.
 
     Args:
         parser: A parser with the data to cache.
@@ -294,17 +373,18 @@ def cache_results(parser, query, search_engine, scrape_mode, page_number, db_loc
         search_engine: The search engine the keyword was scraped for.
         scrape_mode: The scrapemode that was used.
         page_number: The page number that the serp page is.
-        db_lock: If an db_lock is given, all action are wrapped in this lock.
+        lock: If a lock is given, the file is written while holding it. The page is
+            cleaned and compressed before, such that the workers do that in parallel.
     """
-
-    if db_lock:
-        db_lock.acquire()
-
     if Config['GLOBAL'].getboolean('minimize_caching_files', True):
         html = parser.cleaned_html
     else:
         html = parser.html
 
+    if isinstance(html, str):
+        html = html.encode()
+    html = cache_file_header(query, search_engine, scrape_mode, page_number) + html
+
     fname = cached_file_name(query, search_engine, scrape_mode, page_number)
     cachedir = Config['GLOBAL'].get('cachedir', '.scrapecache')
     path = os.path.join(cachedir, fname)
@@ -312,16 +392,17 @@ def cache_results(parser, query, search_engine, scrape_mode, page_number, db_loc
     if Config['GLOBAL'].getboolean('compress_cached_files'):
         algorithm = Config['GLOBAL'].get('compressing_algorithm', 'gz')
         f = CompressedFile(path, algorithm=algorithm)
-        f.write(html)
-    else:
-        with open(path, 'w') as fd:
-            if isinstance(html, bytes):
-                fd.write(html.decode())
-            else:
-                fd.write(html)
+        path, html = f.path, f.compress(html)
+
+    if lock:
+        lock.acquire()
 
-    if db_lock:
-        db_lock.release()
+    try:
+        with open(path, 'wb') as fd:
+            fd.write(html)
+    finally:
+        if lock:
+            lock.release()
 
 
 def _get_all_cache_files():
@@ -432,6 +513,130 @@ def parse_all_cached_files(scrape_jobs, session, scraper_search):
     return scrape_jobs
 
 
+def _strip_compression_extension(fname):
+    """Get the cache file name without the extension of the compressing algorithm."""
+    for ext in ALLOWED_COMPRESSION_ALGORITHMS:
+        if fname.endswith('.' + ext):
+            return fname[:-len(ext) - 1]
+    return fname
+
+
+def reparse_cached_files(scrape_jobs, session, scraper_search, workers=None, batch_size=200):
+    """Parse all cache files again and store the fresh results.
+
+    Unlike parse_all_cached_files(), every file in the cache directory is parsed, even
+    if its SERP is already in the database. Existing SERPs are updated in place (their
+    links and knowledge graph are replaced), others are created. The files are streamed
+    to a pool of worker processes, see parse_many(), and the results are written in
+    batches by a BulkSerpWriter.
+
+    The search of a file is known if it belongs to one of the scrape jobs, otherwise it
+    is read from the file, see cached_search(). A file that can't be read, attributed to
+    a search, parsed or written is logged and skipped.
+
+    Args:
+        scrape_jobs: The scrape jobs of the current keywords, may be empty.
+        session: An sql alchemy session to add the entities.
+        scraper_search: Abstract object representing the current search.
+        workers: The number of worker processes. By default the number of cpus.
+        batch_size: After how many SERPs the results are written.
+
+    Returns:
+        The number of SERPs that were parsed again and written.
+    """
+    mapping = {}
+    for job in scrape_jobs:
+        cache_name = cached_file_name(job['query'], job['search_engine'], job['scrape_method'], job['page_number'])
+        mapping[cache_name] = job
+
+    files = sorted(_get_all_cache_files())
+    by_search_engine = defaultdict(list)
+    num_skipped = 0
+
+    for path in files:
+        job = mapping.get(_strip_compression_extension(os.path.split(path)[1]))
+        if job is None:
+            try:
+                job = cached_search(path, read_cached_file_head(path))
+            except Exception as e:
+                logger.error('Couldn\'t read the cache file {}: {}'.format(path, e))
+                num_skipped += 1
+                continue
+        if job is None:
+            logger.warning('Couldn\'t tell the search of the cache file {}, it is skipped.'.format(path))
+            num_skipped += 1
+            continue
+        by_search_engine[job['search_engine']].append((path, job))
+
+    num_found = sum(len(found) for found in by_search_engine.values())
+    out('{} of {} cache files in {} are parsed again.'.format(num_found, len(files), Config['GLOBAL'].get('cachedir')),
+        lvl=1)
+
+    session.add(scraper_search)
+    session.commit()
+    writer = BulkSerpWriter(session.get_bind(), scraper_search.id, batch_size=batch_size, replace=True)
+
+    num_parsed = 0
+    started = time.time()
+
+    try:
+        for search_engine, found in by_search_engine.items():
+            # the files that were handed to the workers, in order
+            pending = deque()
+
+            def read_files():
+                for path, job in found:
+                    try:
+                        html = read_cached_file(path)
+                    except Exception as e:
+                        logger.error('Couldn\'t read the cache file {}: {}'.format(path, e))
+                        continue
+                    pending.append((path, job))
+                    yield job['query'], html
+
+            for result in parse_many(read_files(), search_engine, workers=workers):
+                path, job = pending.popleft()
+
+                if result is None:
+                    logger.error('Couldn\'t parse the cache file {}, it is skipped.'.format(path))
+                    continue
+
+                page = CachedPage(
+                    query=job['query'],
+                    search_engine_name=search_engine,
+                    scrape_method=job['scrape_method'],
+                    page_number=job['page_number'],
+                    requested_at=datetime.datetime.utcfromtimestamp(os.path.getmtime(path)),
+                    requested_by=None,
+                    status=None,
+                    autocomplete=None
+                )
+                try:
+                    writer.add(serp_rows(parser=result, scraper=page, query=job['query']))
+                except Exception as e:
+                    logger.error('Couldn\'t write a batch of SERPs to the database, it is skipped: {}'.format(e))
+                num_parsed += 1
+
+                if num_parsed % batch_size == 0:
+                    out('{}/{} cache files parsed again ({:.1f} SERPs per second).'.format(
+                        num_parsed, num_found, num_parsed / (time.time() - started)), lvl=1)
+    finally:
+        try:
+            writer.close()
+        except Exception as e:
+            logger.error('Couldn\'t write a batch of SERPs to the database, it is skipped: {}'.format(e))
+        session.expire_all()
+
+    # the files that couldn't be read, parsed or written are skipped
+    num_skipped += num_found - writer.num_written
+    num_parsed = writer.num_written
+
+    out('Parsed {} cache files again in {:.1f} seconds ({:.1f} SERPs per second), skipped {}.'.format(
+        num_parsed, time.time() - started, num_parsed / max(time.time() - started, 1e-6), num_skipped), lvl=1)
+
+    return num_parsed
+
+
 def parse_again(fname, search_engine, scrape_method, query):
     """
     @todo: `scrape_method` is not used here -> check if scrape_method is passed to this function and remove it
@@ -474,7 +679,7 @@ def clean_cachefiles():
         for file in _get_all_cache_files():
             cfile = CompressedFile(file)
             data = cfile.read()
-            cleaned = lxml.html.tostring(cleaner.clean_html(lxml.html.fromstring(data)))
+            cleaned = lxml.html.tostring(cleaner.clean_html(lxml.html.fromstring(strip_bloat(data))))
             cfile.write(cleaned)
             logger.info('Cleaned {}. Size before: {}, after {}'.format(file, len(data), len(cleaned)))
 
@@ -489,14 +694,21 @@ def fix_broken_cache_names(url, search_engine, scrapemode, page_number):
     """
     files = _get_all_cache_files()
     logger.debug('{} cache files found in {}'.format(len(files), Config['GLOBAL'].get('cachedir', '.scrapecache')))
-    r = re.compile(r'<title>(?P<kw>.*?) - Google Search</title>')
+    # the cached files are bytes
+    r = re.compile(rb'<title>(?P<kw>.*?) - Google Search</title>')
 
     i = 0
     for path in files:
         fname = os.path.split(path)[1].strip()
         data = read_cached_file(path)
-        infilekws = r.search(data).group('kw')
-        realname = cached_file_name(infilekws, search_engine, scrapemode, page_number)
+        title = r.search(data)
+        if not title:
+            logger.debug('No search query in the title element of {}, skipping it.'.format(path))
+            continue
+        infilekws = title.group('kw').decode('utf-8', 'replace')
+        # keep the extension of the compressing algorithm
+        realname = cached_file_name(infilekws, search_engine, scrapemode, page_number) + \
+            fname[len(_strip_compression_extension(fname)):]
         if fname != realname:
             out('The search query in the title element in file {} differ from that hash of its name. Fixing...'.format(
                 path), lvl=3)
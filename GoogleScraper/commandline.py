@@ -50,6 +50,10 @@ def get_command_line(print_help=False):
     parser.add_argument('--shell', action='store_true', default=False,
                         help='Fire up a shell with a loaded sqlalchemy session.')
 
+    parser.add_argument('--shell-read-only', action='store_true', default=False,
+                        help='Open the database of the shell read-only, such that it can be queried while a scrape '
+                             'writes to it.')
+
     parser.add_argument('-n', '--num-results-per-page', type=int,
                         action='store', default=10,
                         help='The number of results per page. Must be smaller than 100, by default 50 for raw mode and '
@@ -97,6 +101,10 @@ def get_command_line(print_help=False):
     parser.add_argument('--clean', action='store_true', default=False,
                         help='Cleans all stored data. Please be very careful.')
 
+    parser.add_argument('--reparse-cache', action='store_true', default=False,
+                        help='Parse all files in the cache directory again and store the fresh results in the '
+                             'database instead of scraping. No keywords are needed. Use it after changing selectors.')
+
     parser.add_argument('-c', '--extended-config', action='store',
                         help='Pass additional configuration to GoogleScraper. The section ("GLOBAL" or "SCRAPING" for '
                              'example) is not needed. Example: "--extended-config \'search_offset: 1 | clean_cache_'
@@ -126,7 +134,7 @@ def get_command_line(print_help=False):
             ['search_engines', 'scrape_method', 'num_pages_for_keyword', 'num_results_per_page', 'search_type',
              'keyword', 'keyword_file', 'num_workers']),
         'GLOBAL': make_dict(
-            ['clean', 'debug', 'simulate', 'proxy_file', 'view_config', 'config_file', 'mysql_proxy_db', 'verbosity',
-             'output_format', 'shell', 'output_filename', 'output_format', 'version', 'extended_config']),
+            ['clean', 'reparse_cache', 'debug', 'simulate', 'proxy_file', 'view_config', 'config_file', 'mysql_proxy_db', 'verbosity',
+             'output_format', 'shell', 'shell_read_only', 'output_filename', 'output_format', 'version', 'extended_config']),
         'OUTPUT': make_dict(['output_filename']),
     }
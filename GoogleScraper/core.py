@@ -10,10 +10,11 @@ import queue
 import math
 import re
 from GoogleScraper.commandline import get_command_line
-from GoogleScraper.database import ScraperSearch, SERP, Link, get_session, fixtures, set_values_from_adwords
+from GoogleScraper.database import ScraperSearch, SERP, Link, get_session, fixtures, set_values_from_adwords, \
+    BulkSerpWriter, SessionSerpWriter, DatabaseWriter, database_path
 from GoogleScraper.proxies import parse_proxy_file, get_proxies_from_mysql_db, add_proxies_to_db
 from GoogleScraper.caching import fix_broken_cache_names, _caching_is_one_to_one, parse_all_cached_files, \
-    clean_cachefiles
+    clean_cachefiles, reparse_cached_files, SCRAPE_METHODS
 from GoogleScraper.config import InvalidConfigurationException, parse_cmd_args, Config, update_config_with_file
 from GoogleScraper.log import out, raise_or_log
 from GoogleScraper.scrape_jobs import default_scrape_jobs_for_keywords
@@ -21,6 +22,7 @@ from GoogleScraper.scraping import ScrapeWorkerFactory
 from GoogleScraper.output_converter import init_outfile
 from GoogleScraper.async_mode import AsyncScrapeScheduler
 from GoogleScraper.adwords import get_traffic
+from GoogleScraper.parsing import selector_stats
 import GoogleScraper.config
 
 logger = logging.getLogger('GoogleScraper')
@@ -198,6 +200,10 @@ def main(return_results=False, parse_cmd_line=True):
 
     init_outfile(force_reload=True)
 
+    if Config['GLOBAL'].getboolean('selector_stats', False):
+        selector_stats.reset()
+        selector_stats.enable()
+
     kwfile = Config['SCRAPING'].get('keyword_file', '')
     if kwfile:
         kwfile = os.path.abspath(kwfile)
@@ -221,7 +227,12 @@ def main(return_results=False, parse_cmd_line=True):
 
     if Config['GLOBAL'].getboolean('shell', False):
         namespace = {}
-        session_cls = get_session(scoped=False)
+        # a read-only shell can be used while a scrape runs, a missing database is created read-write
+        read_only = Config['GLOBAL'].getboolean('shell_read_only', False)
+        if read_only and not os.path.exists(database_path()):
+            logger.warning('There is no database {} yet, the shell opens it read-write.'.format(database_path()))
+            read_only = False
+        session_cls = get_session(scoped=False, read_only=read_only)
         namespace['session'] = session_cls()
         namespace['ScraperSearch'] = ScraperSearch
         namespace['SERP'] = SERP
@@ -236,7 +247,8 @@ def main(return_results=False, parse_cmd_line=True):
         start_python_console(namespace)
         return
 
-    if not (keyword or keywords) and not kwfile:
+    # the cache can be parsed again without keywords, the cache files record their search
+    if not (keyword or keywords) and not kwfile and not Config['GLOBAL'].getboolean('reparse_cache', False):
         raise_or_log(
             'No keywords to scrape for. Please provide either an keyword file (Option: --keyword-file) or specify and '
             'keyword with --keyword.')
@@ -249,7 +261,7 @@ def main(return_results=False, parse_cmd_line=True):
         logger.info('renaming done. restart for normal use.')
         return
 
-    keywords = [keyword, ] if keyword else keywords
+    keywords = [keyword, ] if keyword else (keywords or [])
     scrape_jobs = {}
     if kwfile:
         if not os.path.exists(kwfile):
@@ -284,6 +296,32 @@ def main(return_results=False, parse_cmd_line=True):
         clean_cachefiles()
         return
 
+    if Config['GLOBAL'].getboolean('reparse_cache', False):
+        # the cache files may stem from any scrape method
+        reparse_jobs = [dict(job, scrape_method=method) for job in scrape_jobs for method in SCRAPE_METHODS]
+
+        session = get_session(scoped=False)()
+        fixtures(session)
+        scraper_search = ScraperSearch(
+            keyword_file=os.path.abspath(kwfile) if kwfile else None,
+            number_search_engines_used=num_search_engines,
+            number_search_queries=len(keywords),
+            started_searching=datetime.datetime.utcnow(),
+            used_search_engines=','.join(search_engines)
+        )
+        reparse_cached_files(reparse_jobs, session, scraper_search,
+                             workers=Config['GLOBAL'].getint('reparse_workers', 0),
+                             batch_size=Config['GLOBAL'].getint('reparse_batch_size', 200))
+        scraper_search.stopped_searching = datetime.datetime.utcnow()
+        session.commit()
+
+        if selector_stats.enabled:
+            out('Selector statistics:\n' + selector_stats.report(), lvl=1)
+
+        if return_results:
+            return session
+        return
+
     if Config['GLOBAL'].getboolean('check_oto', False):
         _caching_is_one_to_one(keyword)
 
@@ -383,6 +421,23 @@ def main(return_results=False, parse_cmd_line=True):
         # A lock to prevent multiple threads from solving captcha, used in selenium instances.
         captcha_lock = threading.Lock()
 
+        # The scraped pages are written by a writer instead of the workers' session. In bulk mode
+        # with batched inserts, otherwise through a session of its own. With the writer thread, the
+        # workers only queue their pages. The writer needs the id of the scraper search to link the pages to it.
+        serp_writer = None
+        bulk_insert = Config['OUTPUT'].getboolean('bulk_insert', False)
+        writer_thread = Config['OUTPUT'].getboolean('database_writer_thread', True)
+        if bulk_insert or writer_thread:
+            session.add(scraper_search)
+            session.commit()
+            if bulk_insert:
+                serp_writer = BulkSerpWriter(session.get_bind(), scraper_search.id)
+            else:
+                serp_writer = SessionSerpWriter(session.get_bind(), scraper_search.id)
+            if writer_thread:
+                serp_writer = DatabaseWriter(serp_writer)
+                serp_writer.start()
+
         out('Going to scrape {num_keywords} keywords with {num_proxies} proxies by using {num_threads} threads.'.format(
             num_keywords=len(list(scrape_jobs)),
             num_proxies=len(proxies),
@@ -391,70 +446,79 @@ def main(return_results=False, parse_cmd_line=True):
 
         progress_thread = None
 
-        # Let the games begin
-        if method in ('selenium', 'http'):
-
-            # Show the progress of the scraping
-            q = queue.Queue()
-            progress_thread = ShowProgressQueue(q, len(scrape_jobs))
-            progress_thread.start()
-
-            workers = queue.Queue()
-            num_worker = 0
-            for search_engine in search_engines:
-
-                for worker in range(num_workers):
-                    num_worker += 1
-                    proxy_to_use = proxies[worker % len(proxies)]
-                    workers.put(
-                        ScrapeWorkerFactory(
-                            mode=method,
-                            proxy=proxy_to_use,
-                            search_engine=search_engine,
-                            session=session,
-                            db_lock=db_lock,
-                            cache_lock=cache_lock,
-                            scraper_search=scraper_search,
-                            captcha_lock=captcha_lock,
-                            progress_queue=q,
-                            browser_num=num_worker
+        try:
+            # Let the games begin
+            if method in ('selenium', 'http'):
+
+                # Show the progress of the scraping
+                q = queue.Queue()
+                progress_thread = ShowProgressQueue(q, len(scrape_jobs))
+                progress_thread.start()
+
+                workers = queue.Queue()
+                num_worker = 0
+                for search_engine in search_engines:
+
+                    for worker in range(num_workers):
+                        num_worker += 1
+                        proxy_to_use = proxies[worker % len(proxies)]
+                        workers.put(
+                            ScrapeWorkerFactory(
+                                mode=method,
+                                proxy=proxy_to_use,
+                                search_engine=search_engine,
+                                session=session,
+                                db_lock=db_lock,
+                                cache_lock=cache_lock,
+                                scraper_search=scraper_search,
+                                captcha_lock=captcha_lock,
+                                progress_queue=q,
+                                browser_num=num_worker,
+                                serp_writer=serp_writer
+                            )
                         )
-                    )
 
-            for job in scrape_jobs:
+                for job in scrape_jobs:
 
-                while True:
+                    while True:
+                        worker = workers.get()
+                        workers.put(worker)
+                        if worker.is_suitabe(job):
+                            worker.add_job(job)
+                            break
+
+                threads = []
+
+                while not workers.empty():
                     worker = workers.get()
-                    workers.put(worker)
-                    if worker.is_suitabe(job):
-                        worker.add_job(job)
-                        break
+                    thread = worker.get_worker()
+                    if thread:
+                        threads.append(thread)
 
-            threads = []
+                for t in threads:
+                    t.start()
 
-            while not workers.empty():
-                worker = workers.get()
-                thread = worker.get_worker()
-                if thread:
-                    threads.append(thread)
+                for t in threads:
+                    t.join()
 
-            for t in threads:
-                t.start()
+                # after threads are done, stop the progress queue.
+                q.put('done')
 
-            for t in threads:
-                t.join()
+            elif method == 'http-async':
+                scheduler = AsyncScrapeScheduler(scrape_jobs, session=session, scraper_search=scraper_search,
+                                                 db_lock=db_lock, serp_writer=serp_writer)
+                scheduler.run()
 
-            # after threads are done, stop the progress queue.
-            q.put('done')
+            else:
+                raise InvalidConfigurationException('No such scrape_method {}'.format(Config['SCRAPING'].get('scrape_method')))
+        finally:
+            # write the pages that are still pending in the last batch, also if the scrape failed
+            if serp_writer is not None:
+                serp_writer.close()
 
-        elif method == 'http-async':
-            scheduler = AsyncScrapeScheduler(scrape_jobs, session=session, scraper_search=scraper_search,
-                                             db_lock=db_lock)
-            scheduler.run()
+        if serp_writer is not None:
+            session.expire_all()
 
-        else:
-            raise InvalidConfigurationException('No such scrape_method {}'.format(Config['SCRAPING'].get('scrape_method')))
-            
         # Once keywords have been scraped, query AdWords API for traffic numbers
         keywords_traffic = {}
         for keyword_set in keywords_adwords:
@@ -482,5 +546,8 @@ def main(return_results=False, parse_cmd_line=True):
     session.add(scraper_search)
     session.commit()
 
+    if selector_stats.enabled:
+        out('Selector statistics:\n' + selector_stats.report(), lvl=1)
+
     if return_results:
         return session
@@ -15,20 +15,244 @@ can be assigned to more than one ScraperSearch. Therefore we need a n:m relation
 """
 
 import datetime
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import quote
 from GoogleScraper.config import Config
-from urllib.parse import urlparse
-from sqlalchemy import Column, String, Integer, Float, ForeignKey, Table, DateTime, Enum, Boolean, desc
+from GoogleScraper.enrichment import enrich_links
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, Table, DateTime, Enum, Boolean, Index, desc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref
-from sqlalchemy import create_engine, UniqueConstraint
+from sqlalchemy import create_engine, event, inspect, select, and_, bindparam, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
 
+logger = logging.getLogger('GoogleScraper')
+
+# how many keywords set_values_from_adwords() looks up per query, older sqlite builds allow 999 parameters
+ADWORDS_CHUNK_SIZE = 500
+
 Base = declarative_base()
 
+# the page features set_values_from_parser() stores, in the order they enter the fingerprint
+FINGERPRINT_FEATURES = ('num_results', 'effective_query', 'no_results', 'autocorrect', 'autocorrect_forced_check',
+                        'map_result', 'image_results', 'image_mega_block', 'answer_box', 'knowledge_graph_box')
+
+# the knowledge graph details, they are only stored when there is a knowledge graph box
+KNOWLEDGE_GRAPH_FEATURES = ('knowledge_graph_title', 'knowledge_graph_google_star_rating',
+                            'knowledge_graph_google_star_rating_big', 'knowledge_graph_google_star_rating_numbers',
+                            'knowledge_graph_google_star_rating_numbers_big', 'knowledge_graph_subtitle',
+                            'knowledge_graph_location_subtitle', 'knowledge_graph_snippet',
+                            'knowledge_graph_location_snippet', 'knowledge_graph_google_plus_recent_post',
+                            'knowledge_graph_map', 'knowledge_graph_thumbnail',
+                            'knowledge_graph_google_images_scrapbook', 'knowledge_graph_ad')
+
+
+def serp_fingerprint(parser):
+    """Get a fingerprint of the parsed results of a page.
+
+    Two pages have the same fingerprint if set_values_from_parser() stores the same
+    results and features for them. The text with the number of results is left out,
+    it contains the time the search took and differs on every request.
+
+    Args:
+        parser: A parser that parsed the page or a ParseResult of parse_many().
+
+    Returns:
+        The sha256 hex digest of the parsed results.
+    """
+    features = [getattr(parser, feature) for feature in FINGERPRINT_FEATURES]
+    if parser.knowledge_graph_box:
+        features.extend(getattr(parser, feature) for feature in KNOWLEDGE_GRAPH_FEATURES)
+
+    results = [(key, [sorted(result.items()) for result in value])
+               for key, value in sorted(parser.search_results.items()) if isinstance(value, list)]
+
+    return hashlib.sha256(repr((features, results)).encode('utf-8')).hexdigest()
+
+
+# the columns of a SERP whose values serp_values_from_parser() yields
+SERP_PARSER_COLUMNS = ('fingerprint', 'num_results_for_query', 'num_results', 'effective_query', 'no_results',
+                       'autocorrect_forced', 'autocorrect_suggested', 'map_result', 'image_results',
+                       'image_mega_block', 'answer_box', 'related_searches', 'disambiguation_results',
+                       'knowledge_graph_box')
+
+# the columns that identify the SERP of a search
+SERP_KEY_COLUMNS = ('query', 'search_engine_name', 'scrape_method', 'page_number')
+
+
+def serp_values_from_parser(parser, fingerprint=None):
+    """Get the column values that a parser yields for a SERP, its links and its knowledge graph.
+
+    Args:
+        parser: A parser that parsed the page or a ParseResult of parse_many().
+        fingerprint: The fingerprint of the parser if it is already known.
+
+    Returns:
+        A tuple of the column values of the SERP, a list with the column values of each
+        Link and the column values of the KnowledgeGraph or None if the page has none.
+    """
+    values = {
+        'fingerprint': fingerprint or serp_fingerprint(parser),
+        'num_results_for_query': parser.num_results_for_query,
+        'num_results': parser.num_results,
+        'effective_query': parser.effective_query,
+        'no_results': parser.no_results,
+        'autocorrect_forced': (parser.autocorrect if parser.autocorrect_forced_check is not None else None),
+        'autocorrect_suggested': (parser.autocorrect if parser.autocorrect_forced_check is None else None),
+        'map_result': parser.map_result,
+        'image_results': parser.image_results,
+        'image_mega_block': parser.image_mega_block,
+        'answer_box': parser.answer_box,
+        'related_searches': None,
+        'disambiguation_results': None,
+        'knowledge_graph_box': parser.knowledge_graph_box,
+    }
+
+    link_values = []
+    related_searches = []
+    disambiguation_results = []
+    knowledge_graph_trivia = []
+    knowledge_graph_social_profiles = []
+    knowledge_graph_google_reviews = []
+    knowledge_graph_features = []
+    knowledge_graph_people_also_search_for = []
+    knowledge_graph_slideshows = []
+
+    # the fields the parser was restricted to, None if all fields were parsed
+    fields = getattr(parser, 'fields', None)
+
+    for key, value in parser.search_results.items():
+        if isinstance(value, list):
+            links = []
+
+            for link in value:
+                if key == 'related_searches' and link.get('keyword') is not None:
+                    related_searches.append(link.get('keyword'))
+
+                elif (key == 'knowledge_graph_trivia'):
+                    if link.get('hours_title') is not None:
+                        if (link.get('hours_morning') is None and link.get('hours_afternoon') is None):
+                            if (link.get('hours_status') is not None):
+                                knowledge_graph_trivia.append(link.get('hours_title') + ' ' + link.get('hours_status'))
+                            else:
+                                knowledge_graph_trivia.append(link.get('hours_title') + ' ' + link.get('hours_status_grayscale'))
+                        elif link.get('hours_morning') == link.get('hours_afternoon'):
+                            knowledge_graph_trivia.append(link.get('hours_title') + ' ' + link.get('hours_status') + ' ' + link.get('hours_afternoon'))
+                        else:
+                            knowledge_graph_trivia.append(link.get('hours_title') + ' ' + link.get('hours_status') + ' ' + link.get('hours_morning') + ' ' + link.get('hours_afternoon'))
+                    else:
+                        temp_link = (link.get('title') if link.get('title') is not None else link.get('link_title'))
+                        temp_fact = (link.get('fact') if link.get('fact') is not None else link.get('link_fact'))
+                        knowledge_graph_trivia.append(temp_link + ' ' + temp_fact)
+
+                elif (key == 'knowledge_graph_social_profiles'):
+                    knowledge_graph_social_profiles.append(link.get('profile'))
+
+                elif (key == 'knowledge_graph_google_plus_reviews'):
+                    knowledge_graph_google_reviews.append(link.get('review'))
+
+                elif (key == 'knowledge_graph_features'):
+                    knowledge_graph_features.append(link.get('institution') + ': ' + link.get('feature'))
+
+                elif (key == 'knowledge_graph_people_also_search_for'):
+                    knowledge_graph_people_also_search_for.append(link.get('keyword'))
+
+                elif (key == 'knowledge_graph_slideshows'):
+                    if link.get('slideshow') is not None:
+                        knowledge_graph_slideshows.append(link.get('slideshow'))
+
+                elif (key == 'disambiguation_box'):
+                    if (link.get('snippet') is not None):
+                        disambiguation_results.append(link.get('keyword') + ' - ' + link.get('snippet'))
+                    elif (link.get('snippet[0][0]') is not None and link.get('snippet[0][1]') is not None and link.get('snippet[1][0]') is not None and link.get('snippet[1][1]') is not None and link.get('snippet[0][1]') != link.get('snippet[1][1]')):
+                        disambiguation_results.append(link.get('keyword') + ' - ' + link.get('snippet[0][0]') + link.get('snippet[0][1]') + ' ' + link.get('snippet[1][0]') + link.get('snippet[1][1]'))
+                    elif (link.get('snippet[0][0]') is not None and link.get('snippet[0][1]') is not None):
+                        disambiguation_results.append(link.get('keyword') + ' - ' + link.get('snippet[0][0]') + link.get('snippet[0][1]'))
+                    else:
+                        disambiguation_results.append(link.get('keyword'))
+
+                else:
+                    links.append(link)
+
+            requested = fields.get(key) if fields else None
+            link_values.extend(enrich_links(key, links, requested))
+
+    # Joining together the related searches for database entry
+    if len(related_searches) > 1:
+        values['related_searches'] = '; '.join(related_searches)
+    elif len(related_searches) == 1:
+        values['related_searches'] = related_searches[0]
+
+    # Joining together the disambiguation results for database entry
+    if (len(disambiguation_results) > 1):
+        values['disambiguation_results'] = '; '.join(disambiguation_results)
+    elif (len(disambiguation_results) == 1):
+        values['disambiguation_results'] = disambiguation_results[0]
+
+
+    knowledge_graph_trivia = ('; '.join(knowledge_graph_trivia) if len(knowledge_graph_trivia) > 0 else None)
+    knowledge_graph_social_profiles = ('; '.join(knowledge_graph_social_profiles) if len(knowledge_graph_social_profiles) > 0 else None)
+    knowledge_graph_google_reviews = ('; '.join(knowledge_graph_google_reviews) if len(knowledge_graph_google_reviews) > 0 else None)
+    knowledge_graph_features = ('; '.join(knowledge_graph_features) if len(knowledge_graph_features) > 0 else None)
+    knowledge_graph_people_also_search_for = ('; '.join(knowledge_graph_people_also_search_for) if len(knowledge_graph_people_also_search_for) > 0 else None)
+    knowledge_graph_slideshows = ('; '.join(knowledge_graph_slideshows) if len(knowledge_graph_slideshows) > 0 else None)
+
+    knowledge_graph = None
+    if parser.knowledge_graph_box:
+        knowledge_graph = dict(
+            title=parser.knowledge_graph_title,
+            google_star_rating=(parser.knowledge_graph_google_star_rating if parser.knowledge_graph_google_star_rating is not None else parser.knowledge_graph_google_star_rating_big),
+            google_star_rating_number_of_reviews=(parser.knowledge_graph_google_star_rating_numbers if parser.knowledge_graph_google_star_rating_numbers is not None else parser.knowledge_graph_google_star_rating_numbers_big),
+            google_reviews=knowledge_graph_google_reviews,
+            subtitle=(parser.knowledge_graph_subtitle if parser.knowledge_graph_subtitle is not None else parser.knowledge_graph_location_subtitle),
+            snippet=(parser.knowledge_graph_snippet if parser.knowledge_graph_snippet is not None else parser.knowledge_graph_location_snippet),
+            trivia=knowledge_graph_trivia,
+            social_profiles=knowledge_graph_social_profiles,
+            google_plus_recent_post=parser.knowledge_graph_google_plus_recent_post,
+            knowledge_graph_features=knowledge_graph_features,
+            people_also_search_for=knowledge_graph_people_also_search_for,
+            google_map=parser.knowledge_graph_map,
+            thumbnail=parser.knowledge_graph_thumbnail,
+            slideshows=knowledge_graph_slideshows,
+            google_images_scrapbook=parser.knowledge_graph_google_images_scrapbook,
+            ad=parser.knowledge_graph_ad,
+        )
+
+    return values, link_values, knowledge_graph
+
+
+def serp_values_from_scraper(scraper):
+    """Get the column values that a scraper yields for a SERP.
+
+    Args:
+        scraper: The scraper that requested the page.
+
+    Returns:
+        A dict with the column values.
+    """
+    return {
+        'query': scraper.query,
+        'search_engine_name': scraper.search_engine_name,
+        'scrape_method': scraper.scrape_method,
+        'page_number': scraper.page_number,
+        'requested_at': scraper.requested_at,
+        'requested_by': scraper.requested_by,
+        'status': scraper.status,
+        'autocomplete_results': (scraper.autocomplete if scraper.autocomplete is not None else None),
+    }
+
+
 scraper_searches_serps = Table('scraper_searches_serps', Base.metadata,
-                               Column('scraper_search_id', Integer, ForeignKey('scraper_search.id')),
-                               Column('serp_id', Integer, ForeignKey('serp.id')))
+                               Column('scraper_search_id', Integer, ForeignKey('scraper_search.id'), index=True),
+                               Column('serp_id', Integer, ForeignKey('serp.id'), index=True))
 
 
 class ScraperSearch(Base):
@@ -59,6 +283,12 @@ class ScraperSearch(Base):
 
 class SearchEngineResultsPage(Base):
     __tablename__ = 'serp'
+    __table_args__ = (
+        # the latest serp of a query, see set_values_from_adwords(). Sqlite appends the id to every index.
+        Index('ix_serp_query', 'query'),
+        # the serp of a query, page and search engine, see get_serp_from_database() and find_unchanged()
+        Index('ix_serp_lookup', 'query', 'search_engine_name', 'scrape_method', 'page_number'),
+    )
 
     id = Column(Integer, primary_key=True)
     status = Column(String, default='successful')
@@ -127,6 +357,9 @@ class SearchEngineResultsPage(Base):
     # Monthly Search Volumes
     monthly_search_volumes = Column(String)
 
+    # The fingerprint of the parsed results, see serp_fingerprint()
+    fingerprint = Column(String)
+
     def __str__(self):
         return '<SERP[{search_engine_name}] has [{num_results}] link results for query "{query}">'.format(
             **self.__dict__)
@@ -137,238 +370,21 @@ class SearchEngineResultsPage(Base):
     def has_no_results_for_query(self):
         return self.num_results == 0 or self.effective_query
 
-    def set_values_from_parser(self, parser):
+    def set_values_from_parser(self, parser, fingerprint=None):
         """Populate itself from a parser object.
 
         Args:
-            A parser object.
+            parser: A parser object.
+            fingerprint: The fingerprint of the parser if it is already known.
         """
+        values, links, knowledge_graph = serp_values_from_parser(parser, fingerprint)
 
-        self.num_results_for_query = parser.num_results_for_query
-        self.num_results = parser.num_results
-        self.effective_query = parser.effective_query
-        self.no_results = parser.no_results
-        self.autocorrect_forced = (parser.autocorrect if parser.autocorrect_forced_check is not None else None)
-        self.autocorrect_suggested = (parser.autocorrect if parser.autocorrect_forced_check is None else None)
-        self.map_result  = parser.map_result
-        self.image_results = parser.image_results
-        self.image_mega_block = parser.image_mega_block
-        self.answer_box = parser.answer_box
-        self.related_seaches = None
-        self.disambiguation_results = None
-        self.knowledge_graph_box = parser.knowledge_graph_box
-
-        related_searches = []
-        disambiguation_results = []
-        knowledge_graph_trivia = []
-        knowledge_graph_social_profiles = []
-        knowledge_graph_google_reviews = []
-        knowledge_graph_features = []
-        knowledge_graph_people_also_search_for = []
-        knowledge_graph_slideshows = []
-
-        for key, value in parser.search_results.items():
-            if isinstance(value, list):
-                for link in value:
-                    parsed = urlparse(link['link'])
-
-                    # fill with nones to prevent key errors
-                    [link.update({key: None}) for key in ('snippet', 'title', 'visible_link', 'price', 'google_star_rating', 'google_star_rating_reviews', 'address', 'phone_number', 'search_bar', 'schema_enhanced_listing', 'image_thumbnail', 'video_thumbnail', 'small_sitelink_1', 'small_sitelink_2', 'small_sitelink_3', 'small_sitelink_4', 'small_sitelink_5', 'small_sitelink_6', 'big_sitelink_1', 'big_sitelink_2', 'big_sitelink_3', 'big_sitelink_4', 'big_sitelink_5', 'big_sitelink_6', 'keyword', 'slideshow') if key not in link]
-
-                    if key == 'related_searches' and link['keyword'] is not None:
-                        related_searches.append(link['keyword'])
-
-                    elif (key == 'knowledge_graph_trivia'):
-                        if link['hours_title'] is not None:
-                            if (link['hours_morning'] is None and link['hours_afternoon'] is None):
-                                if (link['hours_status'] is not None):
-                                    knowledge_graph_trivia.append(link['hours_title'] + ' ' + link['hours_status'])
-                                else:
-                                    knowledge_graph_trivia.append(link['hours_title'] + ' ' + link['hours_status_grayscale'])
-                            elif link['hours_morning'] == link['hours_afternoon']:
-                                knowledge_graph_trivia.append(link['hours_title'] + ' ' + link['hours_status'] + ' ' + link['hours_afternoon'])
-                            else:
-                                knowledge_graph_trivia.append(link['hours_title'] + ' ' + link['hours_status'] + ' ' + link['hours_morning'] + ' ' + link['hours_afternoon'])
-                        else:
-                            temp_link = (link['title'] if link['title'] is not None else link['link_title'])
-                            temp_fact = (link['fact'] if link['fact'] is not None else link['link_fact'])
-                            knowledge_graph_trivia.append(temp_link + ' ' + temp_fact)
-
-                    elif (key == 'knowledge_graph_social_profiles'):
-                        knowledge_graph_social_profiles.append(link['profile'])
-
-                    elif (key == 'knowledge_graph_google_plus_reviews'):
-                        knowledge_graph_google_reviews.append(link['review'])
-
-                    elif (key == 'knowledge_graph_features'):
-                        knowledge_graph_features.append(link['institution'] + ': ' + link['feature'])
-
-                    elif (key == 'knowledge_graph_people_also_search_for'):
-                        knowledge_graph_people_also_search_for.append(link['keyword'])
-
-                    elif (key == 'knowledge_graph_slideshows'):
-                        if link['slideshow'] is not None:
-                            knowledge_graph_slideshows.append(link['slideshow'])
-
-                    elif (key == 'disambiguation_box'):
-                        if (link['snippet'] is not None):
-                            disambiguation_results.append(link['keyword'] + ' - ' + link['snippet'])
-                        elif (link['snippet[0][0]'] is not None and link['snippet[0][1]'] is not None and link['snippet[1][0]'] is not None and link['snippet[1][1]'] is not None and link['snippet[0][1]'] != link['snippet[1][1]']):
-                            disambiguation_results.append(link['keyword'] + ' - ' + link['snippet[0][0]'] + link['snippet[0][1]'] + ' ' + link['snippet[1][0]'] + link['snippet[1][1]'])
-                        elif (link['snippet[0][0]'] is not None and link['snippet[0][1]'] is not None):
-                            disambiguation_results.append(link['keyword'] + ' - ' + link['snippet[0][0]'] + link['snippet[0][1]'])
-                        else:
-                            disambiguation_results.append(link['keyword'])
-
-                    else:
-                        # Google Star Ratings Check
-                        google_star_rating = None
-                        if key == 'organic_results' and link['google_star_rating'] is not None:
-                            google_star_rating = link['google_star_rating'] + ' - ' + link['google_star_rating_reviews']
-                        elif key == 'paid_results' and link['google_star_rating'] is not None:
-                            google_star_rating = link['google_star_rating']
-                        elif key == 'local_pack_results' and link['google_star_rating'] is not None:
-                            google_star_rating = link['google_star_rating'] + ' - ' + link['google_star_rating_reviews']
-                        elif key == 'list_carousel' and link['google_star_rating'] is not None:
-                            google_star_rating = link['google_star_rating'] + ' - ' + link['google_star_rating_reviews']
-
-                        # Adding phone number to address in paid results
-                        address = link['address']
-                        if key == 'paid_results' and link['address'] is not None and link['phone_number'] is not None:
-                            address = address + ' ' + link['phone_number']
-
-                        # Search Bar Check
-                        search_bar = None
-                        if link['search_bar'] is not None:
-                            search_bar = True
-                        elif key == 'organic_results':
-                            search_bar = False
-
-                        # Schema Enhanced Listing Check
-                        schema_enhanced_listing = (None if not link['schema_enhanced_listing'] else link['schema_enhanced_listing'])
-
-                        # Image Thumbnail Check
-                        image_thumbnail = None
-                        if link['image_thumbnail'] is not None:
-                            image_thumbnail = True
-                        elif key == 'organic_results' or key == 'news_results' or key == 'in_depth_articles' or key == 'shopping_results (left)' or key == 'shopping_results (right)' or key == 'local_carousel' or key == 'list_carousel':
-                            image_thumbnail = False
-
-                        # Video Thumbnail Check
-                        video_thumbnail = None
-                        if link['video_thumbnail'] is not None:
-                            video_thumbnail = True
-                        elif key == 'organic_results':
-                            video_thumbnail = False
-
-                        # Small Sitelinks Check
-                        small_sitelinks = []
-                        for i in range(1, 7):
-                            if (link['small_sitelink_' + str(i)] is not None):
-                                small_sitelinks.append(link['small_sitelink_' + str(i)])
-                        small_sitelinks = ('; '.join(small_sitelinks) if small_sitelinks else None)
-
-                        # Big Sitelinks Check
-                        big_sitelinks = []
-                        for i in range(1, 7):
-                            if (link['big_sitelink_' + str(i)] is not None):
-                                big_sitelinks.append(link['big_sitelink_' + str(i)] + ' - ' + link['big_sitelink_' + str(i) + '_description'])
-                        big_sitelinks = ('; '.join(big_sitelinks) if big_sitelinks else None)
-
-                        # Social Site Check
-                        social_sites = [
-                            'www.facebook.com',
-                            'twitter.com',
-                            'www.linkedin.com',
-                            'www.pinterest.com',
-                            'plus.google.com',
-                            'www.tumblr.com',
-                            'instagram.com',
-                            'vk.com',
-                            'www.flickr.com',
-                            'vine.co',
-                            'www.meetup.com',
-                            'www.tagged.com',
-                            'ask.fm',
-                            'www.meetme.com',
-                            'www.classmates.com'
-                        ]
-                        social_site = False
-                        if parsed.netloc in social_sites:
-                            social_site = True
-
-                        # HTTPS Check
-                        https = False
-                        if link['link'].startswith('https'):
-                            https = True
-
-                        # M-dot Check
-                        m_dot = False
-                        if link['link'].find('//m.') != -1:
-                            m_dot = True
-
-                        l = Link(
-                            link=link['link'],
-                            snippet=link['snippet'],
-                            title=link['title'],
-                            visible_link=link['visible_link'],
-                            domain=parsed.netloc,
-                            rank=link['rank'],
-                            serp=self,
-                            link_type=key,
-                            google_star_rating=google_star_rating,
-                            address=address,
-                            search_bar=search_bar,
-                            schema_enhanced_listing=schema_enhanced_listing,
-                            image_thumbnail=image_thumbnail,
-                            video_thumbnail=video_thumbnail,
-                            small_sitelinks=small_sitelinks,
-                            big_sitelinks=big_sitelinks,
-                            price=link['price'],
-                            social_site=social_site,
-                            https=https,
-                            m_dot=m_dot
-                        )
-
-        # Joining together the related searches for database entry
-        if len(related_searches) > 1:
-            self.related_searches = '; '.join(related_searches)
-        elif len(related_searches) == 1:
-            self.related_searches = related_searches[0]
-
-        # Joining together the disambiguation results for database entry
-        if (len(disambiguation_results) > 1):
-            self.disambiguation_results = '; '.join(disambiguation_results)
-        elif (len(disambiguation_results) == 1):
-            self.disambiguation_results = disambiguation_results[0]
-
-
-        knowledge_graph_trivia = ('; '.join(knowledge_graph_trivia) if len(knowledge_graph_trivia) > 0 else None)
-        knowledge_graph_social_profiles = ('; '.join(knowledge_graph_social_profiles) if len(knowledge_graph_social_profiles) > 0 else None)
-        knowledge_graph_google_reviews = ('; '.join(knowledge_graph_google_reviews) if len(knowledge_graph_google_reviews) > 0 else None)
-        knowledge_graph_features = ('; '.join(knowledge_graph_features) if len(knowledge_graph_features) > 0 else None)
-        knowledge_graph_people_also_search_for = ('; '.join(knowledge_graph_people_also_search_for) if len(knowledge_graph_people_also_search_for) > 0 else None)
-        knowledge_graph_slideshows = ('; '.join(knowledge_graph_slideshows) if len(knowledge_graph_slideshows) > 0 else None)
-        if (self.knowledge_graph_box):
-            k = KnowledgeGraph(
-                title=parser.knowledge_graph_title,
-                google_star_rating=(parser.knowledge_graph_google_star_rating if parser.knowledge_graph_google_star_rating is not None else parser.knowledge_graph_google_star_rating_big),
-                google_star_rating_number_of_reviews=(parser.knowledge_graph_google_star_rating_numbers if parser.knowledge_graph_google_star_rating_numbers is not None else parser.knowledge_graph_google_star_rating_numbers_big),
-                google_reviews=knowledge_graph_google_reviews,
-                subtitle=(parser.knowledge_graph_subtitle if parser.knowledge_graph_subtitle is not None else parser.knowledge_graph_location_subtitle),
-                snippet=(parser.knowledge_graph_snippet if parser.knowledge_graph_snippet is not None else parser.knowledge_graph_location_snippet),
-                trivia=knowledge_graph_trivia,
-                social_profiles=knowledge_graph_social_profiles,
-                google_plus_recent_post=parser.knowledge_graph_google_plus_recent_post,
-                knowledge_graph_features=knowledge_graph_features,
-                people_also_search_for=knowledge_graph_people_also_search_for,
-                google_map=parser.knowledge_graph_map,
-                thumbnail=parser.knowledge_graph_thumbnail,
-                slideshows=knowledge_graph_slideshows,
-                google_images_scrapbook=parser.knowledge_graph_google_images_scrapbook,
-                ad=parser.knowledge_graph_ad,
-                serp=self
-            )
+        for column, value in values.items():
+            setattr(self, column, value)
+        for link in links:
+            Link(serp=self, **link)
+        if knowledge_graph is not None:
+            KnowledgeGraph(serp=self, **knowledge_graph)
 
     def set_values_from_scraper(self, scraper):
         """Populate itself from a scraper object.
@@ -382,19 +398,40 @@ class SearchEngineResultsPage(Base):
         Args:
             A scraper object.
         """
-
-        self.query = scraper.query
-        self.search_engine_name = scraper.search_engine_name
-        self.scrape_method = scraper.scrape_method
-        self.page_number = scraper.page_number
-        self.requested_at = scraper.requested_at
-        self.requested_by = scraper.requested_by
-        self.status = scraper.status
-        self.autocomplete_results = (scraper.autocomplete if scraper.autocomplete is not None else None)
+        for column, value in serp_values_from_scraper(scraper).items():
+            setattr(self, column, value)
 
     def was_correctly_requested(self):
         return self.status == 'successful'
 
+    def find_unchanged(self, session, fingerprint):
+        """Find a stored SERP with the same results as this page.
+
+        Only the latest SERP of the same query, search engine, scrape method and page
+        number is compared. A page whose results changed and changed back is stored again,
+        so the history of a query stays in order.
+
+        Args:
+            session: The sqlalchemy session to query.
+            fingerprint: The fingerprint of the parsed results of this page.
+
+        Returns:
+            The latest SERP if its results are unchanged, None otherwise.
+        """
+        if not self.was_correctly_requested():
+            return None
+
+        previous = session.query(SearchEngineResultsPage).filter(
+            SearchEngineResultsPage.query == self.query,
+            SearchEngineResultsPage.search_engine_name == self.search_engine_name,
+            SearchEngineResultsPage.scrape_method == self.scrape_method,
+            SearchEngineResultsPage.page_number == self.page_number).order_by(
+            desc(SearchEngineResultsPage.id)).first()
+
+        if previous is not None and previous.fingerprint == fingerprint:
+            return previous
+        return None
+
 
 # Alias as a shorthand for working in the shell
 SERP = SearchEngineResultsPage
@@ -402,6 +439,10 @@ SERP = SearchEngineResultsPage
 
 class Link(Base):
     __tablename__ = 'link'
+    __table_args__ = (
+        Index('ix_link_serp_id', 'serp_id'),
+        Index('ix_link_domain', 'domain'),
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String)
@@ -435,6 +476,9 @@ class Link(Base):
 
 class KnowledgeGraph(Base):
     __tablename__= 'knowledge_graph'
+    __table_args__ = (
+        Index('ix_knowledge_graph_serp_id', 'serp_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String)
@@ -458,6 +502,10 @@ class KnowledgeGraph(Base):
 
 class Proxy(Base):
     __tablename__ = 'proxy'
+    __table_args__ = (
+        # also serves the lookups of a proxy by its ip
+        Index('unique_proxy', 'ip', 'port', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     ip = Column(String)
@@ -479,7 +527,6 @@ class Proxy(Base):
     org = Column(String)
     postal = Column(String)
 
-    UniqueConstraint(ip, port, name='unique_proxy')
 
     def __str__(self):
         return '<Proxy {ip}>'.format(**self.__dict__)
@@ -516,26 +563,121 @@ class SearchEngineProxyStatus(Base):
     last_check = Column(DateTime)
 
 
-def get_engine(path=None):
+# the pragmas of the sqlite profile, by the option of the OUTPUT section that sets them
+SQLITE_PRAGMAS = (
+    ('sqlite_journal_mode', 'journal_mode'),
+    ('sqlite_synchronous', 'synchronous'),
+    ('sqlite_cache_size', 'cache_size'),
+    ('sqlite_mmap_size', 'mmap_size'),
+    ('sqlite_temp_store', 'temp_store'),
+    ('sqlite_busy_timeout', 'busy_timeout'),
+)
+
+
+def sqlite_pragmas(read_only=False):
+    """Get the pragmas of the sqlite profile that is configured in the OUTPUT section.
+
+    Args:
+        read_only: Whether the pragmas are for a read-only connection. The journal mode is
+            a property of the database file and can't be set by them.
+
+    Returns:
+        A list of (pragma, value) tuples, the pragmas without a value keep the default of sqlite.
+    """
+    pragmas = []
+
+    for option, pragma in SQLITE_PRAGMAS:
+        value = Config['OUTPUT'].get(option, '').strip()
+        if value and not (read_only and pragma == 'journal_mode'):
+            pragmas.append((pragma, value))
+
+    return pragmas
+
+
+def database_path(path=None):
+    """The path of the database, by default the database_name of the config."""
+    return path if path else Config['OUTPUT'].get('database_name', 'google_scraper') + '.db'
+
+
+def get_engine(path=None, read_only=False):
     """Return the sqlalchemy engine.
 
+    Every connection of the engine is set up with the sqlite profile of the config,
+    see sqlite_pragmas(). The connections are pooled, so they keep their page cache
+    between the transactions.
+
     Args:
         path: The path/name of the database to create/read from.
+        read_only: Whether to open the database read-only. A read-only engine doesn't create
+            the tables and can query the database while a scrape writes to it, if the
+            journal mode is WAL.
 
     Returns:
         The sqlalchemy engine.
     """
-    db_path = path if path else Config['OUTPUT'].get('database_name', 'google_scraper') + '.db'
+    db_path = database_path(path)
     echo = True if (Config['GLOBAL'].getint('verbosity', 0) >= 4) else False
-    engine = create_engine('sqlite:///' + db_path, echo=echo, connect_args={'check_same_thread': False})
-    Base.metadata.create_all(engine)
+
+    if read_only:
+        url = 'sqlite:///file:{}?mode=ro&uri=true'.format(quote(os.path.abspath(db_path)))
+    else:
+        url = 'sqlite:///' + db_path
+    engine = create_engine(url, echo=echo, poolclass=QueuePool, connect_args={'check_same_thread': False})
+
+    pragmas = sqlite_pragmas(read_only=read_only)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute('PRAGMA {}={}'.format(pragma, value))
+        cursor.close()
+
+    if not read_only:
+        Base.metadata.create_all(engine)
+        migrate_schema(engine)
 
     return engine
 
 
-def get_session(scoped=False, engine=None, path=None):
+def migrate_schema(engine):
+    """Add the columns and indexes that are missing in a database of an older version.
+
+    create_all() only creates the tables that don't exist yet. The columns that
+    were added to existing tables since are added here, their values are NULL
+    for the rows that are already stored. The missing indexes are built, which
+    takes a while on a big database, but only once.
+
+    Args:
+        engine: The sqlalchemy engine of the database.
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                engine.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table.name, column.name, column.type.compile(dialect=engine.dialect)))
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(engine)
+            except IntegrityError:
+                logger.warning('Couldn\'t create the unique index {} on {}, the table has duplicates.'.format(
+                    index.name, table.name))
+
+
+def get_session(scoped=False, engine=None, path=None, read_only=False):
     if not engine:
-        engine = get_engine(path=path)
+        engine = get_engine(path=path, read_only=read_only)
 
     session_factory = sessionmaker(
         bind=engine,
@@ -561,11 +703,467 @@ def fixtures(session):
     session.commit()
 
 def set_values_from_adwords(session, traffic):
-    """Populate database with AdWords traffic results"""
-    for keyword in traffic:
-        serp_page = session.query(SearchEngineResultsPage).filter(SearchEngineResultsPage.query == keyword).order_by(desc(SearchEngineResultsPage.id)).first()
-        serp_page.average_monthly_search_volume = traffic.get(keyword).get('average_monthly_search_volume')
-        serp_page.average_cpc = traffic.get(keyword).get('average_cpc')
-        serp_page.competition = traffic.get(keyword).get('competition')
-        serp_page.monthly_search_volumes = ('; '.join(traffic.get(keyword).get('monthly_search_volumes')) if traffic.get(keyword).get('monthly_search_volumes') != [] else None)
+    """Populate database with AdWords traffic results
+
+    The metrics of a keyword are stored on its latest SERP. The latest SERPs of all
+    keywords are looked up with a grouped query per chunk of keywords and updated
+    with a single executemany.
+
+    Args:
+        session: The sqlalchemy session to write with.
+        traffic: A dict with the AdWords metrics by keyword, see adwords.get_traffic().
+            Keywords without a SERP are skipped.
+    """
+    table = SearchEngineResultsPage.__table__
+    keywords = list(traffic)
+    values = []
+
+    for i in range(0, len(keywords), ADWORDS_CHUNK_SIZE):
+        latest_serps = session.execute(
+            select([table.c.query, func.max(table.c.id)]).where(
+                table.c.query.in_(keywords[i:i + ADWORDS_CHUNK_SIZE])).group_by(table.c.query))
+
+        for keyword, serp_id in latest_serps:
+            metrics = traffic[keyword]
+            values.append({
+                'serp_id': serp_id,
+                'volume': metrics.get('average_monthly_search_volume'),
+                'cpc': metrics.get('average_cpc'),
+                'competition_': metrics.get('competition'),
+                'monthly_volumes': ('; '.join(metrics.get('monthly_search_volumes'))
+                                    if metrics.get('monthly_search_volumes') else None),
+            })
+
+    if values:
+        # the names of the parameters must differ from the columns
+        session.execute(table.update().where(table.c.id == bindparam('serp_id')).values(
+            average_monthly_search_volume=bindparam('volume'),
+            average_cpc=bindparam('cpc'),
+            competition=bindparam('competition_'),
+            monthly_search_volumes=bindparam('monthly_volumes'),
+        ), values)
+
     session.commit()
+
+
+# The rows of a serp page as a BulkSerpWriter writes them: the column values of the
+# SERP, a list with the column values of each Link and those of the KnowledgeGraph or None.
+SerpRows = namedtuple('SerpRows', ['serp', 'links', 'knowledge_graph'])
+
+
+def column_values(table, values):
+    """Complete the column values of a row with the defaults of the columns, like the ORM on insert.
+
+    Args:
+        table: The table of the row.
+        values: The known column values.
+
+    Returns:
+        A dict with a value for every column except the primary key.
+    """
+    row = {}
+
+    for column in table.columns:
+        if column.primary_key:
+            continue
+        value = values.get(column.name)
+        if value is None and column.default is not None:
+            value = column.default.arg(None) if column.default.is_callable else column.default.arg
+        row[column.name] = value
+
+    return row
+
+
+def serp_rows(parser=None, scraper=None, query=''):
+    """Get the rows of a serp page without building ORM objects.
+
+    The counterpart of parse_serp() for a BulkSerpWriter.
+
+    Args:
+        parser: A parser that parsed the page or None if the request failed.
+        scraper: The scraper that requested the page.
+        query: The query the page was requested with.
+
+    Returns:
+        The SerpRows of the page.
+    """
+    values = {'query': query} if query else {}
+    links, knowledge_graph = [], None
+
+    if scraper:
+        values.update(serp_values_from_scraper(scraper))
+    if parser:
+        parser_values, links, knowledge_graph = serp_values_from_parser(parser)
+        values.update(parser_values)
+
+    return SerpRows(
+        column_values(SearchEngineResultsPage.__table__, values),
+        [column_values(Link.__table__, link) for link in links],
+        column_values(KnowledgeGraph.__table__, knowledge_graph) if knowledge_graph is not None else None
+    )
+
+
+class DatabaseWriterException(Exception):
+    """Raised when a writer closes after batches of pages failed to be written."""
+
+
+class BulkSerpWriter():
+    """Writes serp pages with bulk inserts instead of the ORM.
+
+    The pages of a ScraperSearch are collected and written in batches. A batch is
+    written in a single transaction: The SERPs one after the other to learn their ids,
+    then the links, the knowledge graphs and the rows that assign the SERPs to the
+    ScraperSearch with one executemany insert each. Only the column values of the
+    pages are kept, no ORM objects are built.
+
+    A batch is written as soon as batch_size pages are collected or flush_interval
+    seconds after its first page was added, by a timer thread if no further page
+    arrives. Call close() after the last page.
+
+    In replace mode a page whose SERP is already stored (same query, search engine,
+    scrape method and page number) updates that SERP: its parsed values are overwritten
+    and its links and knowledge graph are replaced. This is how cache files are parsed again.
+    """
+
+    def __init__(self, engine, scraper_search_id, batch_size=None, flush_interval=None, replace=False):
+        """Create a writer for the pages of a ScraperSearch.
+
+        Args:
+            engine: The sqlalchemy engine of the database.
+            scraper_search_id: The id of the ScraperSearch the pages are assigned to.
+            batch_size: The number of pages per batch. By default the bulk_insert_batch_size of the config.
+            flush_interval: The maximal number of seconds a page waits to be written.
+                By default the bulk_insert_flush_interval of the config.
+            replace: Whether to update the stored SERPs of the pages instead of storing them again.
+        """
+        self.engine = engine
+        self.scraper_search_id = scraper_search_id
+        self.replace = replace
+        self.batch_size = batch_size or Config['OUTPUT'].getint('bulk_insert_batch_size', 100)
+        self.flush_interval = Config['OUTPUT'].getfloat('bulk_insert_flush_interval', 10.0) \
+            if flush_interval is None else flush_interval
+        self.skip_unchanged = Config['GLOBAL'].getboolean('skip_unchanged_serps', False)
+
+        self.pending = []
+        self.num_written = 0
+        self.lock = threading.Lock()
+        # writes the pending pages once the first of them waited flush_interval seconds
+        self.timer = None
+        # the error of a batch the timer failed to write, raised by close()
+        self.error = None
+
+    def add(self, rows):
+        """Add the SerpRows of a page, they are written with the next batch."""
+        with self.lock:
+            self.pending.append(rows)
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Write the pages that are collected so far."""
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        """Write the pending pages, the writer isn't used afterwards.
+
+        Raises:
+            DatabaseWriterException if a batch the timer wrote failed.
+        """
+        self.flush()
+
+        if self.error is not None:
+            raise DatabaseWriterException('A batch of serp pages couldn\'t be written to the database: {}'.format(
+                self.error)) from self.error
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception as e:
+            self.error = e
+            logger.error('Couldn\'t write a batch of serp pages to the database: {}'.format(e))
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        pending, self.pending = self.pending, []
+
+        if not pending:
+            return
+
+        links, knowledge_graphs, assignments, updates = [], [], [], []
+
+        with self.engine.begin() as connection:
+            stored = self.stored_serp_ids(connection, pending) if self.replace else {}
+
+            for rows in pending:
+                serp_id = stored.get(tuple(rows.serp[column] for column in SERP_KEY_COLUMNS))
+                if serp_id is not None:
+                    # the names of the parameters must differ from the columns
+                    updates.append(dict({column + '_': rows.serp[column] for column in SERP_PARSER_COLUMNS},
+                                        serp_id_=serp_id))
+                elif self.skip_unchanged and not self.replace:
+                    serp_id = self.unchanged_serp_id(connection, rows)
+                    if serp_id is not None:
+                        rows.serp['id'] = serp_id
+                        assignments.append({'scraper_search_id': self.scraper_search_id, 'serp_id': serp_id})
+                        continue
+
+                if serp_id is None:
+                    serp_id = connection.execute(SearchEngineResultsPage.__table__.insert(),
+                                                 rows.serp).inserted_primary_key[0]
+
+                for link in rows.links:
+                    link['serp_id'] = serp_id
+                links.extend(rows.links)
+                if rows.knowledge_graph is not None:
+                    rows.knowledge_graph['serp_id'] = serp_id
+                    knowledge_graphs.append(rows.knowledge_graph)
+
+                rows.serp['id'] = serp_id
+                assignments.append({'scraper_search_id': self.scraper_search_id, 'serp_id': serp_id})
+
+            if updates:
+                self.update_serps(connection, updates)
+            if links:
+                connection.execute(Link.__table__.insert(), links)
+            if knowledge_graphs:
+                connection.execute(KnowledgeGraph.__table__.insert(), knowledge_graphs)
+            if self.replace:
+                assignments = self.new_assignments(connection, assignments)
+            if assignments:
+                connection.execute(scraper_searches_serps.insert(), assignments)
+
+        self.num_written += len(pending)
+
+        # the output converter imports this module
+        from GoogleScraper.output_converter import store_serp_result
+        for rows in pending:
+            store_serp_result(rows.serp, links=rows.links)
+
+    def stored_serp_ids(self, connection, pending):
+        """Look up the ids of the stored SERPs of the pages with one query.
+
+        Returns:
+            A dict with the id of the latest stored SERP by the SERP_KEY_COLUMNS values of a page.
+        """
+        table = SearchEngineResultsPage.__table__
+        queries = {rows.serp['query'] for rows in pending}
+        stored = {}
+
+        key_columns = [table.c[column] for column in SERP_KEY_COLUMNS]
+        for row in connection.execute(select([table.c.id] + key_columns).where(
+                table.c.query.in_(queries)).order_by(table.c.id)):
+            stored[tuple(row[column] for column in SERP_KEY_COLUMNS)] = row.id
+
+        return stored
+
+    def update_serps(self, connection, updates):
+        """Overwrite the parsed values of stored SERPs and delete their links and knowledge graphs.
+
+        Args:
+            connection: The connection of the transaction.
+            updates: The parsed values of each SERP and its id, the keys are the columns with an underscore appended.
+        """
+        table = SearchEngineResultsPage.__table__
+        serp_ids = [update['serp_id_'] for update in updates]
+
+        connection.execute(table.update().where(table.c.id == bindparam('serp_id_')).values(
+            {column: bindparam(column + '_') for column in SERP_PARSER_COLUMNS}), updates)
+        connection.execute(Link.__table__.delete().where(Link.__table__.c.serp_id.in_(serp_ids)))
+        connection.execute(KnowledgeGraph.__table__.delete().where(KnowledgeGraph.__table__.c.serp_id.in_(serp_ids)))
+
+    def new_assignments(self, connection, assignments):
+        """Drop the assignments of SERPs that are already assigned to the ScraperSearch."""
+        assigned = {row.serp_id for row in connection.execute(
+            select([scraper_searches_serps.c.serp_id]).where(and_(
+                scraper_searches_serps.c.scraper_search_id == self.scraper_search_id,
+                scraper_searches_serps.c.serp_id.in_([assignment['serp_id'] for assignment in assignments]))))}
+        return [assignment for assignment in assignments if assignment['serp_id'] not in assigned]
+
+    def unchanged_serp_id(self, connection, rows):
+        """Get the id of the stored SERP with the same results as the page, see SearchEngineResultsPage.find_unchanged().
+
+        Returns:
+            The id of the latest SERP of the query if its results are unchanged, None otherwise.
+        """
+        serp = rows.serp
+        if serp['status'] != 'successful':
+            return None
+
+        table = SearchEngineResultsPage.__table__
+        previous = connection.execute(
+            select([table.c.id, table.c.fingerprint]).where(and_(
+                table.c.query == serp['query'],
+                table.c.search_engine_name == serp['search_engine_name'],
+                table.c.scrape_method == serp['scrape_method'],
+                table.c.page_number == serp['page_number'])).order_by(table.c.id.desc()).limit(1)).first()
+
+        if previous is not None and previous.fingerprint == serp['fingerprint']:
+            return previous.id
+        return None
+
+
+class SessionSerpWriter():
+    """Writes serp pages through the ORM, committing a batch of pages at once.
+
+    The counterpart of the BulkSerpWriter for the default output. The pages are built
+    as SearchEngineResultsPage, Link and KnowledgeGraph objects and written with the
+    session of the writer, so they are stored exactly like the pages of parse_serp().
+    """
+
+    def __init__(self, engine, scraper_search_id, batch_size=None):
+        """Create a writer for the pages of a ScraperSearch.
+
+        The session connects on first use, so the writer can be created in another
+        thread than the one that uses it.
+
+        Args:
+            engine: The sqlalchemy engine of the database.
+            scraper_search_id: The id of the ScraperSearch the pages are assigned to.
+            batch_size: The number of pages per commit. By default the bulk_insert_batch_size of the config.
+        """
+        self.session = get_session(engine=engine)()
+        self.scraper_search_id = scraper_search_id
+        self.batch_size = batch_size or Config['OUTPUT'].getint('bulk_insert_batch_size', 100)
+        self.skip_unchanged = Config['GLOBAL'].getboolean('skip_unchanged_serps', False)
+
+        self.pending = []
+        self.num_written = 0
+
+    def add(self, rows):
+        """Add the SerpRows of a page, they are written with the next batch."""
+        self.pending.append(rows)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Commit the pages that are collected so far."""
+        pending, self.pending = self.pending, []
+
+        if not pending:
+            return
+
+        scraper_search = self.session.query(ScraperSearch).get(self.scraper_search_id)
+        serps = []
+
+        try:
+            for rows in pending:
+                serp = SearchEngineResultsPage(**rows.serp)
+                if self.skip_unchanged:
+                    serp = serp.find_unchanged(self.session, rows.serp['fingerprint']) or serp
+
+                if serp.id is None:
+                    serp.links = [Link(**link) for link in rows.links]
+                    if rows.knowledge_graph is not None:
+                        serp.knowledge_graph = KnowledgeGraph(**rows.knowledge_graph)
+
+                scraper_search.serps.append(serp)
+                self.session.add(serp)
+                serps.append(serp)
+
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+        self.num_written += len(pending)
+
+        # the output converter imports this module
+        from GoogleScraper.output_converter import store_serp_result
+        for serp in serps:
+            store_serp_result(serp)
+
+    def close(self):
+        """Commit the pending pages and release the session."""
+        self.flush()
+        self.session.close()
+
+
+class DatabaseWriter(threading.Thread):
+    """A thread that owns the writes of the scraped pages.
+
+    The scrape workers put the SerpRows of their pages on a bounded queue and go on
+    scraping. The thread takes them from the queue and hands them to a BulkSerpWriter
+    or a SessionSerpWriter. Whenever the queue runs empty, the pages collected so
+    far are written, so the batches grow while the workers are faster than the database.
+
+    If the queue is full, the workers wait in add() until the thread caught up. A batch
+    that fails is logged and dropped, so that the workers don't wait on a broken database,
+    and close() raises a DatabaseWriterException after the last page is written.
+    """
+
+    # put on the queue to write the collected pages
+    FLUSH = object()
+    # put on the queue to write the collected pages and end the thread
+    STOP = object()
+
+    def __init__(self, serp_writer, queue_size=None):
+        """Create a writer thread.
+
+        Args:
+            serp_writer: The BulkSerpWriter or SessionSerpWriter that writes the pages.
+            queue_size: How many pages the queue holds. By default the database_writer_queue_size of the config.
+        """
+        super().__init__(name='DatabaseWriter', daemon=True)
+        self.serp_writer = serp_writer
+        self.queue = queue.Queue(maxsize=queue_size or Config['OUTPUT'].getint('database_writer_queue_size', 1000))
+        self.num_failed_batches = 0
+        self.error = None
+
+    def add(self, rows):
+        """Put the SerpRows of a page on the queue, waits while the queue is full."""
+        self.queue.put(rows)
+
+    def flush(self):
+        """Wait until all pages that were added are written."""
+        self.queue.put(self.FLUSH)
+        self.queue.join()
+
+    def close(self):
+        """Write all pages that were added and end the thread.
+
+        Raises:
+            DatabaseWriterException if batches of pages couldn't be written.
+        """
+        self.queue.put(self.STOP)
+        self.join()
+
+        if self.error is not None:
+            raise DatabaseWriterException('{} batches of serp pages couldn\'t be written to the database, '
+                                          'the last error: {}'.format(self.num_failed_batches, self.error)) \
+                from self.error
+
+    def run(self):
+        while True:
+            rows = self.queue.get()
+            try:
+                self.write(rows)
+            finally:
+                self.queue.task_done()
+
+            if rows is self.STOP:
+                break
+
+    def write(self, rows):
+        """Hand the page to the writer and write the collected pages if the queue ran empty.
+
+        A batch that fails is logged and counted, the workers must not wait on a writer that died.
+        """
+        try:
+            if rows is not self.FLUSH and rows is not self.STOP:
+                self.serp_writer.add(rows)
+            if rows is self.STOP:
+                self.serp_writer.close()
+            elif rows is self.FLUSH or self.queue.empty():
+                self.serp_writer.flush()
+        except Exception as e:
+            self.num_failed_batches += 1
+            self.error = e
+            logger.error('Couldn\'t write a batch of serp pages to the database: {}'.format(e))
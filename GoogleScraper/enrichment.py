@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+Enrichment of the results of a SERP page before they are stored as links.
+
+The parsers extract the raw fields of the results. Before a result becomes a Link, the values
+that GoogleScraper derives from these fields are added: the domain of the link, whether it points
+to a social site, is served over https or to a mobile (m-dot) site and the star ratings and
+sitelinks joined into single strings.
+
+Everything that only depends on the result type is looked up once per result type, not once
+per link, and enrich_links() applies the enrichment to all links of a result type at once.
+"""
+
+from functools import lru_cache
+from urllib.parse import urlparse
+
+
+SOCIAL_SITES = frozenset([
+    'www.facebook.com',
+    'twitter.com',
+    'www.linkedin.com',
+    'www.pinterest.com',
+    'plus.google.com',
+    'www.tumblr.com',
+    'instagram.com',
+    'vk.com',
+    'www.flickr.com',
+    'vine.co',
+    'www.meetup.com',
+    'www.tagged.com',
+    'ask.fm',
+    'www.meetme.com',
+    'www.classmates.com',
+])
+
+# result types whose star rating is stored together with the number of reviews
+RATING_WITH_REVIEWS_TYPES = frozenset(['organic_results', 'local_pack_results', 'list_carousel'])
+
+# result types whose links are marked as having no image thumbnail when they lack one
+IMAGE_THUMBNAIL_TYPES = frozenset([
+    'organic_results',
+    'news_results',
+    'in_depth_articles',
+    'shopping_results (left)',
+    'shopping_results (right)',
+    'local_carousel',
+    'list_carousel',
+])
+
+SMALL_SITELINK_KEYS = tuple('small_sitelink_{}'.format(i) for i in range(1, 7))
+BIG_SITELINK_KEYS = tuple(('big_sitelink_{}'.format(i), 'big_sitelink_{}_description'.format(i)) for i in range(1, 7))
+
+# the fields that enrich_links() joins to a field, a field projection parses them along with it
+ENRICHMENT_FIELDS = dict([('google_star_rating', ('google_star_rating_reviews',)), ('address', ('phone_number',))] +
+                         [(key, (description,)) for key, description in BIG_SITELINK_KEYS])
+
+
+@lru_cache(maxsize=2 ** 14)
+def link_domain(url):
+    """Get the domain of a url.
+
+    The same links show up on many serp pages, so the domains are cached per url.
+
+    Args:
+        url: The url of a link.
+
+    Returns:
+        The network location of the url.
+    """
+    return urlparse(url).netloc
+
+
+def enrich_links(link_type, links, requested=None):
+    """Enrich all links of a result type.
+
+    Args:
+        link_type: The result type of the links, like organic_results.
+        links: The results as parsed by the parser.
+        requested: The fields the parser was restricted to for this result type. None
+            if all fields were parsed. The flags of the fields that weren't parsed are None.
+
+    Returns:
+        A list with a dict of the column values of the Link for every link.
+    """
+    rating_with_reviews = link_type in RATING_WITH_REVIEWS_TYPES
+    paid = link_type == 'paid_results'
+    organic = link_type == 'organic_results'
+    without_image_thumbnail = False if link_type in IMAGE_THUMBNAIL_TYPES else None
+    without_search_bar = without_video_thumbnail = False if organic else None
+
+    small_sitelink_keys = SMALL_SITELINK_KEYS
+    big_sitelink_keys = BIG_SITELINK_KEYS
+    if requested is not None:
+        # a field that wasn't parsed doesn't tell that the result lacks the feature
+        if 'image_thumbnail' not in requested:
+            without_image_thumbnail = None
+        if 'search_bar' not in requested:
+            without_search_bar = None
+        if 'video_thumbnail' not in requested:
+            without_video_thumbnail = None
+        if not any(field.startswith('small_sitelink_') for field in requested):
+            small_sitelink_keys = ()
+        if not any(field.startswith('big_sitelink_') for field in requested):
+            big_sitelink_keys = ()
+
+    enriched = []
+
+    for link in links:
+        get = link.get
+        url = get('link')
+        domain = link_domain(url)
+
+        google_star_rating = get('google_star_rating')
+        if google_star_rating is not None:
+            if rating_with_reviews:
+                reviews = get('google_star_rating_reviews')
+                if reviews is not None:
+                    google_star_rating = google_star_rating + ' - ' + reviews
+            elif not paid:
+                google_star_rating = None
+
+        # paid results carry the phone number with the address
+        address = get('address')
+        if paid and address is not None and get('phone_number') is not None:
+            address = address + ' ' + get('phone_number')
+
+        small_sitelinks = [sitelink for sitelink in map(get, small_sitelink_keys) if sitelink is not None]
+        big_sitelinks = [get(key) + ' - ' + get(description) if get(description) is not None else get(key)
+                         for key, description in big_sitelink_keys if get(key) is not None]
+
+        enriched.append(dict(
+            link=url,
+            snippet=get('snippet'),
+            title=get('title'),
+            visible_link=get('visible_link'),
+            domain=domain,
+            rank=get('rank'),
+            link_type=link_type,
+            google_star_rating=google_star_rating,
+            address=address,
+            search_bar=True if get('search_bar') is not None else without_search_bar,
+            schema_enhanced_listing=get('schema_enhanced_listing') or None,
+            image_thumbnail=True if get('image_thumbnail') is not None else without_image_thumbnail,
+            video_thumbnail=True if get('video_thumbnail') is not None else without_video_thumbnail,
+            small_sitelinks='; '.join(small_sitelinks) if small_sitelinks else None,
+            big_sitelinks='; '.join(big_sitelinks) if big_sitelinks else None,
+            price=get('price'),
+            social_site=domain in SOCIAL_SITES,
+            https=url.startswith('https'),
+            m_dot='//m.' in url,
+        ))
+
+    return enriched
@@ -9,8 +9,9 @@ import socket
 from urllib.parse import urlencode
 
 import GoogleScraper.socks as socks
-from GoogleScraper.scraping import SearchEngineScrape, get_base_search_url_by_search_engine
-from GoogleScraper.parsing import get_parser_by_search_engine
+from GoogleScraper.scraping import SearchEngineScrape, get_base_search_url_by_search_engine, malicious_request_detected
+from GoogleScraper.parsing import parser_pool
+from GoogleScraper.search_engines import get_part
 from GoogleScraper.config import Config
 from GoogleScraper.log import out
 from GoogleScraper.user_agents import user_agents
@@ -24,11 +25,16 @@ headers = {
     'Connection': 'keep-alive',
 }
 
+# how many bytes of a streamed response are searched for the signs of a captcha page
+CAPTCHA_SNIFF_SIZE = 16 * 1024
+
 
 def get_GET_params_for_search_engine(query, search_engine, page_number=1, num_results_per_page=10,
                                      search_type='normal'):
     """Returns the params of the url for the search engine and the search mode.
 
+    The params are built by the search_params function of the search engine registry.
+
     Args:
         search_engine: The search engine. Example: 'google'
         search_mode: The search mode. Example: 'image' or 'normal'
@@ -39,87 +45,124 @@ def get_GET_params_for_search_engine(query, search_engine, page_number=1, num_re
     Returns:
         The params for the GET url.
     """
+    search_params = get_part(search_engine, 'search_params')
+
+    if search_params is None:
+        return {}
+
+    return search_params(query, page_number, num_results_per_page, search_type)
+
+
+def google_search_params(query, page_number, num_results_per_page, search_type):
+    """The GET params of a google search, see get_GET_params_for_search_engine()."""
+    # always use the english interface, such that we can detect
+    # state by some hard coded needles.
+    search_params = {
+        'hl': 'en',
+        'q': query,
+    }
+    # only set when other num results than 10.
+    if num_results_per_page != 10:
+        search_params['num'] = str(num_results_per_page)
+
+    if page_number > 1:
+        search_params['start'] = str((page_number - 1) * int(num_results_per_page))
+
+    if search_type == 'image':
+        search_params.update({
+            'oq': query,
+            'site': 'imghp',
+            'tbm': 'isch',
+            'source': 'hp',
+            # 'sa': 'X',
+            'biw': 1920,
+            'bih': 881
+        })
+    elif search_type == 'video':
+        search_params.update({
+            'tbm': 'vid',
+            'source': 'lnms',
+            'sa': 'X',
+            'biw': 1920,
+            'bih': 881
+        })
+    elif search_type == 'news':
+        search_params.update({
+            'tbm': 'nws',
+            'source': 'lnms',
+            'sa': 'X'
+        })
+
+    return search_params
+
+
+def yandex_search_params(query, page_number, num_results_per_page, search_type):
+    """The GET params of a yandex search, see get_GET_params_for_search_engine()."""
+    search_params = {'text': query}
+    if page_number > 1:
+        search_params['p'] = str(page_number - 1)
+
+    # @todo: what was this for?
+    # if search_type == 'image':
+    #     base_search_url = 'http://yandex.ru/images/search?'
+
+    return search_params
+
+
+def bing_search_params(query, page_number, num_results_per_page, search_type):
+    """The GET params of a bing search, see get_GET_params_for_search_engine()."""
+    search_params = {'q': query}
+    # bing doesn't support variable number of results (As far as I know).
+    if page_number > 1:
+        search_params['first'] = str(1 + ((page_number - 1) * 10))
+
+    return search_params
+
+
+def yahoo_search_params(query, page_number, num_results_per_page, search_type):
+    """The GET params of a yahoo search, see get_GET_params_for_search_engine()."""
+    search_params = {'p': query}
+    if page_number > 1:
+        search_params['b'] = str(1 + ((page_number - 1) * 10))
+    search_params['ei'] = 'UTF-8'
+
+    return search_params
+
+
+def baidu_search_params(query, page_number, num_results_per_page, search_type):
+    """The GET params of a baidu search, see get_GET_params_for_search_engine()."""
+    search_params = {'wd': query}
+    if page_number > 1:
+        search_params['pn'] = str((page_number - 1) * 10)
+    search_params['ie'] = 'utf-8'
+
+    return search_params
 
-    search_params = {}
-
-    if search_engine == 'google':
-        # always use the english interface, such that we can detect
-        # state by some hard coded needles.
-        search_params['hl'] = 'en'
-        search_params['q'] = query
-        # only set when other num results than 10.
-        if num_results_per_page != 10:
-            search_params['num'] = str(num_results_per_page)
-
-        if page_number > 1:
-            search_params['start'] = str((page_number - 1) * int(num_results_per_page))
-
-        if search_type == 'image':
-            search_params.update({
-                'oq': query,
-                'site': 'imghp',
-                'tbm': 'isch',
-                'source': 'hp',
-                # 'sa': 'X',
-                'biw': 1920,
-                'bih': 881
-            })
-        elif search_type == 'video':
-            search_params.update({
-                'tbm': 'vid',
-                'source': 'lnms',
-                'sa': 'X',
-                'biw': 1920,
-                'bih': 881
-            })
-        elif search_type == 'news':
-            search_params.update({
-                'tbm': 'nws',
-                'source': 'lnms',
-                'sa': 'X'
-            })
-
-    elif search_engine == 'yandex':
-        search_params['text'] = query
-        if page_number > 1:
-            search_params['p'] = str(page_number - 1)
-
-        # @todo: what was this for?
-        # if search_type == 'image':
-        #     base_search_url = 'http://yandex.ru/images/search?'
-
-    elif search_engine == 'bing':
-        search_params['q'] = query
-        # bing doesn't support variable number of results (As far as I know).
-        if page_number > 1:
-            search_params['first'] = str(1 + ((page_number - 1) * 10))
-
-    elif search_engine == 'yahoo':
-        search_params['p'] = query
-        if page_number > 1:
-            search_params['b'] = str(1 + ((page_number - 1) * 10))
-        search_params['ei'] = 'UTF-8'
-
-    elif search_engine == 'baidu':
-        search_params['wd'] = query
-        if page_number > 1:
-            search_params['pn'] = str((page_number - 1) * 10)
-        search_params['ie'] = 'utf-8'
-    elif search_engine == 'duckduckgo':
-        search_params['q'] = query
-    elif search_engine == 'ask':
-        search_params['q'] = query
-        search_params['qsrc'] = '0'
-        search_params['l'] = 'dir'
-        search_params['qo'] = 'homepageSearchBox'
-        if page_number > 1:
-            search_params['page'] = str(page_number)
-    elif search_engine == 'blekko':
-        search_params['q'] = query
+
+def duckduckgo_search_params(query, page_number, num_results_per_page, search_type):
+    """The GET params of a duckduckgo search, see get_GET_params_for_search_engine()."""
+    return {'q': query}
+
+
+def ask_search_params(query, page_number, num_results_per_page, search_type):
+    """The GET params of an ask search, see get_GET_params_for_search_engine()."""
+    search_params = {
+        'q': query,
+        'qsrc': '0',
+        'l': 'dir',
+        'qo': 'homepageSearchBox',
+    }
+    if page_number > 1:
+        search_params['page'] = str(page_number)
 
     return search_params
 
 
+def blekko_search_params(query, page_number, num_results_per_page, search_type):
+    """The GET params of a blekko search, see get_GET_params_for_search_engine()."""
+    return {'q': query}
+
+
 class HttpScrape(SearchEngineScrape, threading.Timer):
     """Offers a fast way to query any search engine using raw HTTP requests.
 
@@ -245,8 +288,7 @@ class HttpScrape(SearchEngineScrape, threading.Timer):
                                                               self.page_number, self.num_results_per_page,
                                                               self.search_type)
 
-        self.parser = get_parser_by_search_engine(self.search_engine_name)
-        self.parser = self.parser()
+        self.parser = parser_pool.get(self.search_engine_name, query=self.query)
 
     def search(self, rand=False, timeout=15):
         """The actual search for the search engine.
@@ -257,6 +299,8 @@ class HttpScrape(SearchEngineScrape, threading.Timer):
         """
 
         success = True
+        denied = False
+        streaming = Config['HTTP'].getboolean('streaming_parse', False)
 
         self.build_search()
 
@@ -268,10 +312,16 @@ class HttpScrape(SearchEngineScrape, threading.Timer):
             super().keyword_info()
 
             request = self.requests.get(self.base_search_url + urlencode(self.search_params),
-                                        headers=self.headers, timeout=timeout)
+                                        headers=self.headers, timeout=timeout, stream=streaming)
 
             self.requested_at = datetime.datetime.utcnow()
-            self.html = request.text
+
+            if streaming:
+                denied = not self.stream_response(request)
+            else:
+                # keep the raw bytes, the parser decodes them
+                self.html = request.content
+                self.encoding = request.encoding
 
             out('[HTTP - {url}, headers={headers}, params={params}'.format(
                 url=request.url,
@@ -290,7 +340,7 @@ class HttpScrape(SearchEngineScrape, threading.Timer):
             # in the actual request, just end the worker.
             self.status = 'Stopping scraping because {}'.format(e)
         else:
-            if not request.ok:
+            if not request.ok or denied:
                 self.handle_request_denied(request.status_code)
                 success = False
 
@@ -298,6 +348,42 @@ class HttpScrape(SearchEngineScrape, threading.Timer):
 
         return success
 
+    def stream_response(self, request):
+        """Read the body of a streamed response in chunks and feed them to the parser as they arrive.
+
+        Parsing thus overlaps with the download. Responses that are no success are dropped
+        without reading the body, captcha pages as soon as the first kilobytes reveal them.
+
+        Args:
+            request: The response of a request with stream=True.
+
+        Returns:
+            False if the response was dropped, True otherwise.
+        """
+        self.html = ''
+        self.encoding = request.encoding
+
+        try:
+            if not request.ok:
+                return False
+
+            chunks = []
+            received = 0
+
+            for chunk in request.iter_content(chunk_size=Config['HTTP'].getint('stream_chunk_size', 16384)):
+                if received < CAPTCHA_SNIFF_SIZE and malicious_request_detected(
+                        self.search_engine_name, request.url, b''.join(chunks) + chunk):
+                    return False
+
+                chunks.append(chunk)
+                received += len(chunk)
+                self.parser.feed(chunk, encoding=request.encoding)
+
+            self.html = b''.join(chunks)
+            return True
+        finally:
+            request.close()
+
     def run(self):
         super().before_search()
 
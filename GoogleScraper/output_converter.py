@@ -66,7 +66,7 @@ def init_outfile(force_reload=False):
             outfile = sys.stdout
 
 
-def store_serp_result(serp):
+def store_serp_result(serp, links=None):
     """Store the parsed SERP page.
 
     Stores the results from scraping in the appropriate output format.
@@ -79,15 +79,18 @@ def store_serp_result(serp):
     When called from caching, a list of serp object are given.
 
     Args:
-        serp: A serp object
+        serp: A serp object or the column values of a serp as written by a BulkSerpWriter.
+        links: The column values of the links if the serp is given as column values.
     """
     global outfile, output_format
 
     if outfile:
-        data = row2dict(serp)
-        data['results'] = []
-        for link in serp.links:
-            data['results'].append(row2dict(link))
+        if links is None:
+            data = row2dict(serp)
+            data['results'] = [row2dict(link) for link in serp.links]
+        else:
+            data = values2dict(SERP.__table__, serp)
+            data['results'] = [values2dict(Link.__table__, link) for link in links]
 
         if output_format == 'json':
             # The problem here is, that we need to stream write the json data.
@@ -95,7 +98,7 @@ def store_serp_result(serp):
         elif output_format == 'csv':
             # one row per link
             for row in data['results']:
-                d = row2dict(serp)
+                d = dict(data)
                 d.update(row)
                 d = ({k: v for k, v in d.items() if k in csv_fieldnames})
                 outfile.writerow(d)
@@ -109,4 +112,9 @@ def row2dict(obj):
     for column in obj.__table__.columns:
         d[column.name] = str(getattr(obj, column.name))
 
-    return d
\ No newline at end of file
+    return d
+
+
+def values2dict(table, values):
+    """Convert the column values of a row to a dictionary like row2dict()."""
+    return {column.name: str(values.get(column.name)) for column in table.columns}
@@ -3,14 +3,23 @@
 import sys
 import os
 import re
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 import lxml.html
+from lxml import etree
 from lxml.html.clean import Cleaner
 import logging
+from collections import namedtuple
 from urllib.parse import unquote
+from html import unescape
 import pprint
-from GoogleScraper.database import SearchEngineResultsPage
+from GoogleScraper.database import SearchEngineResultsPage, serp_fingerprint
 from GoogleScraper.config import Config
+from GoogleScraper.enrichment import ENRICHMENT_FIELDS
 from GoogleScraper.log import out
+from GoogleScraper.search_engines import get_part, search_engine_by_url
 from cssselect import HTMLTranslator
 
 logger = logging.getLogger('GoogleScraper')
@@ -28,6 +37,434 @@ class NoParserForSearchEngineException(Exception):
     pass
 
 
+# How the value of a selector is extracted from the first element it targets.
+# Plain selectors and selectors ending with ::text yield the text content,
+# selectors ending with ::attr(name) yield the value of the attribute.
+EXTRACT_TEXT = 'text'
+EXTRACT_ATTR = 'attr'
+
+CompiledSelector = namedtuple('CompiledSelector', 'css, xpath, extract, attr')
+
+# A selector that is evaluated relative to the elements its container selector targets.
+ScopedSelector = namedtuple('ScopedSelector', 'container, relative')
+
+# How the fields of the results of a selector variant are extracted. The fields are
+# grouped by the element they are extracted from, each element is selected once.
+# record is the SerpItem class of the result type.
+ExtractionPlan = namedtuple('ExtractionPlan', 'results_selector, groups, record')
+
+# The fields extracted from one element of a result. fields are pairs of the position
+# of the field in the record and the CompiledSelector of the field.
+FieldGroup = namedtuple('FieldGroup', 'element, fields')
+
+# One translator for all parsers. Translating css to xpath is costly,
+# so selectors are translated once and compiled into lxml XPath objects.
+_translator = HTMLTranslator()
+
+# Guards the lazy creation of the selector registries of the parser classes.
+_registry_lock = threading.Lock()
+
+
+def split_pseudo_element(selector):
+    """Split a selector into the css selector and the ::text or ::attr(attr-name) suffix."""
+    if selector.endswith('::text') or re.search(r'::attr\((?P<attr>.*)\)$', selector):
+        css, _, pseudo = selector.partition('::')
+        return css, '::' + pseudo
+    return selector, ''
+
+
+def compile_selector(selector, prefix='descendant-or-self::'):
+    """Compile a css selector with the ::text and ::attr(attr-name) pseudo elements.
+
+    Args:
+        selector: A css selector, optionally followed by ::text or ::attr(attr-name).
+        prefix: The xpath axis the selector starts with. Use 'descendant::'
+                to select within an element only.
+
+    Returns:
+        A CompiledSelector with the compiled XPath of the element selector and
+        the extraction mode of the pseudo element.
+    """
+    extract, attr, css = EXTRACT_TEXT, None, selector
+
+    if selector.endswith('::text'):
+        css = selector.split('::')[0]
+    else:
+        match = re.search(r'::attr\((?P<attr>.*)\)$', selector)
+        if match:
+            extract, attr, css = EXTRACT_ATTR, match.group('attr'), selector.split('::')[0]
+
+    return CompiledSelector(selector, etree.XPath(_translator.css_to_xpath(css, prefix=prefix)), extract, attr)
+
+
+def extract_value(compiled, element):
+    """Extract the value of the compiled selector from the element it targets."""
+    if compiled.extract == EXTRACT_ATTR:
+        return element.get(compiled.attr)
+
+    return element.text_content()
+
+
+def selector_steps(css):
+    """Split a css selector at its descendant combinators.
+
+    Child and sibling combinators (>, + and ~) don't start a new step, such
+    that each step can be selected within the elements of the previous steps.
+
+    Args:
+        css: A css selector without pseudo elements.
+
+    Returns:
+        The list of steps, for instance ['#rhs', 'li.g', 'div.kno-rdesc > span'].
+    """
+    tokens, token, depth, quote = [], '', 0, None
+
+    for char in css:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '\'"':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char.isspace() and depth == 0:
+            if token:
+                tokens.append(token)
+            token = ''
+            continue
+        token += char
+
+    if token:
+        tokens.append(token)
+
+    steps = []
+    for token in tokens:
+        if steps and (steps[-1][-1] in '>+~' or token[0] in '>+~'):
+            steps[-1] += ' ' + token
+        else:
+            steps.append(token)
+
+    return steps
+
+
+def scope_selectors(selectors):
+    """Find the selectors that share a container and scope them to it.
+
+    Selectors are grouped by their first step. The container of a group of at
+    least two selectors is the longest common prefix of their steps, which
+    must leave each selector at least one step to evaluate within the container.
+
+    Args:
+        selectors: The css selectors (with optional pseudo elements) to scope.
+
+    Returns:
+        A dict that maps the scoped selectors to their ScopedSelector.
+    """
+    groups = {}
+    for selector in set(filter(None, selectors)):
+        css, pseudo = split_pseudo_element(selector)
+        steps = selector_steps(css)
+        if len(steps) > 1:
+            groups.setdefault(steps[0], []).append((selector, steps, pseudo))
+
+    scoped = {}
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+
+        shared = min(len(steps) for _, steps, _ in group) - 1
+        for index in range(1, shared):
+            if len({tuple(steps[:index + 1]) for _, steps, _ in group}) > 1:
+                shared = index
+                break
+
+        container = ' '.join(group[0][1][:shared])
+        for selector, steps, pseudo in group:
+            relative = ' '.join(steps[shared:]) + pseudo
+            scoped[selector] = ScopedSelector(container, compile_selector(relative, prefix='descendant::'))
+
+    return scoped
+
+
+# The cost of a selector over a run.
+SelectorStat = namedtuple('SelectorStat', 'calls, matches, misses, seconds')
+
+
+class SelectorStats(object):
+    """Records how often selectors are evaluated, whether they match and what they cost.
+
+    Recording is opt-in (see the selector_stats option), because it times every
+    evaluation. All parsers of the process record into the module level instance
+    selector_stats, parse_many() merges the records of its workers into it.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    def record(self, parser_name, selector, seconds, matched):
+        """Record a single evaluation of a selector."""
+        key = (parser_name, selector)
+        with self.lock:
+            calls, matches, misses, total = self.stats.get(key, (0, 0, 0, 0.0))
+            self.stats[key] = (calls + 1, matches + bool(matched), misses + (not matched), total + seconds)
+
+    def merge(self, snapshot):
+        """Add the records of a snapshot, for instance of another process."""
+        with self.lock:
+            for key, stat in snapshot.items():
+                calls, matches, misses, total = self.stats.get(key, (0, 0, 0, 0.0))
+                self.stats[key] = (calls + stat.calls, matches + stat.matches, misses + stat.misses,
+                                   total + stat.seconds)
+
+    def snapshot(self):
+        """Get the records as a dict that maps (parser name, selector) to a SelectorStat."""
+        with self.lock:
+            return {key: SelectorStat(*stat) for key, stat in self.stats.items()}
+
+    def ranked(self):
+        """Get the records ranked by the total time spent on the selector, the most expensive first."""
+        return sorted(self.snapshot().items(), key=lambda item: item[1].seconds, reverse=True)
+
+    def report(self, limit=None):
+        """Format the ranked records as a table. Selectors that never matched are marked as dead."""
+        lines = ['{:>10} {:>8} {:>8} {:>8}  {:<18} {}'.format(
+            'total ms', 'calls', 'matches', 'misses', 'parser', 'selector')]
+
+        for (parser_name, selector), stat in self.ranked()[:limit]:
+            lines.append('{:>10.2f} {:>8} {:>8} {:>8}  {:<18} {}{}'.format(
+                stat.seconds * 1000, stat.calls, stat.matches, stat.misses, parser_name, selector,
+                ' [dead]' if not stat.matches else ''))
+
+        return '\n'.join(lines)
+
+
+selector_stats = SelectorStats()
+
+
+class SerpItem(object):
+    """A single result of a serp page, like an organic link or an ad.
+
+    The fields of a result type are fixed, so the items are records that keep their
+    values in a list instead of being dicts. Use serp_item_class() to get the record
+    class for a set of fields. Items support the dict protocol (item['link'],
+    item.get(), 'link' in item, item.items()) for their fields and attribute access
+    (item.link). get() returns None for fields the result type doesn't have.
+    """
+
+    __slots__ = ('_values',)
+
+    # the fields of the record class and their positions in the values
+    fields = ()
+    index = {}
+
+    def __init__(self, values=None):
+        self._values = list(values) if values is not None else [None] * len(self.fields)
+
+    def __getitem__(self, key):
+        return self._values[self.index[key]]
+
+    def __setitem__(self, key, value):
+        self._values[self.index[key]] = value
+
+    def __getattr__(self, name):
+        try:
+            return self._values[self.index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def get(self, key, default=None):
+        position = self.index.get(key)
+        if position is None:
+            return default
+        return self._values[position]
+
+    def keys(self):
+        return self.fields
+
+    def values(self):
+        return tuple(self._values)
+
+    def items(self):
+        return tuple(zip(self.fields, self._values))
+
+    def __eq__(self, other):
+        if isinstance(other, SerpItem):
+            return self.fields == other.fields and self._values == other._values
+        return NotImplemented
+
+    def __reduce__(self):
+        # the record classes are created at runtime and can't be pickled by name
+        return _restore_serp_item, (self.fields, tuple(self._values))
+
+    def __repr__(self):
+        return 'SerpItem({})'.format(', '.join('{}={!r}'.format(*item) for item in self.items()))
+
+
+_serp_item_classes = {}
+
+
+def serp_item_class(fields):
+    """Get the SerpItem record class with the given fields.
+
+    Args:
+        fields: The names of the fields, in order.
+
+    Returns:
+        A subclass of SerpItem for the fields. Equal fields yield the same class.
+    """
+    fields = tuple(fields)
+
+    try:
+        return _serp_item_classes[fields]
+    except KeyError:
+        with _registry_lock:
+            return _serp_item_classes.setdefault(fields, type('SerpItem', (SerpItem,), {
+                '__slots__': (),
+                'fields': fields,
+                'index': {field: position for position, field in enumerate(fields)},
+            }))
+
+
+def _restore_serp_item(fields, values):
+    """Recreate a pickled SerpItem."""
+    return serp_item_class(fields)(values)
+
+
+# The parts of a serp page that no selector targets: scripts (including the json
+# blobs in script elements), styles and comments. The contents are consumed in runs
+# without the character that may end them. A run is captured in a lookahead and
+# matched by the backreference, so it is never backtracked into: the matching stays
+# fast and linear, even for elements that are never closed.
+_bloat_pattern = (
+    r'<(?:'
+    r'script\b[^>]*>(?:(?=([^<]+))\1|<(?!/script))*</script\s*>'
+    r'|style\b[^>]*>(?:(?=([^<]+))\2|<(?!/style))*</style\s*>'
+    r'|!--(?:(?=([^-]+))\3|-(?!->))*-->'
+    r')'
+)
+
+
+def html_regexes(pattern, flags=0):
+    """Compile a regular expression for html given as string and for html given as bytes.
+
+    Returns:
+        A dict that maps the type of the html to the compiled expression.
+    """
+    return {
+        str: re.compile(pattern, flags),
+        bytes: re.compile(pattern.encode(), flags),
+    }
+
+
+_bloat_regexes = html_regexes(_bloat_pattern, re.IGNORECASE | re.DOTALL)
+
+
+def strip_bloat(html):
+    """Remove the scripts, styles and comments from raw html.
+
+    Serp pages consist mostly of inline scripts, so removing them in a single pass over
+    the raw html is much cheaper than building the dom with them and cleaning it afterwards.
+
+    Args:
+        html: The html as bytes or string.
+
+    Returns:
+        The html without <script> and <style> elements and comments.
+    """
+    return _bloat_regexes[type(html)].sub(html[:0], html)
+
+
+def field_projection(parse_fields):
+    """Parse the parse_fields option into a field projection.
+
+    The option is a comma separated list of entries. An entry "result_type.field"
+    requests a single field of a result type, an entry without a field requests
+    all result types and serp features whose name equals the entry or starts
+    with the entry followed by an underscore (like "knowledge_graph"). The fields
+    that the enrichment of the links joins to a requested field are requested too.
+
+    Args:
+        parse_fields: The value of the parse_fields option.
+
+    Returns:
+        None if everything is parsed. Otherwise a dict that maps the requested
+        names to the set of requested fields or to None for all fields.
+    """
+    projection = {}
+
+    for entry in parse_fields.split(','):
+        name, _, field = entry.strip().partition('.')
+        if not name:
+            continue
+        if field:
+            fields = projection.setdefault(name, set())
+            if fields is not None:
+                fields.add(field)
+        else:
+            projection[name] = None
+
+    for fields in projection.values():
+        if fields is not None:
+            fields.update(joined for field in list(fields) for joined in ENRICHMENT_FIELDS.get(field, ()))
+
+    return projection or None
+
+
+# The options of the SCRAPING section that a parser reads when it is created.
+ParserSettings = namedtuple('ParserSettings', 'search_type, parse_fields, variant_order, '
+                                              'stop_after_productive_variant, preclean_html')
+
+
+def parser_settings():
+    """Get the parser settings of the current config."""
+    scraping = Config['SCRAPING']
+
+    return ParserSettings(
+        search_type=scraping.get('search_type', 'normal'),
+        parse_fields=scraping.get('parse_fields', ''),
+        variant_order=scraping.get('variant_order', 'declared'),
+        stop_after_productive_variant=scraping.getboolean('stop_after_productive_variant', False),
+        preclean_html=scraping.getboolean('preclean_html', True),
+    )
+
+
+# Conversions of the first match of a feature (False if nothing matched)
+# to the value of the parser attribute.
+def matched(match):
+    return match is not False
+
+
+def match_or_none(match):
+    return None if match is False else match
+
+
+def text_or_none(match):
+    return None if match is False or match == '' else match
+
+
+def first_match_or_false(match):
+    return match
+
+
 class Parser():
     """Parses SERP pages.
 
@@ -45,6 +482,9 @@ class Parser():
         search_results: The results after parsing.
     """
 
+    # the name of the search engine, to be set by the implementing sub classes
+    search_engine = ''
+
     # this selector specified the element that notifies the user whether the search
     # had any results.
     no_results_selector = []
@@ -115,6 +555,70 @@ class Parser():
     # Knowledge Graph Ad Selector
     knowledge_graph_ad_selector = []
 
+    # The keys that identify a result of a result type, tried in this order. A result is
+    # added if the value of one of the keys is set and wasn't seen before in this result
+    # type. The flag tells whether the added result counts towards num_results.
+    result_identity_keys = {
+        'local_pack_results': (('address', True), ('link', True)),
+        'knowledge_graph_trivia': (('title', False), ('link_title', False), ('hours_title', False), ('link', True)),
+    }
+    default_identity_keys = (('link', True),)
+
+    # The fields after_parsing() reads, by result type. They are always parsed,
+    # also when the field projection leaves them out.
+    after_parsing_fields = {}
+
+    # The serp features that are parsed besides the results. Each entry names
+    # the attribute to set, the selector lists to test (in this order) and
+    # how the first match is converted to the value of the attribute.
+    feature_table = [
+        ('autocorrect', ('autocorrect_selector',), text_or_none),
+        ('autocorrect_forced_check', ('autocorrect_forced_check_selector',), text_or_none),
+        ('map_result', ('map_selector',), matched),
+        ('image_mega_block', ('image_mega_block_selector',), matched),
+        ('image_results', ('image_results_selector',), matched),
+        ('answer_box', ('answer_box_selector', 'answer_box_multi_selector',
+                        'answer_box_google_flight_selector'), matched),
+        ('knowledge_graph_box', ('knowledge_graph_title_selector',), matched),
+        ('knowledge_graph_title', ('knowledge_graph_title_selector',), first_match_or_false),
+        ('knowledge_graph_google_star_rating', ('knowledge_graph_google_star_rating_selector',), match_or_none),
+        ('knowledge_graph_google_star_rating_numbers', ('knowledge_graph_google_star_rating_numbers_selector',),
+         match_or_none),
+        ('knowledge_graph_google_star_rating_big', ('knowledge_graph_google_star_rating_big_selector',), match_or_none),
+        ('knowledge_graph_google_star_rating_numbers_big', ('knowledge_graph_google_star_rating_numbers_big_selector',),
+         match_or_none),
+        ('knowledge_graph_subtitle', ('knowledge_graph_subtitle_selector',), match_or_none),
+        ('knowledge_graph_location_subtitle', ('knowledge_graph_location_subtitle_selector',), match_or_none),
+        ('knowledge_graph_snippet', ('knowledge_graph_snippet_selector',), match_or_none),
+        ('knowledge_graph_location_snippet', ('knowledge_graph_location_snippet_selector',), match_or_none),
+        ('knowledge_graph_google_plus_recent_post', ('knowledge_graph_google_plus_recent_post_selector',),
+         match_or_none),
+        ('knowledge_graph_map', ('knowledge_graph_map_selector',), matched),
+        ('knowledge_graph_thumbnail', ('knowledge_graph_thumbnail_selector',), matched),
+        ('knowledge_graph_google_images_scrapbook', ('knowledge_graph_google_images_scrapbook_selector',), matched),
+        ('knowledge_graph_ad', ('knowledge_graph_ad_selector',), matched),
+    ]
+
+    # The serp features that are only parsed when they are accessed for the first time,
+    # with their values before parsing. Most serp pages have no knowledge graph panel, so
+    # the details of the panel are only parsed if somebody asks for them.
+    lazy_features = {
+        'knowledge_graph_title': None,
+        'knowledge_graph_google_star_rating': None,
+        'knowledge_graph_google_star_rating_numbers': None,
+        'knowledge_graph_google_star_rating_big': None,
+        'knowledge_graph_google_star_rating_numbers_big': None,
+        'knowledge_graph_subtitle': None,
+        'knowledge_graph_location_subtitle': None,
+        'knowledge_graph_snippet': None,
+        'knowledge_graph_location_snippet': None,
+        'knowledge_graph_google_plus_recent_post': None,
+        'knowledge_graph_map': False,
+        'knowledge_graph_thumbnail': False,
+        'knowledge_graph_google_images_scrapbook': False,
+        'knowledge_graph_ad': False,
+    }
+
     # Each subclass of Parser may declare an arbitrary amount of attributes that
     # follow a naming convention like this:
     # *_search_selectors
@@ -123,26 +627,148 @@ class Parser():
     # If you didn't specify the search type in the search_types list, this attribute
     # will not be evaluated and no data will be parsed.
 
-    def __init__(self, html=None, query=''):
+    @classmethod
+    def iter_selectors(cls):
+        """Yields all css selectors that the parser class declares.
+
+        These are the entries of the *_selector and *_selectors lists and the
+        entries of the *_search_selectors dicts. The container and the result_container
+        of a result type are joined to the selector that targets the single results.
+        """
+        for name in dir(cls):
+            # the private caches, like the scoped selectors a parent class built already
+            if name.startswith('_') or not name.endswith(('_selector', '_selectors')):
+                continue
+
+            value = getattr(cls, name)
+            if isinstance(value, list):
+                yield from value
+            elif isinstance(value, dict):
+                for selector_class in value.values():
+                    for selectors in selector_class.values():
+                        yield cls.results_selector(selectors)
+                        for key, selector in selectors.items():
+                            if key not in ('container', 'result_container'):
+                                yield selector
+
+    @staticmethod
+    def results_selector(selectors):
+        """The css selector that targets the single results of a result type."""
+        if 'result_container' in selectors and selectors['result_container']:
+            return '{container} {result_container}'.format(**selectors)
+        return selectors['container']
+
+    @classmethod
+    def compiled_selectors(cls):
+        """Returns the selector registry of the parser class.
+
+        All selectors of the class are compiled once on first use. The registry
+        maps each css selector to its CompiledSelector and is shared by all
+        instances (and threads) of the class.
+        """
+        def build():
+            registry = {}
+            for selector in cls.iter_selectors():
+                if selector and selector not in registry:
+                    registry[selector] = compile_selector(selector)
+            return registry
+
+        return cls._class_cache('_selector_registry', build)
+
+    @classmethod
+    def scoped_feature_selectors(cls):
+        """Returns the feature selectors of the parser class that share a container.
+
+        For instance, all knowledge graph selectors of Google start with the panel
+        on the right hand side. The panel is looked up once and the remainder of
+        the selectors is evaluated within the panel only. If there is no panel,
+        none of the knowledge graph selectors needs to be evaluated.
+        """
+        def build():
+            selectors = [selector for _, names, _ in cls.feature_table for name in names
+                         for selector in getattr(cls, name)]
+            return scope_selectors(selectors)
+
+        return cls._class_cache('_scoped_feature_selectors', build)
+
+    @classmethod
+    def recent_variants(cls):
+        """Returns the first selector variant that yielded results on the last page, per result type.
+
+        Shared by all instances of the parser class, i.e. learned per search engine. With
+        variant_order adaptive, the learned variant is tried first on the next page. So
+        when several variants find the same result, which of them is kept (and its rank)
+        and the order of the results depend on the pages parsed before.
+        """
+        return cls._class_cache('_recent_variants', dict)
+
+    @classmethod
+    def _class_cache(cls, name, build):
+        """Get the class attribute name, build it once on first use."""
+        value = cls.__dict__.get(name)
+
+        if value is None:
+            with _registry_lock:
+                value = cls.__dict__.get(name)
+                if value is None:
+                    value = build()
+                    setattr(cls, name, value)
+
+        return value
+
+    def __init__(self, html=None, query='', searchtype=None, encoding=None, fields=None):
         """Create new Parser instance and parse all information.
 
         Args:
             html: The raw html from the search engine search. If not provided, you can parse
-                    the data later by calling parse(html) directly.
-            searchtype: The search type. By default "normal"
+                    the data later by calling parse(html) directly. Either the raw bytes of the
+                    response or a string.
+            query: The query the html was requested with.
+            searchtype: The search type. By default the search_type of the config.
+            encoding: The encoding of the html if it is given as bytes. By default utf-8.
+            fields: The result types, fields and serp features to parse in the format of the
+                    parse_fields option. By default the parse_fields of the config.
 
         Raises:
             Assertion error if the subclassed
             specific parser cannot handle the the settings.
         """
-        self.searchtype = Config['SCRAPING'].get('search_type', 'normal')
+        settings = parser_settings()
+
+        self.searchtype = searchtype or settings.search_type
         assert self.searchtype in self.search_types, 'search type "{}" is not supported in {}'.format(
             self.searchtype,
             self.__class__.__name__
         )
 
-        self.query = query
+        self.fields = field_projection(settings.parse_fields if fields is None else fields)
+        self.variant_order = settings.variant_order
+        self.stop_after_productive_variant = settings.stop_after_productive_variant
+        self.preclean_html = settings.preclean_html
+
+        # the precompiled selectors of the parser class
+        self.selectors = self.compiled_selectors()
+        self.scoped_selectors = self.scoped_feature_selectors()
+
+        self.reset(query=query, encoding=encoding)
         self.html = html
+
+        if self.html:
+            self.parse()
+
+    def reset(self, query='', encoding=None):
+        """Forget the parsed page, such that the parser can parse the next one.
+
+        The settings of the parser are kept. The dom of the previous page is
+        released, the results of the previous page are left to whoever holds them.
+
+        Args:
+            query: The query of the next page.
+            encoding: The encoding of the html of the next page if it is given as bytes.
+        """
+        self.query = query
+        self.html = None
+        self.encoding = encoding
         self.dom = None
         self.search_results = {}
         self.num_results_for_query = ''
@@ -150,6 +776,7 @@ class Parser():
         self.effective_query = ''
         self.page_number = -1
         self.no_results = False
+        self.no_results_text = None
         self.autocorrect = None
         self.autocorrect_forced_check = None
         self.map_result = False
@@ -157,38 +784,34 @@ class Parser():
         self.image_mega_block = False
         self.answer_box = False
         self.knowledge_graph_box = False
-        self.knowledge_graph_title = None
-        self.knowledge_graph_google_star_rating = None
-        self.knowledge_graph_google_star_rating_numbers = None
-        self.knowledge_graph_google_star_rating_big = None
-        self.knowledge_graph_google_star_rating_numbers_big = None
-        self.knowledge_graph_subtitle = None
-        self.knowledge_graph_location_subtitle = None
-        self.knowledge_graph_snippet = None
-        self.knowledge_graph_location_snippet = None
-        self.knowledge_graph_google_plus_recent_post = None
-        self.knowledge_graph_map = False
-        self.knowledge_graph_thumbnail = False
-        self.knowledge_graph_google_images_scrapbook = False
-        self.knowledge_graph_ad = False
-
-        # to be set by the implementing sub classes
-        self.search_engine = ''
-
-        # short alias because we use it so extensively
-        self.css_to_xpath = HTMLTranslator().css_to_xpath
 
-        if self.html:
-            self.parse()
+        for attribute in self.lazy_features:
+            self.__dict__.pop(attribute, None)
+
+        # the matches of the selectors on the dom
+        self._dom_matches = {}
+        self._dom_containers = {}
+        # whether the dom was built from the html without scripts, styles and comments
+        self._dom_precleaned = False
+
+        # the parser of the chunks passed to feed() and the trailing incomplete tag
+        self._feed_parser = None
+        self._feed_tail = b''
+
+        # where to record the selector evaluations, if they are recorded
+        self.stats = selector_stats if selector_stats.enabled else None
 
-    def parse(self, html=None):
+    def parse(self, html=None, encoding=None):
         """Public function to start parsing the search engine results.
 
         Args:
             html: The raw html data to extract the SERP entries from.
+            encoding: The encoding of the html if it is given as bytes.
         """
         if html:
             self.html = html
+        if encoding:
+            self.encoding = encoding
 
         # lets do the actual parsing
         self._parse()
@@ -198,12 +821,48 @@ class Parser():
         # the parsed data uniquely.
         self.after_parsing()
 
+    def feed(self, data, encoding=None):
+        """Parse the next chunk of the raw html, for instance while the response downloads.
+
+        Once all chunks are fed, call parse() with the complete html. The dom is then
+        taken from the fed chunks instead of parsing the html again, the html itself is
+        still needed by the checks after parsing.
+
+        Args:
+            data: The next chunk of the html as bytes.
+            encoding: The encoding of the html. Only considered for the first chunk.
+        """
+        if self._feed_parser is None:
+            if encoding:
+                self.encoding = encoding
+            self._feed_parser = lxml.html.HTMLParser(encoding=self.encoding or 'utf-8')
+            self._feed_tail = b''
+
+        # libxml2 loses end tags that are split between two chunks, so only complete
+        # tags are fed and the rest of the chunk waits for the next one
+        data = self._feed_tail + data
+        end = data.rfind(b'>') + 1
+        self._feed_tail = data[end:]
+        if end:
+            self._feed_parser.feed(data[:end])
+
     def _parse_lxml(self, cleaner=None):
         try:
-            parser = lxml.html.HTMLParser(encoding='utf-8')
-            if cleaner:
-                self.dom = cleaner.clean_html(self.dom)
-            self.dom = lxml.html.document_fromstring(self.html, parser=parser)
+            if self._feed_parser is not None:
+                # the html was fed in chunks already
+                feed_parser, self._feed_parser = self._feed_parser, None
+                if self._feed_tail:
+                    feed_parser.feed(self._feed_tail)
+                self.dom = feed_parser.close()
+                self._dom_precleaned = False
+            else:
+                # raw bytes are decoded by libxml2 itself
+                parser = lxml.html.HTMLParser(encoding=self.encoding or 'utf-8')
+                if cleaner:
+                    self.dom = cleaner.clean_html(self.dom)
+                html = strip_bloat(self.html) if self.preclean_html else self.html
+                self.dom = lxml.html.document_fromstring(html, parser=parser)
+                self._dom_precleaned = self.preclean_html
             self.dom.resolve_base_href()
         except Exception as e:
             # maybe wrong encoding
@@ -216,6 +875,14 @@ class Parser():
         """
         self._parse_lxml(cleaner)
 
+        # the matches of the selectors on the dom, each selector is evaluated once per parse
+        self._dom_matches = {}
+        self._dom_containers = {}
+
+        # forget the lazy features of the previous dom
+        for attribute in self.lazy_features:
+            self.__dict__.pop(attribute, None)
+
         # try to parse the number of results.
         attr_name = self.searchtype + '_search_selectors'
         selector_dict = getattr(self, attr_name, None)
@@ -223,61 +890,35 @@ class Parser():
         # get the appropriate css selectors for the num_results for the keyword
         num_results_selector = getattr(self, 'num_results_search_selectors', None)
 
-        self.num_results_for_query = self.first_match(num_results_selector, self.dom)
+        self.num_results_for_query = self.first_dom_match(num_results_selector)
         if not self.num_results_for_query:
             out('{}: Cannot parse num_results from serp page with selectors {}'.format(self.__class__.__name__,
                                                                                        num_results_selector), lvl=4)
 
         # get the current page we are at. Sometimes we search engines don't show this.
         try:
-            self.page_number = int(self.first_match(self.page_number_selectors, self.dom))
+            self.page_number = int(self.first_dom_match(self.page_number_selectors))
         except ValueError:
             self.page_number = -1
 
         # let's see if the search query was shitty (no results for that query)
-        self.effective_query = self.first_match(self.effective_query_selector, self.dom)
+        self.effective_query = self.first_dom_match(self.effective_query_selector)
         if self.effective_query:
             out('{}: There was no search hit for the search query. Search engine used {} instead.'.format(
                 self.__class__.__name__, self.effective_query), lvl=4)
 
         # the element that notifies the user about no results.
-        self.no_results_text = self.first_match(self.no_results_selector, self.dom)
-
-        # check for autocorrect results
-        if self.first_match(self.autocorrect_selector, self.dom) != '' and self.first_match(self.autocorrect_selector, self.dom) != False:
-            self.autocorrect = self.first_match(self.autocorrect_selector, self.dom)
-        if self.first_match(self.autocorrect_forced_check_selector, self.dom) != '' and self.first_match(self.autocorrect_forced_check_selector, self.dom) != False:
-            self.autocorrect_forced_check = self.first_match(self.autocorrect_forced_check_selector, self.dom)
-
-        # check for a map result
-        if self.first_match(self.map_selector, self.dom) != False:
-            self.map_result = True
-
-        # check for image results
-        if self.first_match(self.image_mega_block_selector, self.dom) != False:
-            self.image_mega_block = True
-        elif self.first_match(self.image_results_selector, self.dom) != False:
-            self.image_results = True
-
-        # check for answer box
-        if self.first_match(self.answer_box_selector, self.dom) != False or self.first_match(self.answer_box_multi_selector, self.dom) != False or self.first_match(self.answer_box_google_flight_selector, self.dom) != False:
-            self.answer_box = True
-
-        self.knowledge_graph_box = (True if self.first_match(self.knowledge_graph_title_selector, self.dom) != False else False)
-        self.knowledge_graph_title = self.first_match(self.knowledge_graph_title_selector, self.dom)
-        self.knowledge_graph_google_star_rating = (self.first_match(self.knowledge_graph_google_star_rating_selector, self.dom) if self.first_match(self.knowledge_graph_google_star_rating_selector, self.dom) != False else None)
-        self.knowledge_graph_google_star_rating_numbers = (self.first_match(self.knowledge_graph_google_star_rating_numbers_selector, self.dom) if self.first_match(self.knowledge_graph_google_star_rating_numbers_selector, self.dom) != False else None)
-        self.knowledge_graph_google_star_rating_big = (self.first_match(self.knowledge_graph_google_star_rating_big_selector, self.dom) if self.first_match(self.knowledge_graph_google_star_rating_big_selector, self.dom) != False else None)
-        self.knowledge_graph_google_star_rating_numbers_big = (self.first_match(self.knowledge_graph_google_star_rating_numbers_big_selector, self.dom) if self.first_match(self.knowledge_graph_google_star_rating_numbers_big_selector, self.dom) != False else None)
-        self.knowledge_graph_subtitle = (self.first_match(self.knowledge_graph_subtitle_selector, self.dom) if self.first_match(self.knowledge_graph_subtitle_selector, self.dom) != False else None)
-        self.knowledge_graph_location_subtitle = (self.first_match(self.knowledge_graph_location_subtitle_selector, self.dom) if self.first_match(self.knowledge_graph_location_subtitle_selector, self.dom) != False else None)
-        self.knowledge_graph_snippet = (self.first_match(self.knowledge_graph_snippet_selector, self.dom) if self.first_match(self.knowledge_graph_snippet_selector, self.dom) != False else None)
-        self.knowledge_graph_location_snippet = (self.first_match(self.knowledge_graph_location_snippet_selector, self.dom) if self.first_match(self.knowledge_graph_location_snippet_selector, self.dom) != False else None)
-        self.knowledge_graph_google_plus_recent_post = (self.first_match(self.knowledge_graph_google_plus_recent_post_selector, self.dom) if self.first_match(self.knowledge_graph_google_plus_recent_post_selector, self.dom) != False else None)
-        self.knowledge_graph_map = (True if self.first_match(self.knowledge_graph_map_selector, self.dom) != False else False)
-        self.knowledge_graph_thumbnail = (True if self.first_match(self.knowledge_graph_thumbnail_selector, self.dom) != False else False)
-        self.knowledge_graph_google_images_scrapbook = (True if self.first_match(self.knowledge_graph_google_images_scrapbook_selector, self.dom) != False else False)
-        self.knowledge_graph_ad = (True if self.first_match(self.knowledge_graph_ad_selector, self.dom) != False else False)
+        self.no_results_text = self.first_dom_match(self.no_results_selector)
+
+        # the serp features like autocorrect, answer boxes and the knowledge graph
+        for attribute, _, _ in self.feature_table:
+            if attribute in self.lazy_features or not self.wants(attribute):
+                continue
+            setattr(self, attribute, self.parse_feature(attribute))
+
+        # image results are hidden in the mega block if there is one
+        if self.image_mega_block:
+            self.image_results = False
 
         # get the stuff that is of interest in SERP pages.
         if not selector_dict and not isinstance(selector_dict, dict):
@@ -285,64 +926,214 @@ class Parser():
 
         for result_type, selector_class in selector_dict.items():
 
+            if not self.wants(result_type):
+                continue
+
             self.search_results[result_type] = []
 
-            for selector_specific, selectors in selector_class.items():
+            identity_keys = self.result_identity_keys.get(result_type, self.default_identity_keys)
+            seen = {key: set() for key, _ in identity_keys}
 
-                if 'result_container' in selectors and selectors['result_container']:
-                    css = '{container} {result_container}'.format(**selectors)
-                else:
-                    css = selectors['container']
+            # the requested fields, the identity keys are needed to detect duplicates
+            # and after_parsing() needs its own fields
+            requested = self.fields.get(result_type) if self.fields else None
+            if requested is not None:
+                requested = requested | {key for key, _ in identity_keys} | \
+                    self.after_parsing_fields.get(result_type, set())
 
-                results = self.dom.xpath(
-                    self.css_to_xpath(css)
-                )
+            variants = self.extraction_plans(result_type, selector_class, requested)
+            recent_variants = self.recent_variants()
 
-                to_extract = set(selectors.keys()) - {'container', 'result_container'}
-                selectors_to_use = {key: selectors[key] for key in to_extract if key in selectors.keys()}
+            # try the variant that yielded results for the last page first
+            if self.variant_order == 'adaptive' and recent_variants.get(result_type) in selector_class:
+                variants.sort(key=lambda variant: variant[0] != recent_variants[result_type])
 
-                for index, result in enumerate(results):
-                    # Let's add primitive support for CSS3 pseudo selectors
-                    # We just need two of them
-                    # ::text
-                    # ::attr(attribute)
-
-                    # You say we should use xpath expressions instead?
-                    # Maybe you're right, but they are complicated when it comes to classes,
-                    # have a look here: http://doc.scrapy.org/en/latest/topics/selectors.html
-                    serp_result = {}
-                    # key are for example 'link', 'snippet', 'visible-url', ...
-                    # selector is the selector to grab these items
-                    for key, selector in selectors_to_use.items():
-                        serp_result[key] = self.advanced_css(selector, result)
+            productive = False
+            for selector_specific, plan in variants:
+
+                num_before = len(self.search_results[result_type])
+
+                results = self.css_select(plan.results_selector, self.dom)
 
+                for index, result in enumerate(results):
+                    serp_result = self.extract_fields(plan, result)
                     serp_result['rank'] = index + 1
 
                     # only add items that have not None links.
                     # Avoid duplicates. Detect them by the link.
                     # Except for local pack results - detect those by their address
-                    # If statements below: Lazy evaluation. The more probable case first.
-                    if result_type == 'local_pack_results' and 'address' in serp_result and serp_result['address'] and \
-                            not [e for e in self.search_results[result_type] if e['address'] == serp_result['address']]:
-                        self.search_results[result_type].append(serp_result)
-                        self.num_results += 1
+                    # The values of the identity keys of the added results are kept
+                    # in sets, such that a duplicate check doesn't scan the results.
+                    for key, counted in identity_keys:
+                        value = serp_result.get(key)
+                        if value and value not in seen[key]:
+                            self.search_results[result_type].append(serp_result)
+                            for seen_key, seen_values in seen.items():
+                                if seen_key in serp_result:
+                                    seen_values.add(serp_result[seen_key])
+                            if counted:
+                                self.num_results += 1
+                            break
+
+                if len(self.search_results[result_type]) > num_before:
+                    # learn the first productive variant, the later ones only add to its results
+                    if not productive:
+                        recent_variants[result_type] = selector_specific
+                        productive = True
+                    if self.stop_after_productive_variant:
+                        break
+
+    def extraction_plans(self, result_type, selector_class, requested):
+        """Get the extraction plans of the selector variants of a result type.
+
+        A variant with the same results selector and the same selectors for the
+        identity keys as an earlier variant can only yield duplicates, so it is left
+        out. The plans are built once per parser class.
+
+        Args:
+            result_type: The result type, like organic_results.
+            selector_class: The selector variants of the result type.
+            requested: The fields to extract or None for all fields.
+
+        Returns:
+            A list of (variant name, ExtractionPlan) pairs in the declared order.
+        """
+        plans = self._class_cache('_extraction_plans', dict)
+        key = (self.searchtype, result_type, None if requested is None else frozenset(requested))
+
+        try:
+            return plans[key]
+        except KeyError:
+            pass
+
+        identity_keys = [identity_key for identity_key, _ in
+                         self.result_identity_keys.get(result_type, self.default_identity_keys)]
+        variants, identities = [], set()
+
+        # one record class for all variants of the result type
+        fields = []
+        for selectors in selector_class.values():
+            for field in selectors:
+                if field not in fields and field not in ('container', 'result_container') and \
+                        (requested is None or field in requested):
+                    fields.append(field)
+        record = serp_item_class(sorted(fields) + ['rank'])
+
+        for name, selectors in selector_class.items():
+            results_selector = self.results_selector(selectors)
+            identity = (results_selector,) + tuple(selectors.get(identity_key) for identity_key in identity_keys)
+            if identity in identities:
+                continue
+            identities.add(identity)
+
+            # Let's add primitive support for CSS3 pseudo selectors
+            # We just need two of them
+            # ::text
+            # ::attr(attribute)
+            # Fields like the link and the title of a result often target the same element.
+            groups = {}
+            for field, selector in selectors.items():
+                if field in ('container', 'result_container') or (requested is not None and field not in requested):
+                    continue
+                css, _ = split_pseudo_element(selector)
+                groups.setdefault(css, []).append((record.index[field], self.compiled(selector)))
+
+            groups = [FieldGroup(self.compiled(css), fields) for css, fields in groups.items()]
+            variants.append((name, ExtractionPlan(results_selector, groups, record)))
+
+        plans[key] = variants
+        return variants
+
+    def extract_fields(self, plan, element):
+        """Extract the fields of a single result.
+
+        Args:
+            plan: The ExtractionPlan of the selector variant that targeted the result.
+            element: The element of the result.
+
+        Returns:
+            A SerpItem with the fields of the result, like 'link', 'snippet', 'visible_link', ...
+        """
+        serp_result = plan.record()
+
+        for group in plan.groups:
+            matches = self.select(group.element, element)
+            if matches:
+                for position, compiled in group.fields:
+                    serp_result._values[position] = extract_value(compiled, matches[0])
+
+        return serp_result
+
+    def parse_feature(self, attribute):
+        """Parse the serp feature of the feature table from the dom.
 
-                    elif result_type == 'knowledge_graph_trivia' and 'title' in serp_result and serp_result['title'] and \
-                            not [e for e in self.search_results[result_type] if e['title'] == serp_result['title']]:
-                        self.search_results[result_type].append(serp_result)
+        Args:
+            attribute: The attribute of the feature.
+
+        Returns:
+            The value of the feature.
+        """
+        for name, selector_names, coerce in self.feature_table:
+            if name == attribute:
+                selectors = [selector for selector_name in selector_names for selector in getattr(self, selector_name)]
+                return coerce(self.first_dom_match(selectors))
 
-                    elif result_type == 'knowledge_graph_trivia' and 'link_title' in serp_result and serp_result['link_title'] and \
-                            not [e for e in self.search_results[result_type] if e['link_title'] == serp_result['link_title']]:
-                        self.search_results[result_type].append(serp_result)
+        raise ValueError('{} has no serp feature {}'.format(self.__class__.__name__, attribute))
 
-                    elif result_type == 'knowledge_graph_trivia' and 'hours_title' in serp_result and serp_result['hours_title'] and \
-                            not [e for e in self.search_results[result_type] if e['hours_title'] == serp_result['hours_title']]:
-                        self.search_results[result_type].append(serp_result)
+    def __getattr__(self, name):
+        """Parse the lazy serp features on first access and keep their values."""
+        try:
+            value = self.lazy_features[name]
+        except KeyError:
+            raise AttributeError("'{}' object has no attribute '{}'".format(self.__class__.__name__, name))
 
-                    elif 'link' in serp_result and serp_result['link'] and \
-                            not [e for e in self.search_results[result_type] if e['link'] == serp_result['link']]:
-                        self.search_results[result_type].append(serp_result)
-                        self.num_results += 1
+        if self.dom is not None and self.wants(name):
+            value = self.parse_feature(name)
+
+        self.__dict__[name] = value
+        return value
+
+    def wants(self, name):
+        """Whether the result type or serp feature is parsed according to the field projection."""
+        if self.fields is None:
+            return True
+
+        return any(name == entry or name.startswith(entry + '_') for entry in self.fields)
+
+    def compiled(self, selector):
+        """Get the compiled form of a css selector.
+
+        Selectors that the parser class doesn't declare are compiled on the fly
+        and added to the registry of the class.
+        """
+        try:
+            return self.selectors[selector]
+        except KeyError:
+            compiled = self.selectors[selector] = compile_selector(selector)
+            return compiled
+
+    def css_select(self, selector, element):
+        """Get all elements that the css selector targets within the element."""
+        return self.select(self.compiled(selector), element)
+
+    def select(self, compiled, element, selector=None):
+        """Evaluate a compiled selector on the element and record the evaluation if stats are enabled.
+
+        Args:
+            compiled: A CompiledSelector.
+            element: The element on which to apply the selector.
+            selector: The name to record the evaluation under. By default the css of the selector.
+
+        Returns:
+            All targeted elements.
+        """
+        if self.stats is None:
+            return compiled.xpath(element)
+
+        started = time.perf_counter()
+        matches = compiled.xpath(element)
+        self.stats.record(self.__class__.__name__, selector or compiled.css, time.perf_counter() - started, matches)
+        return matches
 
     def advanced_css(self, selector, element):
         """Evaluate the :text and ::attr(attr-name) additionally.
@@ -355,29 +1146,14 @@ class Parser():
             The targeted element.
 
         """
-        value = None
+        compiled = self.compiled(selector)
 
-        if selector.endswith('::text'):
-            try:
-                value = element.xpath(self.css_to_xpath(selector.split('::')[0]))[0].text_content()
-            except IndexError:
-                pass
-        else:
-            match = re.search(r'::attr\((?P<attr>.*)\)$', selector)
+        try:
+            match = self.select(compiled, element)[0]
+        except IndexError:
+            return None
 
-            if match:
-                attr = match.group('attr')
-                try:
-                    value = element.xpath(self.css_to_xpath(selector.split('::')[0]))[0].get(attr)
-                except IndexError:
-                    pass
-            else:
-                try:
-                    value = element.xpath(self.css_to_xpath(selector))[0].text_content()
-                except IndexError:
-                    pass
-
-        return value
+        return extract_value(compiled, match)
 
     def first_match(self, selectors, element):
         """Get the first match.
@@ -402,6 +1178,50 @@ class Parser():
 
         return False
 
+    def first_dom_match(self, selectors):
+        """Get the first match of the selectors on the whole dom.
+
+        Works like first_match(), but memoizes the match of each selector, such
+        that selectors shared by several features are evaluated only once per dom.
+
+        Args:
+            selectors: The selectors to test for a match.
+
+        Returns:
+            The very first match or False if all selectors didn't match anything.
+        """
+        assert isinstance(selectors, list), 'selectors must be of type list!'
+
+        for selector in selectors:
+            if selector:
+                try:
+                    match = self._dom_matches[selector]
+                except KeyError:
+                    match = self._dom_matches[selector] = self._match_on_dom(selector)
+                if match is not None:
+                    return match
+
+        return False
+
+    def _match_on_dom(self, selector):
+        """Get the value of the selector on the dom, within its container if it has one."""
+        scoped = self.scoped_selectors.get(selector)
+
+        if scoped is None:
+            return self.advanced_css(selector, element=self.dom)
+
+        try:
+            containers = self._dom_containers[scoped.container]
+        except KeyError:
+            containers = self._dom_containers[scoped.container] = self.css_select(scoped.container, self.dom)
+
+        for container in containers:
+            match = self.select(scoped.relative, container, selector)
+            if match:
+                return extract_value(scoped.relative, match[0])
+
+        return None
+
     def after_parsing(self):
         """Subclass specific behaviour after parsing happened.
 
@@ -409,6 +1229,21 @@ class Parser():
         Commonly used to clean the results.
         """
 
+    def parse_result(self):
+        """Get the parsed data as a ParseResult.
+
+        Unlike the parser, the ParseResult holds no dom and can be pickled. The details
+        of the knowledge graph are only parsed if the page has a knowledge graph box,
+        otherwise they keep their values before parsing.
+        """
+        has_knowledge_graph = self.knowledge_graph_box
+
+        return ParseResult(**{
+            field: (getattr(self, field) if has_knowledge_graph or field not in self.lazy_features
+                    else self.lazy_features[field])
+            for field in ParseResult._fields
+        })
+
     def __str__(self):
         """Return a nicely formatted overview of the results."""
         return pprint.pformat(self.search_results)
@@ -416,15 +1251,16 @@ class Parser():
     @property
     def cleaned_html(self):
         # Try to parse the provided HTML string using lxml
-        # strip all unnecessary information to save space
+        # strip all unnecessary information to save space.
+        # A dom built with preclean_html has no scripts, styles and comments left to remove,
+        # the Cleaner only runs its other passes on it. The dom itself is left untouched.
+        assert self.dom is not None and len(self.dom), 'The html needs to be parsed to get the cleaned html'
         cleaner = Cleaner()
-        cleaner.scripts = True
+        cleaner.scripts = not self._dom_precleaned
         cleaner.javascript = True
-        cleaner.comments = True
-        cleaner.style = True
-        self.dom = cleaner.clean_html(self.dom)
-        assert len(self.dom), 'The html needs to be parsed to get the cleaned html'
-        return lxml.html.tostring(self.dom)
+        cleaner.comments = not self._dom_precleaned
+        cleaner.style = not self._dom_precleaned
+        return lxml.html.tostring(cleaner.clean_html(self.dom))
 
     def iter_serp_items(self):
         """Yields the key and index of any item in the serp results that has a link value"""
@@ -432,7 +1268,7 @@ class Parser():
         for key, value in self.search_results.items():
             if isinstance(value, list):
                 for i, item in enumerate(value):
-                    if isinstance(item, dict) and item['link']:
+                    if isinstance(item, (dict, SerpItem)) and item.get('link'):
                         yield (key, i)
 
 
@@ -957,15 +1793,22 @@ class GoogleParser(Parser):
             elif self.num_results <= 0:
                 self.no_results = True
 
-            if 'No results found for' in self.html or 'did not match any documents' in self.html:
+            # cached pages are read as bytes
+            needles = ('No results found for', 'did not match any documents')
+            if isinstance(self.html, bytes):
+                needles = tuple(needle.encode() for needle in needles)
+
+            if any(needle in self.html for needle in needles):
                 self.no_results = True
 
             # finally try in the snippets
             if self.no_results is True:
                 for key, i in self.iter_serp_items():
 
-                    if 'snippet' in self.search_results[key][i] and self.query:
-                        if self.query.replace('"', '') in self.search_results[key][i]['snippet']:
+                    # the snippet is None if not found and missing if not parsed
+                    snippet = self.search_results[key][i].get('snippet')
+                    if snippet and self.query:
+                        if self.query.replace('"', '') in snippet:
                             self.no_results = False
 
         clean_regexes = {
@@ -982,6 +1825,141 @@ class GoogleParser(Parser):
                 self.search_results[key][i]['link'] = unquote(result.group('url'))
 
 
+class GoogleLiteParser(GoogleParser):
+    """Parses the organic results of Google SERP pages with regular expressions.
+
+    Made for rank tracking: Only the ordered organic results (link, title and visible link),
+    the result stats and the page number are extracted from the raw html. No dom is built
+    and no css selector is evaluated. The serp features keep their defaults and num_results
+    counts the organic results only.
+
+    The expressions follow the organic_results selectors of GoogleParser. Select it
+    with the google_parser_backend option.
+    """
+
+    search_types = ['normal']
+
+    # the fields of the organic results, in the order of the records of GoogleParser
+    lite_fields = ('link', 'title', 'visible_link')
+
+    lite_regexes = {
+        'center_col': html_regexes(r'\bid="center_col"'),
+        'right_hand_side': html_regexes(r'\bid="rhs"'),
+        # the candidates for result containers, li elements with the class g
+        'result_container': html_regexes(r'<li\b([^>]*\bclass="(?:[^"]*\s)?g(?:\s[^"]*)?"[^>]*)>'),
+        'class': html_regexes(r'\bclass="([^"]*)"'),
+        'id': html_regexes(r'\bid="([^"]*)"'),
+        'link': html_regexes(r'<h3\b[^>]*\bclass="(?:[^"]*\s)?r(?:\s[^"]*)?"[^>]*>\s*<a\b([^>]*)>(.*?)</a\s*>',
+                             re.IGNORECASE | re.DOTALL),
+        'href': html_regexes(r'\bhref="([^"]*)"'),
+        'visible_link': html_regexes(r'<cite\b[^>]*>(.*?)</cite\s*>', re.IGNORECASE | re.DOTALL),
+        'result_stats': html_regexes(r'\bid="resultStats"[^>]*>(.*?)</div\s*>', re.DOTALL),
+        'page_number': html_regexes(r'<td\b[^>]*\bclass="cur"[^>]*>(.*?)</td\s*>', re.DOTALL),
+        'tag': html_regexes(r'<[^>]*>'),
+    }
+
+    def feed(self, data, encoding=None):
+        """Take the next chunk of the raw html.
+
+        Without a dom there is nothing to build while the response downloads,
+        parse() extracts the results from the complete html.
+        """
+        if encoding and self.encoding is None:
+            self.encoding = encoding
+
+    @property
+    def cleaned_html(self):
+        # there is no dom to clean, the scripts, styles and comments are removed from the raw html
+        return strip_bloat(self.html)
+
+    def _parse(self, cleaner=None):
+        """Extract the organic results and the result stats from the raw html.
+
+        Raises: InvalidSearchTypeException for search types other than normal.
+        """
+        if self.searchtype not in self.search_types:
+            raise InvalidSearchTypeException('The lite parser only parses normal searches')
+
+        html = strip_bloat(self.html) if self.preclean_html else self.html
+        regexes = {name: compiled[type(html)] for name, compiled in self.lite_regexes.items()}
+
+        # like first_dom_match(), False if the page doesn't have them
+        self.num_results_for_query = self.first_regex_text(regexes['result_stats'], html)
+        try:
+            self.page_number = int(self.first_regex_text(regexes['page_number'], html))
+        except ValueError:
+            self.page_number = -1
+
+        if not self.wants('organic_results'):
+            return
+
+        requested = self.fields.get('organic_results') if self.fields else None
+        record = serp_item_class(sorted(field for field in self.lite_fields
+                                        if requested is None or field in requested or field == 'link') + ['rank'])
+        results = self.search_results['organic_results'] = []
+
+        # the result containers within #center_col, the knowledge graph in #rhs follows it
+        center_col = regexes['center_col'].search(html)
+        if center_col is None:
+            return
+        right_hand_side = regexes['right_hand_side'].search(html, center_col.end())
+        end = right_hand_side.start() if right_hand_side else len(html)
+
+        # a result reaches until the next candidate starts
+        candidates = [(match.start(), match.group(1))
+                      for match in regexes['result_container'].finditer(html, center_col.end(), end)]
+        bounds = [start for start, _ in candidates[1:]] + [end]
+
+        seen = set()
+        rank = 0
+
+        for (start, attributes), stop in zip(candidates, bounds):
+            if self.excluded_container(regexes, attributes):
+                continue
+            rank += 1
+
+            anchor = regexes['link'].search(html, start, stop)
+            href = regexes['href'].search(anchor.group(1)) if anchor else None
+            link = self.regex_text(href.group(1)) if href else None
+
+            # only results with a link, duplicates are detected by the link
+            if not link or link in seen:
+                continue
+            seen.add(link)
+
+            serp_result = record()
+            serp_result['link'] = link
+            serp_result['rank'] = rank
+            if 'title' in record.index:
+                serp_result['title'] = self.regex_text(anchor.group(2))
+            if 'visible_link' in record.index:
+                visible_link = regexes['visible_link'].search(html, start, stop)
+                serp_result['visible_link'] = self.regex_text(visible_link.group(1)) if visible_link else None
+
+            results.append(serp_result)
+            self.num_results += 1
+
+    def excluded_container(self, regexes, attributes):
+        """Whether a li.g element is left out by the result_container selector of GoogleParser."""
+        classes = regexes['class'].search(attributes)
+        classes = set(self.regex_text(classes.group(1)).split()) if classes else set()
+        identifier = regexes['id'].search(attributes)
+
+        return ('card-section' in classes or 'no-sep' in classes or {'mnr-c', 'g-blk'} <= classes or
+                (identifier is not None and self.regex_text(identifier.group(1)) == 'imagebox_bigimages'))
+
+    def first_regex_text(self, regex, html):
+        """Get the text of the first match of the regex, False if it doesn't match."""
+        match = regex.search(html)
+        return self.regex_text(match.group(1)) if match else False
+
+    def regex_text(self, value):
+        """Get the text content of a piece of raw html, like the text_content() of an element."""
+        if isinstance(value, bytes):
+            value = value.decode(self.encoding or 'utf-8', errors='replace')
+        return unescape(self.lite_regexes['tag'][str].sub('', value))
+
+
 class YandexParser(Parser):
     """Parses SERP pages of the Yandex search engine."""
 
@@ -1266,6 +2244,9 @@ class YahooParser(Parser):
     # yahooo doesn't have such a thing :D
     effective_query_selector = ['']
 
+    # results without a visible link are removed in after_parsing()
+    after_parsing_fields = {'results': {'visible_link'}}
+
     num_results_search_selectors = ['#pg > span:last-child']
 
     page_number_selectors = ['#pg > strong::text']
@@ -1364,7 +2345,7 @@ class YahooParser(Parser):
             if self.num_results == 0:
                 self.no_results = True
 
-            if len(self.dom.xpath(self.css_to_xpath('#cquery'))) >= 1:
+            if len(self.css_select('#cquery', self.dom)) >= 1:
                 self.no_results = True
 
             for key, i in self.iter_serp_items():
@@ -1488,7 +2469,7 @@ class BaiduParser(Parser):
         super().after_parsing()
 
         if self.search_engine == 'normal':
-            if len(self.dom.xpath(self.css_to_xpath('.hit_top_new'))) >= 1:
+            if len(self.css_select('.hit_top_new', self.dom)) >= 1:
                 self.no_results = True
 
         if self.searchtype == 'image':
@@ -1583,7 +2564,7 @@ class DuckduckgoParser(Parser):
         if self.searchtype == 'normal':
 
             try:
-                if 'No more results.' in self.dom.xpath(self.css_to_xpath('.no-results'))[0].text_content():
+                if 'No more results.' in self.css_select('.no-results', self.dom)[0].text_content():
                     self.no_results = True
             except:
                 pass
@@ -1748,35 +2729,23 @@ def get_parser_by_url(url):
     Raises:
         UnknowUrlException if no parser could be found for the url.
     """
-    parser = None
-
-    if re.search(r'^http[s]?://www\.google', url):
-        parser = GoogleParser
-    elif re.search(r'^http://yandex\.ru', url):
-        parser = YandexParser
-    elif re.search(r'^http://www\.bing\.', url):
-        parser = BingParser
-    elif re.search(r'^http[s]?://search\.yahoo.', url):
-        parser = YahooParser
-    elif re.search(r'^http://www\.baidu\.com', url):
-        parser = BaiduParser
-    elif re.search(r'^https://duckduckgo\.com', url):
-        parser = DuckduckgoParser
-    if re.search(r'^http[s]?://[a-z]{2}?\.ask', url):
-        parser = AskParser
-    if re.search(r'^http[s]?://blekko', url):
-        parser = BlekkoParser
-    if not parser:
+    search_engine = search_engine_by_url(url)
+    if not search_engine:
         raise UnknowUrlException('No parser for {}.'.format(url))
 
-    return parser
+    return get_parser_by_search_engine(search_engine, backend='dom')
 
 
-def get_parser_by_search_engine(search_engine):
+def get_parser_by_search_engine(search_engine, backend=None):
     """Get the appropriate parser for the search_engine
 
+    The parser is looked up in the search engine registry.
+
     Args:
         search_engine: The name of a search_engine.
+        backend: The parser backend, dom for the css selectors on the dom or lite for
+                 the regular expressions of the lite parsers. By default the
+                 {search_engine}_parser_backend option of the config or dom.
 
     Returns:
         A parser for the search_engine
@@ -1784,27 +2753,166 @@ def get_parser_by_search_engine(search_engine):
     Raises:
         NoParserForSearchEngineException if no parser could be found for the name.
     """
-    if search_engine == 'google' or search_engine == 'googleimg':
-        return GoogleParser
-    elif search_engine == 'yandex':
-        return YandexParser
-    elif search_engine == 'bing':
-        return BingParser
-    elif search_engine == 'yahoo':
-        return YahooParser
-    elif search_engine == 'baidu' or search_engine == 'baiduimg':
-        return BaiduParser
-    elif search_engine == 'duckduckgo':
-        return DuckduckgoParser
-    elif search_engine == 'ask':
-        return AskParser
-    elif search_engine == 'blekko':
-        return BlekkoParser
-    else:
+    if backend is None:
+        backend = Config['SCRAPING'].get('{}_parser_backend'.format(search_engine), 'dom')
+
+    parser = get_part(search_engine, 'lite_parser' if backend == 'lite' else 'parser')
+
+    if parser is None and backend == 'lite':
+        raise NoParserForSearchEngineException('No lite parser for {}'.format(search_engine))
+    elif parser is None:
         raise NoParserForSearchEngineException('No such parser for {}'.format(search_engine))
 
+    return parser
+
+
+class ParserPool(threading.local):
+    """The parsers of the current thread, one per search engine.
+
+    Workers parse one page after the other, so instead of creating a parser
+    for every page, they reuse the parser of their thread for their whole job list.
+    A parser keeps the settings it was created with, so it is replaced when the
+    parser settings of the config change.
+    """
 
-def parse_serp(html=None, parser=None, scraper=None, search_engine=None, query=''):
+    def __init__(self):
+        self.parsers = {}
+        self.settings = {}
+
+    def get(self, search_engine, query=''):
+        """Get the parser of the thread for the search engine, reset for the next page.
+
+        The page that the parser parsed before is forgotten, so the parser must not
+        be used for it anymore.
+
+        Args:
+            search_engine: The name of a search engine.
+            query: The query of the next page.
+
+        Returns:
+            The parser for the search engine.
+        """
+        parser = self.parsers.get(search_engine)
+        parser_class = get_parser_by_search_engine(search_engine)
+        settings = parser_settings()
+
+        # the parser backend or the parser settings may have been changed in the config
+        if type(parser) is not parser_class or self.settings.get(search_engine) != settings:
+            parser = self.parsers[search_engine] = parser_class(query=query)
+            self.settings[search_engine] = settings
+        else:
+            parser.reset(query=query)
+
+        return parser
+
+
+parser_pool = ParserPool()
+
+
+# The parsed data of a serp page without the dom. It provides the attributes of the
+# parser that SearchEngineResultsPage.set_values_from_parser() reads.
+ParseResult = namedtuple('ParseResult', [
+    'query', 'search_engine', 'searchtype', 'search_results', 'num_results_for_query',
+    'num_results', 'effective_query', 'page_number', 'no_results', 'no_results_text', 'fields',
+] + [attribute for attribute, _, _ in Parser.feature_table])
+
+
+def _parse_batch(parser_class, options, batch, collect_stats=False):
+    """Parse a batch of (query, html) pairs. Runs in the worker processes of parse_many().
+
+    Returns:
+        The ParseResults of the batch, None for the pages that failed to parse, and the selector
+        stats of the batch if they are collected.
+    """
+    if collect_stats:
+        selector_stats.enable()
+        selector_stats.reset()
+
+    # one parser parses the whole batch
+    parser = parser_class(**options)
+    results = []
+
+    for query, html in batch:
+        # a broken page must not take the rest of the batch down
+        try:
+            parser.reset(query=query)
+            if html:
+                parser.parse(html)
+            results.append(parser.parse_result())
+        except Exception as e:
+            logger.error('Couldn\'t parse the page of the query "{}": {}'.format(query, e))
+            results.append(None)
+
+    return results, (selector_stats.snapshot() if collect_stats else None)
+
+
+def _batches(html_iter, batch_size):
+    """Group the items of parse_many() into lists of (query, html) pairs."""
+    batch = []
+    for item in html_iter:
+        if isinstance(item, (str, bytes)):
+            item = ('', item)
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_many(html_iter, search_engine, workers=None, searchtype=None, fields=None, batch_size=20):
+    """Parse many serp pages in parallel.
+
+    The pages are parsed in batches by a pool of worker processes. Only a few
+    batches per worker are in flight at any time, so html_iter may be a stream
+    of arbitrary length.
+
+    Args:
+        html_iter: An iterable of html documents or (query, html) pairs.
+        search_engine: The name of the search engine that served the pages.
+        workers: The number of worker processes. By default the number of cpus.
+                 With a single worker the pages are parsed in this process.
+        searchtype: The search type of the pages. By default the search_type of the config.
+        fields: The fields to parse, see field_projection(). By default the parse_fields of the config.
+        batch_size: The number of pages a worker parses per task.
+
+    Returns:
+        A generator of ParseResult objects in the order of html_iter. They can
+        be handed to parse_serp() or SearchEngineResultsPage.set_values_from_parser().
+        A page that fails to parse yields None, the error is logged.
+    """
+    # the workers don't depend on the config of this process
+    options = {
+        'searchtype': searchtype or Config['SCRAPING'].get('search_type', 'normal'),
+        'fields': Config['SCRAPING'].get('parse_fields', '') if fields is None else fields,
+    }
+    parser_class = get_parser_by_search_engine(search_engine)
+    workers = workers or os.cpu_count() or 1
+    batches = _batches(html_iter, batch_size)
+
+    if workers == 1:
+        for batch in batches:
+            yield from _parse_batch(parser_class, options, batch)[0]
+        return
+
+    def collect(future):
+        results, stats = future.result()
+        if stats:
+            selector_stats.merge(stats)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(_parse_batch, parser_class, options, batch, selector_stats.enabled))
+            if len(pending) >= 2 * workers:
+                yield from collect(pending.popleft())
+
+        while pending:
+            yield from collect(pending.popleft())
+
+
+def parse_serp(html=None, parser=None, scraper=None, search_engine=None, query='', session=None):
     """Store the parsed data in the sqlalchemy session.
 
     If no parser is supplied then we are expected to parse again with
@@ -1813,8 +2921,17 @@ def parse_serp(html=None, parser=None, scraper=None, search_engine=None, query='
     This function may be called from scraping and caching.
     When called from caching, some info is lost (like current page number).
 
+    With the skip_unchanged_serps option a page whose results are the same as the
+    latest stored SERP of the query isn't stored again. The stored SERP is returned
+    instead, it can be linked to the new ScraperSearch.
+
     Args:
-        TODO: A whole lot
+        html: The html to parse if no parser is given.
+        parser: A parser that parsed the page or a ParseResult of parse_many().
+        scraper: The scraper that requested the page.
+        search_engine: The search engine that served the html.
+        query: The query the page was requested with.
+        session: The sqlalchemy session to look up unchanged SERPs in.
 
     Returns:
         The parsed SERP object.
@@ -1830,10 +2947,15 @@ def parse_serp(html=None, parser=None, scraper=None, search_engine=None, query='
     if query:
         serp.query = query
 
-    if parser:
-        serp.set_values_from_parser(parser)
     if scraper:
         serp.set_values_from_scraper(scraper)
+    if parser:
+        fingerprint = serp_fingerprint(parser)
+        if session is not None and Config['GLOBAL'].getboolean('skip_unchanged_serps', False):
+            unchanged = serp.find_unchanged(session, fingerprint)
+            if unchanged is not None:
+                return unchanged
+        serp.set_values_from_parser(parser, fingerprint=fingerprint)
 
     return serp
 
@@ -1856,15 +2978,15 @@ if __name__ == '__main__':
     assert len(sys.argv) >= 2, 'Usage: {} url/file'.format(sys.argv[0])
     url = sys.argv[1]
     if os.path.exists(url):
-        raw_html = open(url, 'r').read()
+        raw_html = open(url, 'rb').read()
         parser = get_parser_by_search_engine(sys.argv[2])
     else:
-        raw_html = requests.get(url).text
+        raw_html = requests.get(url).content
         parser = get_parser_by_url(url)
 
     parser = parser(raw_html)
     parser.parse()
     print(parser)
 
-    with open('/tmp/testhtml.html', 'w') as of:
+    with open('/tmp/testhtml.html', 'wb') as of:
         of.write(raw_html)
@@ -9,11 +9,12 @@ import abc
 
 from GoogleScraper.proxies import Proxy
 from GoogleScraper.caching import cache_results
-from GoogleScraper.database import db_Proxy
+from GoogleScraper.database import db_Proxy, serp_rows
 from GoogleScraper.config import Config
 from GoogleScraper.log import out
 from GoogleScraper.output_converter import store_serp_result
-from GoogleScraper.parsing import get_parser_by_search_engine, parse_serp
+from GoogleScraper.parsing import parse_serp
+from GoogleScraper.search_engines import get_part
 
 logger = logging.getLogger('GoogleScraper')
 
@@ -96,6 +97,25 @@ def get_base_search_url_by_search_engine(search_engine_name, search_mode):
     return specific_base_url
 
 
+def malicious_request_detected(search_engine_name, url, html):
+    """Whether the search engine answered with a captcha page instead of results.
+
+    Args:
+        search_engine_name: The name of the search engine.
+        url: The url of the response after redirects.
+        html: The html of the response, as string or bytes. The first kilobytes suffice.
+
+    Returns:
+        True if the url and the html contain the needles of the search engine.
+    """
+    needles = get_part(search_engine_name, 'malicious_request_needles')
+    if not needles or needles['inurl'] not in url:
+        return False
+
+    inhtml = needles['inhtml'].encode() if isinstance(html, bytes) else needles['inhtml']
+    return inhtml in html
+
+
 class SearchEngineScrape(metaclass=abc.ABCMeta):
     """Abstract base class that represents a search engine scrape.
 
@@ -129,22 +149,9 @@ class SearchEngineScrape(metaclass=abc.ABCMeta):
     sophisticated input format and more tricky engineering.
     """
 
-    malicious_request_needles = {
-        'google': {
-            'inurl': '/sorry/',
-            'inhtml': 'detected unusual traffic'
-        },
-        'bing': {},
-        'yahoo': {},
-        'baidu': {},
-        'yandex': {},
-        'ask': {},
-        'blekko': {},
-        'duckduckgo': {}
-    }
-
     def __init__(self, jobs=None, scraper_search=None, session=None, db_lock=None, cache_lock=None,
-                 start_page_pos=1, search_engine=None, search_type=None, proxy=None, progress_queue=None):
+                 start_page_pos=1, search_engine=None, search_type=None, proxy=None, progress_queue=None,
+                 serp_writer=None):
         """Instantiate an SearchEngineScrape object.
 
         Args:
@@ -178,8 +185,9 @@ class SearchEngineScrape(metaclass=abc.ABCMeta):
         # The number that shows how many searches have been done by the worker
         self.search_number = 1
 
-        # The parser that should be used to parse the search engine results
-        self.parser = get_parser_by_search_engine(self.search_engine_name)()
+        # The parser that parses the current page, the worker takes the parser
+        # of its thread from the parser_pool for every page
+        self.parser = None
 
         # The number of results per page
         self.num_results_per_page = Config['SCRAPING'].getint('num_results_per_page', 10)
@@ -204,6 +212,9 @@ class SearchEngineScrape(metaclass=abc.ABCMeta):
         # the scraper_search object
         self.scraper_search = scraper_search
 
+        # the BulkSerpWriter that writes the pages in bulk mode, None if they are stored with the ORM
+        self.serp_writer = serp_writer
+
         # the scrape mode
         # to be set by subclasses
         self.scrape_method = ''
@@ -249,6 +260,9 @@ class SearchEngineScrape(metaclass=abc.ABCMeta):
 
         self.html = ''
 
+        # the encoding of the html if the transport delivers raw bytes
+        self.encoding = None
+
         self.autocomplete = ''
 
     @abc.abstractmethod
@@ -281,13 +295,18 @@ class SearchEngineScrape(metaclass=abc.ABCMeta):
         assert self.session, 'No database session.'
 
         if self.html:
-            self.parser.parse(self.html)
+            self.parser.parse(self.html, encoding=self.encoding)
         else:
             self.parser = None
 
+        if self.serp_writer is not None:
+            rows = serp_rows(parser=self.parser, scraper=self, query=self.query)
+            self.serp_writer.add(rows)
+            return bool(rows.serp['num_results'])
+
         with self.db_lock:
 
-            serp = parse_serp(parser=self.parser, scraper=self, query=self.query)
+            serp = parse_serp(parser=self.parser, scraper=self, query=self.query, session=self.session)
 
             self.scraper_search.serps.append(serp)
             self.session.add(serp)
@@ -327,8 +346,12 @@ class SearchEngineScrape(metaclass=abc.ABCMeta):
 
     def cache_results(self):
         """Caches the html for the current request."""
+        # nothing to cache if the response was dropped
+        if not self.parser:
+            return
+
         cache_results(self.parser, self.query, self.search_engine_name, self.scrape_method, self.page_number,
-                      db_lock=self.db_lock)
+                      lock=self.cache_lock)
 
     def _largest_sleep_range(self, search_number):
         """Sleep a given amount of time dependent on the number of searches done.
@@ -403,12 +426,12 @@ class SearchEngineScrape(metaclass=abc.ABCMeta):
 
 
 from GoogleScraper.http_mode import HttpScrape
-from GoogleScraper.selenium_mode import get_selenium_scraper_by_search_engine_name
 
 
 class ScrapeWorkerFactory():
     def __init__(self, mode=None, proxy=None, search_engine=None, session=None, db_lock=None,
-                 cache_lock=None, scraper_search=None, captcha_lock=None, progress_queue=None, browser_num=1):
+                 cache_lock=None, scraper_search=None, captcha_lock=None, progress_queue=None, browser_num=1,
+                 serp_writer=None):
 
         self.mode = mode
         self.proxy = proxy
@@ -420,6 +443,7 @@ class ScrapeWorkerFactory():
         self.captcha_lock = captcha_lock
         self.progress_queue = progress_queue
         self.browser_num = browser_num
+        self.serp_writer = serp_writer
 
         self.jobs = dict()
 
@@ -442,6 +466,8 @@ class ScrapeWorkerFactory():
         if self.jobs:
 
             if self.mode == 'selenium':
+                # selenium is only imported for selenium scrapes
+                from GoogleScraper.selenium_mode import get_selenium_scraper_by_search_engine_name
 
                 return get_selenium_scraper_by_search_engine_name(
                     self.search_engine,
@@ -455,6 +481,7 @@ class ScrapeWorkerFactory():
                     progress_queue=self.progress_queue,
                     captcha_lock=self.captcha_lock,
                     browser_num=self.browser_num,
+                    serp_writer=self.serp_writer,
                 )
 
             elif self.mode == 'http':
@@ -468,6 +495,7 @@ class ScrapeWorkerFactory():
                     db_lock=self.db_lock,
                     proxy=self.proxy,
                     progress_queue=self.progress_queue,
+                    serp_writer=self.serp_writer,
                 )
 
         return None
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""
+The registry of the search engines that GoogleScraper supports.
+
+Each search engine name maps to the parts that are needed to scrape and parse it:
+
+    parser: The parser class of the dom backend.
+    lite_parser: The parser class of the lite backend, if the search engine has one.
+    url_pattern: A regular expression that matches the urls of its searches.
+    search_params: The function that builds the GET parameters of a search request.
+    selenium_scraper: The SelScrape class that scrapes it in selenium mode.
+    malicious_request_needles: How its captcha page is detected.
+
+The classes and functions are given as 'module:attribute' references. They are imported
+on first use, so a scrape only loads the parsers and scrape modes it uses. Selenium
+for instance is only imported when a search engine is scraped in selenium mode.
+
+Additional search engines are added with register_search_engine().
+"""
+
+import importlib
+import re
+import threading
+from collections import namedtuple
+
+
+SearchEngineParts = namedtuple('SearchEngineParts', [
+    'parser', 'lite_parser', 'url_pattern', 'search_params', 'selenium_scraper', 'malicious_request_needles'
+])
+
+search_engines = {}
+
+# the loaded parts, by search engine name and part
+_loaded = {}
+_lock = threading.Lock()
+
+
+def register_search_engine(name, parser, lite_parser=None, url_pattern=None, search_params=None,
+                           selenium_scraper='GoogleScraper.selenium_mode:SelScrape', malicious_request_needles=None):
+    """Add a search engine to the registry or replace the parts of a registered one.
+
+    Args:
+        name: The name of the search engine, as used in the search_engines option.
+        parser: The reference of the parser class, like 'GoogleScraper.parsing:GoogleParser'.
+        lite_parser: The reference of the parser class of the lite backend.
+        url_pattern: A regular expression that matches the urls of its searches.
+        search_params: The reference of the function that builds the GET parameters.
+        selenium_scraper: The reference of the SelScrape class.
+        malicious_request_needles: A dict with the needle 'inurl' in the url and the needle
+            'inhtml' in the html of a captcha page.
+    """
+    with _lock:
+        search_engines[name] = SearchEngineParts(parser, lite_parser, url_pattern, search_params,
+                                                 selenium_scraper, malicious_request_needles or {})
+        for part in SearchEngineParts._fields:
+            _loaded.pop((name, part), None)
+
+
+def unregister_search_engine(name):
+    """Remove a search engine from the registry."""
+    with _lock:
+        search_engines.pop(name, None)
+        for part in SearchEngineParts._fields:
+            _loaded.pop((name, part), None)
+
+
+def load_reference(reference):
+    """Import the attribute that a 'module:attribute' reference names."""
+    module, _, attribute = reference.partition(':')
+    return getattr(importlib.import_module(module), attribute)
+
+
+def get_part(name, part):
+    """Get a part of a search engine, the classes and functions are imported on first use.
+
+    Args:
+        name: The name of the search engine.
+        part: The name of the part, one of the fields of SearchEngineParts.
+
+    Returns:
+        The part or None if the search engine isn't registered or doesn't have the part.
+    """
+    try:
+        return _loaded[name, part]
+    except KeyError:
+        pass
+
+    parts = search_engines.get(name)
+    value = getattr(parts, part) if parts else None
+    if value is not None and part in ('parser', 'lite_parser', 'search_params', 'selenium_scraper'):
+        value = load_reference(value)
+    elif value is not None and part == 'url_pattern':
+        value = re.compile(value)
+
+    _loaded[name, part] = value
+    return value
+
+
+def search_engine_by_url(url):
+    """Get the name of the search engine that served a url.
+
+    Returns:
+        The name of the first registered search engine whose url pattern matches, None if none does.
+    """
+    for name in search_engines:
+        pattern = get_part(name, 'url_pattern')
+        if pattern is not None and pattern.search(url):
+            return name
+
+    return None
+
+
+register_search_engine(
+    'google',
+    parser='GoogleScraper.parsing:GoogleParser',
+    lite_parser='GoogleScraper.parsing:GoogleLiteParser',
+    url_pattern=r'^http[s]?://www\.google',
+    search_params='GoogleScraper.http_mode:google_search_params',
+    malicious_request_needles={
+        'inurl': '/sorry/',
+        'inhtml': 'detected unusual traffic'
+    },
+)
+
+register_search_engine(
+    'googleimg',
+    parser='GoogleScraper.parsing:GoogleParser',
+)
+
+register_search_engine(
+    'yandex',
+    parser='GoogleScraper.parsing:YandexParser',
+    url_pattern=r'^http://yandex\.ru',
+    search_params='GoogleScraper.http_mode:yandex_search_params',
+)
+
+register_search_engine(
+    'bing',
+    parser='GoogleScraper.parsing:BingParser',
+    url_pattern=r'^http://www\.bing\.',
+    search_params='GoogleScraper.http_mode:bing_search_params',
+)
+
+register_search_engine(
+    'yahoo',
+    parser='GoogleScraper.parsing:YahooParser',
+    url_pattern=r'^http[s]?://search\.yahoo.',
+    search_params='GoogleScraper.http_mode:yahoo_search_params',
+)
+
+register_search_engine(
+    'baidu',
+    parser='GoogleScraper.parsing:BaiduParser',
+    url_pattern=r'^http://www\.baidu\.com',
+    search_params='GoogleScraper.http_mode:baidu_search_params',
+)
+
+register_search_engine(
+    'baiduimg',
+    parser='GoogleScraper.parsing:BaiduParser',
+)
+
+register_search_engine(
+    'duckduckgo',
+    parser='GoogleScraper.parsing:DuckduckgoParser',
+    url_pattern=r'^https://duckduckgo\.com',
+    search_params='GoogleScraper.http_mode:duckduckgo_search_params',
+    selenium_scraper='GoogleScraper.selenium_mode:DuckduckgoSelScrape',
+)
+
+register_search_engine(
+    'ask',
+    parser='GoogleScraper.parsing:AskParser',
+    url_pattern=r'^http[s]?://[a-z]{2}?\.ask',
+    search_params='GoogleScraper.http_mode:ask_search_params',
+    selenium_scraper='GoogleScraper.selenium_mode:AskSelScrape',
+)
+
+register_search_engine(
+    'blekko',
+    parser='GoogleScraper.parsing:BlekkoParser',
+    url_pattern=r'^http[s]?://blekko',
+    search_params='GoogleScraper.http_mode:blekko_search_params',
+    selenium_scraper='GoogleScraper.selenium_mode:BlekkoSelScrape',
+)
@@ -25,8 +25,10 @@ except ImportError as ie:
 
 from GoogleScraper.config import Config
 from GoogleScraper.log import out, raise_or_log
+from GoogleScraper.parsing import parser_pool
+from GoogleScraper.search_engines import get_part
 from GoogleScraper.scraping import SearchEngineScrape, SeleniumSearchError, SeleniumMisconfigurationError, \
-    get_base_search_url_by_search_engine, MaliciousRequestDetected
+    get_base_search_url_by_search_engine, MaliciousRequestDetected, malicious_request_detected
 
 logger = logging.getLogger('GoogleScraper')
 
@@ -41,12 +43,9 @@ def get_selenium_scraper_by_search_engine_name(search_engine_name, *args, **kwar
     Returns;
         Either a concrete SelScrape instance specific for the given search engine or the abstract SelScrape object.
     """
-    class_name = search_engine_name[0].upper() + search_engine_name[1:].lower() + 'SelScrape'
-    ns = globals()
-    if class_name in ns:
-        return ns[class_name](*args, **kwargs)
+    scraper = get_part(search_engine_name, 'selenium_scraper') or SelScrape
 
-    return SelScrape(*args, **kwargs)
+    return scraper(*args, **kwargs)
 
 
 class SelScrape(SearchEngineScrape, threading.Thread):
@@ -284,10 +283,8 @@ class SelScrape(SearchEngineScrape, threading.Thread):
         # selenium webdriver objects have no status code :/
         super().handle_request_denied('400')
 
-        needles = self.malicious_request_needles[self.search_engine_name]
-
-        if needles and needles['inurl'] in self.webdriver.current_url \
-                and needles['inhtml'] in self.webdriver.page_source:
+        if malicious_request_detected(self.search_engine_name, self.webdriver.current_url,
+                                      self.webdriver.page_source):
 
             if Config['SELENIUM'].getboolean('manual_captcha_solving', False):
                 with self.captcha_lock:
@@ -542,6 +539,7 @@ class SelScrape(SearchEngineScrape, threading.Thread):
             for self.page_number in self.pages_per_keyword:
 
                 self.wait_until_serp_loaded()
+                self.parser = parser_pool.get(self.search_engine_name, query=self.query)
 
                 try:
                     self.html = self.webdriver.execute_script('return document.body.innerHTML;')
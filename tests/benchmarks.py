@@ -0,0 +1,328 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of GoogleScraper's hot paths on the sample SERP pages in tests/data.
+
+Run them from the tests directory:
+
+    python3 benchmarks.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from GoogleScraper.config import Config
+from GoogleScraper.database import SERP, BulkSerpWriter, ScraperSearch, SQLITE_PRAGMAS, get_session, serp_rows, \
+    set_values_from_adwords
+from GoogleScraper.enrichment import enrich_links
+from GoogleScraper.parsing import get_parser_by_search_engine, parse_serp
+
+SEARCH_ENGINES = ('google', 'yandex', 'bing', 'yahoo', 'baidu', 'duckduckgo', 'ask')
+SAMPLE_DIRS = ('data/uncompressed_serp_pages', 'data/page_number_selector', 'data/uncompressed_no_results_serp_pages')
+
+# result types that set_values_from_parser aggregates on the serp instead of storing them as links
+AGGREGATED_RESULT_TYPES = ('related_searches', 'knowledge_graph_trivia', 'knowledge_graph_social_profiles',
+                           'knowledge_graph_google_plus_reviews', 'knowledge_graph_features',
+                           'knowledge_graph_people_also_search_for', 'knowledge_graph_slideshows',
+                           'disambiguation_box')
+
+
+def sample_parsers():
+    """Parse the sample serp pages.
+
+    Returns:
+        A list of the search engine and the parser of every sample page.
+    """
+    parsers = []
+    for directory in SAMPLE_DIRS:
+        for name in sorted(os.listdir(directory)):
+            search_engine = next((engine for engine in SEARCH_ENGINES if engine in name), None)
+            if not name.endswith('.html') or search_engine is None:
+                continue
+            with open(os.path.join(directory, name), 'rb') as f:
+                parsers.append((search_engine, get_parser_by_search_engine(search_engine)(f.read())))
+    return parsers
+
+
+def sample_serps():
+    """Parse the sample serp pages.
+
+    Returns:
+        A list of the search results of every sample page.
+    """
+    return [parser.search_results for _, parser in sample_parsers()]
+
+
+def page_links(search_results):
+    """The results of a page that are stored as links, grouped by result type."""
+    return [(key, value) for key, value in search_results.items()
+            if isinstance(value, list) and key not in AGGREGATED_RESULT_TYPES]
+
+
+def inline_enrichment(key, link):
+    """The enrichment of a link as set_values_from_parser used to do it for every link."""
+    parsed = urlparse(link.get('link'))
+
+    google_star_rating = None
+    if key == 'organic_results' and link.get('google_star_rating') is not None:
+        google_star_rating = link.get('google_star_rating') + ' - ' + link.get('google_star_rating_reviews')
+    elif key == 'paid_results' and link.get('google_star_rating') is not None:
+        google_star_rating = link.get('google_star_rating')
+    elif key == 'local_pack_results' and link.get('google_star_rating') is not None:
+        google_star_rating = link.get('google_star_rating') + ' - ' + link.get('google_star_rating_reviews')
+    elif key == 'list_carousel' and link.get('google_star_rating') is not None:
+        google_star_rating = link.get('google_star_rating') + ' - ' + link.get('google_star_rating_reviews')
+
+    address = link.get('address')
+    if key == 'paid_results' and link.get('address') is not None and link.get('phone_number') is not None:
+        address = address + ' ' + link.get('phone_number')
+
+    search_bar = None
+    if link.get('search_bar') is not None:
+        search_bar = True
+    elif key == 'organic_results':
+        search_bar = False
+
+    schema_enhanced_listing = (None if not link.get('schema_enhanced_listing') else link.get('schema_enhanced_listing'))
+
+    image_thumbnail = None
+    if link.get('image_thumbnail') is not None:
+        image_thumbnail = True
+    elif key == 'organic_results' or key == 'news_results' or key == 'in_depth_articles' or key == 'shopping_results (left)' or key == 'shopping_results (right)' or key == 'local_carousel' or key == 'list_carousel':
+        image_thumbnail = False
+
+    video_thumbnail = None
+    if link.get('video_thumbnail') is not None:
+        video_thumbnail = True
+    elif key == 'organic_results':
+        video_thumbnail = False
+
+    small_sitelinks = []
+    for i in range(1, 7):
+        if (link.get('small_sitelink_' + str(i)) is not None):
+            small_sitelinks.append(link.get('small_sitelink_' + str(i)))
+    small_sitelinks = ('; '.join(small_sitelinks) if small_sitelinks else None)
+
+    big_sitelinks = []
+    for i in range(1, 7):
+        if (link.get('big_sitelink_' + str(i)) is not None):
+            big_sitelinks.append(link.get('big_sitelink_' + str(i)) + ' - ' + link.get('big_sitelink_' + str(i) + '_description'))
+    big_sitelinks = ('; '.join(big_sitelinks) if big_sitelinks else None)
+
+    social_sites = [
+        'www.facebook.com',
+        'twitter.com',
+        'www.linkedin.com',
+        'www.pinterest.com',
+        'plus.google.com',
+        'www.tumblr.com',
+        'instagram.com',
+        'vk.com',
+        'www.flickr.com',
+        'vine.co',
+        'www.meetup.com',
+        'www.tagged.com',
+        'ask.fm',
+        'www.meetme.com',
+        'www.classmates.com'
+    ]
+    social_site = False
+    if parsed.netloc in social_sites:
+        social_site = True
+
+    https = False
+    if link.get('link').startswith('https'):
+        https = True
+
+    m_dot = False
+    if link.get('link').find('//m.') != -1:
+        m_dot = True
+
+    return dict(link=link.get('link'), snippet=link.get('snippet'), title=link.get('title'),
+                visible_link=link.get('visible_link'), domain=parsed.netloc, rank=link.get('rank'), link_type=key,
+                google_star_rating=google_star_rating, address=address, search_bar=search_bar,
+                schema_enhanced_listing=schema_enhanced_listing, image_thumbnail=image_thumbnail,
+                video_thumbnail=video_thumbnail, small_sitelinks=small_sitelinks, big_sitelinks=big_sitelinks,
+                price=link.get('price'), social_site=social_site, https=https, m_dot=m_dot)
+
+
+def timed(function, rounds):
+    """Run function rounds times and return the seconds per round."""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - started) / rounds
+
+
+def benchmark_lite_parser(rounds=20):
+    """Compare the lite parser of Google with the dom parser."""
+    pages = []
+    for directory in SAMPLE_DIRS + ('data/no_results_literal',):
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.html') and 'google' in name:
+                with open(os.path.join(directory, name), 'rb') as f:
+                    pages.append(f.read())
+
+    print('parsing {} google pages'.format(len(pages)))
+    for backend in ('dom', 'lite'):
+        parser = get_parser_by_search_engine('google', backend=backend)()
+
+        def parse():
+            for html in pages:
+                parser.reset()
+                parser.parse(html)
+
+        print('  {:5} {:8.2f} ms per page'.format(backend + ':', timed(parse, rounds) / len(pages) * 1e3))
+
+
+def benchmark_link_enrichment(rounds=200):
+    """Compare enrich_links() with the inline enrichment it replaced."""
+    pages = [page_links(search_results) for search_results in sample_serps()]
+    num_links = sum(len(links) for links in pages for _, links in links)
+
+    def inline():
+        return [[inline_enrichment(key, link) for link in links] for links_by_type in pages
+                for key, links in links_by_type]
+
+    def stage():
+        return [enrich_links(key, links) for links_by_type in pages for key, links in links_by_type]
+
+    assert inline() == stage(), 'enrich_links() differs from the inline enrichment'
+
+    inline_seconds = timed(inline, rounds)
+    stage_seconds = timed(stage, rounds)
+
+    print('link enrichment of {} links on {} pages'.format(num_links, len(pages)))
+    print('  inline:       {:8.1f} us per page'.format(inline_seconds / len(pages) * 1e6))
+    print('  enrich_links: {:8.1f} us per page ({:.1f}x)'.format(stage_seconds / len(pages) * 1e6,
+                                                                  inline_seconds / stage_seconds))
+
+
+def benchmark_bulk_insert(num_pages=1000):
+    """Compare storing serp pages with a commit per page through the ORM with the BulkSerpWriter."""
+    parsers = sample_parsers()
+    pages = [parsers[i % len(parsers)] for i in range(num_pages)]
+    num_links = 0
+
+    def scraper(search_engine, i):
+        return SimpleNamespace(query='keyword {}'.format(i), search_engine_name=search_engine,
+                               scrape_method='http', page_number=1, requested_at=None,
+                               requested_by='127.0.0.1', status='successful', autocomplete=None)
+
+    def orm(session, scraper_search):
+        for i, (search_engine, parser) in enumerate(pages):
+            page_scraper = scraper(search_engine, i)
+            serp = parse_serp(parser=parser, scraper=page_scraper, query=page_scraper.query)
+            scraper_search.serps.append(serp)
+            session.add(serp)
+            session.commit()
+
+    def bulk(session, scraper_search):
+        writer = BulkSerpWriter(session.get_bind(), scraper_search.id)
+        for i, (search_engine, parser) in enumerate(pages):
+            page_scraper = scraper(search_engine, i)
+            writer.add(serp_rows(parser=parser, scraper=page_scraper, query=page_scraper.query))
+        writer.flush()
+
+    print('storing {} serp pages'.format(num_pages))
+    for name, store in (('orm', orm), ('bulk', bulk)):
+        with tempfile.TemporaryDirectory() as directory:
+            session = get_session(path=os.path.join(directory, 'benchmark.db'))()
+            scraper_search = ScraperSearch()
+            session.add(scraper_search)
+            session.commit()
+
+            seconds = timed(lambda: store(session, scraper_search), 1)
+            num_links = session.execute('SELECT count(*) FROM link').scalar()
+            session.close()
+
+        print('  {:5} {:8.2f} ms per page, {} links'.format(name + ':', seconds / num_pages * 1e3, num_links))
+
+
+def benchmark_sqlite_profile(num_pages=300):
+    """Compare the commit throughput of the sqlite profile with the defaults of sqlite.
+
+    Every page is committed on its own, like the writer thread does when the workers are slower than the
+    database. The pages are written with Core inserts, so the time is spent in the commits.
+    """
+    parsers = sample_parsers()
+    configured = {option: Config['OUTPUT'].get(option, '') for option, _ in SQLITE_PRAGMAS}
+
+    print('committing {} serp pages one by one'.format(num_pages))
+    for name, profile in (('sqlite defaults', {option: '' for option in configured}), ('profile', configured)):
+        Config['OUTPUT'].update(profile)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                session = get_session(path=os.path.join(directory, 'benchmark.db'))()
+                scraper_search = ScraperSearch()
+                session.add(scraper_search)
+                session.commit()
+
+                writer = BulkSerpWriter(session.get_bind(), scraper_search.id, batch_size=1)
+
+                def commit():
+                    for i in range(num_pages):
+                        search_engine, parser = parsers[i % len(parsers)]
+                        scraper = SimpleNamespace(query='keyword {}'.format(i), search_engine_name=search_engine,
+                                                  scrape_method='http', page_number=1, requested_at=None,
+                                                  requested_by='127.0.0.1', status='successful', autocomplete=None)
+                        writer.add(serp_rows(parser=parser, scraper=scraper, query=scraper.query))
+
+                seconds = timed(commit, 1)
+                writer.close()
+                session.close()
+                session.get_bind().dispose()
+        finally:
+            Config['OUTPUT'].update(configured)
+
+        print('  {:16} {:8.1f} commits per second'.format(name + ':', num_pages / seconds))
+
+
+def keyword_adwords_update(session, traffic):
+    """The write-back of the AdWords metrics as set_values_from_adwords() used to do it, one keyword after the other."""
+    for keyword in traffic:
+        serp_page = session.query(SERP).filter(SERP.query == keyword).order_by(SERP.id.desc()).first()
+        serp_page.average_monthly_search_volume = traffic.get(keyword).get('average_monthly_search_volume')
+        serp_page.average_cpc = traffic.get(keyword).get('average_cpc')
+        serp_page.competition = traffic.get(keyword).get('competition')
+        serp_page.monthly_search_volumes = ('; '.join(traffic.get(keyword).get('monthly_search_volumes'))
+                                            if traffic.get(keyword).get('monthly_search_volumes') != [] else None)
+    session.commit()
+
+
+def benchmark_adwords_update(num_keywords=100000):
+    """Compare set_values_from_adwords() with the update per keyword on a database with two serps per keyword."""
+    keywords = ['keyword {}'.format(i) for i in range(num_keywords)]
+    traffic = {keyword: {'average_monthly_search_volume': i, 'average_cpc': 0.5, 'competition': 0.1,
+                         'monthly_search_volumes': ['2015-01: {}'.format(i), '2015-02: {}'.format(i)]}
+               for i, keyword in enumerate(keywords)}
+
+    print('writing the adwords metrics of {} keywords'.format(num_keywords))
+    for name, update in (('per keyword', keyword_adwords_update), ('set based', set_values_from_adwords)):
+        with tempfile.TemporaryDirectory() as directory:
+            session = get_session(path=os.path.join(directory, 'benchmark.db'))()
+            session.execute(SERP.__table__.insert(), [{'query': keyword, 'search_engine_name': 'google'}
+                                                      for _ in range(2) for keyword in keywords])
+            session.commit()
+
+            seconds = timed(lambda: update(session, traffic), 1)
+            assert session.query(SERP).filter(SERP.average_monthly_search_volume.isnot(None)).count() == num_keywords
+            session.close()
+            session.get_bind().dispose()
+
+        print('  {:12} {:8.2f} s'.format(name + ':', seconds))
+
+
+if __name__ == '__main__':
+    benchmark_link_enrichment()
+    benchmark_lite_parser()
+    benchmark_bulk_insert()
+    benchmark_sqlite_profile()
+    benchmark_adwords_update()
@@ -2,12 +2,27 @@
 # -*- coding: utf-8 -*-
 
 import os
+import shutil
+import sqlite3
+import threading
 import unittest
+from types import SimpleNamespace
 
 from GoogleScraper import Config
 from GoogleScraper import scrape_with_config
-from GoogleScraper.parsing import get_parser_by_search_engine
+from GoogleScraper.parsing import get_parser_by_search_engine, parse_many, parse_serp, selector_stats, strip_bloat, \
+    parser_pool, GoogleLiteParser, get_parser_by_url, NoParserForSearchEngineException, Parser
+from GoogleScraper.database import SERP, Link, ScraperSearch, get_session, serp_fingerprint, serp_rows, \
+    BulkSerpWriter, SessionSerpWriter, DatabaseWriter, DatabaseWriterException, set_values_from_adwords
+from GoogleScraper.enrichment import enrich_links
+from GoogleScraper.caching import cache_results, cached_file_name, reparse_cached_files, fix_broken_cache_names, \
+    CompressedFile
+from GoogleScraper.scraping import malicious_request_detected
+from GoogleScraper.http_mode import get_GET_params_for_search_engine
+from GoogleScraper.search_engines import register_search_engine, unregister_search_engine, search_engine_by_url
 from collections import Counter
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError
 
 all_search_engines = [se.strip() for se in Config['SCRAPING'].get('supported_search_engines').split(',')]
 
@@ -33,6 +48,11 @@ class GoogleScraperIntegrationTestCase(unittest.TestCase):
         return parser
 
 
+    def close_database(self, session):
+        """Close the session and the pooled connections of its engine, so the database file can be removed."""
+        session.close()
+        session.get_bind().dispose()
+
     def assert_around_10_results_with_snippets(self, parser, delta=4):
         self.assertAlmostEqual(len([v['snippet'] for v in parser.search_results['results'] if v['snippet'] is not None]), 10, delta=delta)
 
@@ -122,6 +142,284 @@ class GoogleScraperIntegrationTestCase(unittest.TestCase):
         self.assert_around_10_results_with_snippets(parser)
         self.assert_atleast90percent_of_items_are_not_None(parser)
 
+    def test_parse_fields(self):
+        file = 'data/uncompressed_serp_pages/abrakadabra_google_de_ip.html'
+        parser = self.get_parser_for_file('google', file)
+        projected = self.get_parser_for_file('google', file, fields='organic_results.link, paid_results')
+
+        assert set(projected.search_results.keys()) == {'organic_results', 'paid_results'}
+        assert all(set(r.keys()) == {'link', 'rank'} for r in projected.search_results['organic_results'])
+        assert projected.search_results['paid_results'] == parser.search_results['paid_results']
+        assert [r['link'] for r in projected.search_results['organic_results']] == \
+               [r['link'] for r in parser.search_results['organic_results']]
+        assert projected.knowledge_graph_box is False and projected.knowledge_graph_title is None
+
+    def test_no_results_snippets(self):
+        def page(snippet):
+            result = '<li class="g"><h3 class="r"><a href="http://a.example/">A</a></h3>{}</li>'.format(
+                '<div class="s"><span class="st">{}</span></div>'.format(snippet) if snippet else '')
+            return '<html><body><div id="center_col"><p>Your search - abra - did not match any documents.</p>' \
+                   '<ol>{}</ol></div></body></html>'.format(result)
+
+        google = get_parser_by_search_engine('google')
+        assert google(page(None), query='abra').no_results is True
+        assert google(page('abra kadabra'), query='abra').no_results is False
+        assert google(page('abra kadabra'), query='abra', fields='organic_results.link').no_results is True
+
+    def test_parse_fields_yahoo(self):
+        file = 'data/uncompressed_serp_pages/snow_yahoo_de_ip.html'
+        parser = self.get_parser_for_file('yahoo', file)
+        projected = self.get_parser_for_file('yahoo', file, fields='results.link')
+
+        assert projected.search_results['results']
+        assert [r['link'] for r in projected.search_results['results']] == \
+               [r['link'] for r in parser.search_results['results']]
+
+    def test_streaming_parse(self):
+        with open('data/uncompressed_serp_pages/abrakadabra_google_de_ip.html', 'rb') as f:
+            html = f.read()
+
+        parser = get_parser_by_search_engine('google')()
+        for start in range(0, len(html), 1000):
+            parser.feed(html[start:start + 1000], encoding='utf-8')
+        parser.parse(html)
+
+        expected = get_parser_by_search_engine('google')(html)
+        assert parser.search_results == expected.search_results
+        assert parser.num_results_for_query == expected.num_results_for_query
+
+        sorry = b'<html><body>Our systems have detected unusual traffic from your computer network.'
+        assert malicious_request_detected('google', 'https://www.google.com/sorry/index?continue=x', sorry)
+        assert not malicious_request_detected('google', 'https://www.google.com/search?q=x', sorry)
+        assert not malicious_request_detected('bing', 'https://www.bing.com/sorry/', sorry)
+
+    def test_adaptive_variant_order(self):
+        class VariantParser(Parser):
+            search_engine = 'variants'
+            search_types = ['normal']
+            normal_search_selectors = {
+                'results': {
+                    'first': {'container': '#first', 'result_container': 'li', 'link': 'a::attr(href)'},
+                    'second': {'container': '#second', 'result_container': 'li', 'link': 'a::attr(href)'},
+                }
+            }
+
+        def page(first, second):
+            items = lambda links: ''.join('<li><a href="{}">x</a></li>'.format(link) for link in links)
+            return '<html><body><ul id="first">{}</ul><ul id="second">{}</ul></body></html>'.format(
+                items(first), items(second))
+
+        def parse(html):
+            parser = VariantParser()
+            parser.variant_order = 'adaptive'
+            parser.parse(html)
+            return [(r['link'], r['rank']) for r in parser.search_results['results']]
+
+        # the first productive variant is learned, not the last one
+        assert parse(page(['a'], ['b'])) == [('a', 1), ('b', 1)]
+        assert VariantParser.recent_variants()['results'] == 'first'
+
+        assert parse(page([], ['b'])) == [('b', 1)]
+        assert VariantParser.recent_variants()['results'] == 'second'
+
+        # the learned variant is tried first, so it wins the duplicates and its results come first
+        assert parse(page(['a', 'b'], ['b'])) == [('b', 1), ('a', 1)]
+        assert VariantParser.recent_variants()['results'] == 'second'
+
+    def test_parser_pool(self):
+        files = ['data/uncompressed_serp_pages/abrakadabra_google_de_ip.html', 'data/page_number_selector/google_8.html']
+        pages = [open(file, 'rb').read() for file in files]
+
+        parser = parser_pool.get('google', query='abrakadabra')
+        parser.parse(pages[0])
+        first = parser.search_results
+
+        assert parser_pool.get('google', query='page 8') is parser
+        assert parser.dom is None and parser.search_results == {} and parser.query == 'page 8'
+        parser.parse(pages[1])
+
+        assert first == get_parser_by_search_engine('google')(pages[0]).search_results
+        assert parser.search_results == get_parser_by_search_engine('google')(pages[1]).search_results
+        assert parser_pool.get('bing') is not parser
+
+        # a parser keeps the settings it was created with, so it isn't reused when they change
+        Config['SCRAPING']['parse_fields'] = 'organic_results.link'
+        try:
+            projected = parser_pool.get('google')
+            assert projected is not parser and projected.fields == {'organic_results': {'link'}}
+            assert parser_pool.get('google') is projected
+        finally:
+            Config['SCRAPING']['parse_fields'] = ''
+        assert parser_pool.get('google').fields is None
+
+    def test_lite_parser(self):
+        files = ['data/uncompressed_serp_pages/abrakadabra_google_de_ip.html', 'data/page_number_selector/google_8.html',
+                 'data/uncompressed_no_results_serp_pages/google.html', 'data/no_results_literal/google.html']
+
+        def ranking(parser):
+            return [(result['rank'], result['link'], result['title'], result['visible_link'])
+                    for result in parser.search_results['organic_results']]
+
+        for file in files:
+            for mode in ('r', 'rb'):
+                with open(file, mode) as f:
+                    html = f.read()
+                parser = get_parser_by_search_engine('google', backend='dom')(html)
+                lite = get_parser_by_search_engine('google', backend='lite')(html)
+
+                assert list(lite.search_results) == ['organic_results']
+                assert ranking(lite) == ranking(parser), file
+                assert lite.num_results_for_query == parser.num_results_for_query
+                assert lite.page_number == parser.page_number and lite.no_results == parser.no_results
+
+        Config['SCRAPING']['google_parser_backend'] = 'lite'
+        try:
+            assert get_parser_by_search_engine('google') is GoogleLiteParser
+            assert type(parser_pool.get('google')) is GoogleLiteParser
+        finally:
+            Config['SCRAPING']['google_parser_backend'] = 'dom'
+        assert type(parser_pool.get('google')) is not GoogleLiteParser
+
+    def test_search_engine_registry(self):
+        assert get_parser_by_url('https://www.google.de/search?q=x') is get_parser_by_search_engine('google')
+        assert get_GET_params_for_search_engine('x', 'bing', page_number=3) == {'q': 'x', 'first': '21'}
+        assert get_GET_params_for_search_engine('x', 'googleimg') == {}
+
+        register_search_engine('startpage', parser='GoogleScraper.parsing:GoogleParser',
+                               url_pattern=r'^https://www\.startpage\.com',
+                               search_params='GoogleScraper.http_mode:duckduckgo_search_params')
+        try:
+            assert get_parser_by_search_engine('startpage') is get_parser_by_search_engine('google')
+            assert search_engine_by_url('https://www.startpage.com/do/search?q=x') == 'startpage'
+            assert get_GET_params_for_search_engine('x', 'startpage') == {'q': 'x'}
+            assert not malicious_request_detected('startpage', 'https://www.startpage.com/sorry/', 'unusual')
+        finally:
+            unregister_search_engine('startpage')
+
+        with self.assertRaises(NoParserForSearchEngineException):
+            get_parser_by_search_engine('startpage')
+        with self.assertRaises(NoParserForSearchEngineException):
+            get_parser_by_search_engine('bing', backend='lite')
+
+    def test_strip_bloat(self):
+        html = b'<html><head><STYLE type="text/css">a < b {}</STYLE><script>if (a<b) {}</script></head>' \
+               b'<body><!-- a -- b --><div id="main">x</div><script src="a.js"></script></body></html>'
+        assert strip_bloat(html) == b'<html><head></head><body><div id="main">x</div></body></html>'
+        assert strip_bloat(html.decode()) == strip_bloat(html).decode()
+        assert strip_bloat(b'<div>x</div><script>never closed') == b'<div>x</div><script>never closed'
+
+        file = 'data/uncompressed_serp_pages/abrakadabra_google_de_ip.html'
+        Config['SCRAPING']['preclean_html'] = 'False'
+        try:
+            expected = self.get_parser_for_file('google', file)
+        finally:
+            Config['SCRAPING']['preclean_html'] = 'True'
+        precleaned = self.get_parser_for_file('google', file)
+        assert precleaned.search_results == expected.search_results
+
+        # the cache files don't depend on the pre-pass, and the dom stays as it was parsed
+        dom = precleaned.dom
+        assert precleaned.cleaned_html == expected.cleaned_html
+        assert precleaned.dom is dom
+
+    def test_lazy_knowledge_graph(self):
+        parser = self.get_parser_for_file('google', 'data/uncompressed_serp_pages/abrakadabra_google_de_ip.html')
+
+        assert 'knowledge_graph_title' not in vars(parser)
+        assert parser.knowledge_graph_box is False
+        assert parser.knowledge_graph_title is False and parser.knowledge_graph_map is False
+        assert 'knowledge_graph_title' in vars(parser)
+
+        unparsed = get_parser_by_search_engine('google')()
+        assert unparsed.knowledge_graph_title is None and unparsed.knowledge_graph_ad is False
+
+    def test_enrich_links(self):
+        links = [
+            {'link': 'https://m.facebook.com/foo', 'rank': 1, 'google_star_rating': '4.5',
+             'google_star_rating_reviews': '12 reviews', 'address': 'Main St 1', 'phone_number': '555',
+             'small_sitelink_2': 'About', 'small_sitelink_5': 'Contact'},
+            {'link': 'http://www.facebook.com/bar', 'rank': 2, 'big_sitelink_1': 'Jobs',
+             'big_sitelink_1_description': 'Work with us', 'schema_enhanced_listing': ''},
+        ]
+        paid, plain = enrich_links('paid_results', links)
+
+        assert paid['domain'] == 'm.facebook.com' and not paid['social_site']
+        assert paid['https'] and paid['m_dot']
+        assert paid['google_star_rating'] == '4.5' and paid['address'] == 'Main St 1 555'
+        assert paid['small_sitelinks'] == 'About; Contact' and paid['big_sitelinks'] is None
+        assert plain['social_site'] and not plain['https'] and not plain['m_dot']
+        assert plain['big_sitelinks'] == 'Jobs - Work with us' and plain['schema_enhanced_listing'] is None
+        assert plain['image_thumbnail'] is None and plain['search_bar'] is None
+
+        organic, _ = enrich_links('organic_results', links)
+        assert organic['image_thumbnail'] is False and organic['video_thumbnail'] is False
+        assert organic['search_bar'] is False
+
+        # the features that weren't parsed aren't known to be missing
+        organic, _ = enrich_links('organic_results', links, requested={'link', 'rank'})
+        assert organic['image_thumbnail'] is None and organic['video_thumbnail'] is None
+        assert organic['search_bar'] is None
+        assert organic['google_star_rating'] == '4.5 - 12 reviews' and organic['address'] == 'Main St 1'
+        assert organic['small_sitelinks'] is None
+
+        # a joined field that wasn't parsed is left out of the join
+        organic, = enrich_links('organic_results', [{'link': 'http://a.example/', 'google_star_rating': '4.5',
+                                                     'big_sitelink_1': 'Jobs'}],
+                                requested={'link', 'google_star_rating', 'big_sitelink_1'})
+        assert organic['google_star_rating'] == '4.5' and organic['big_sitelinks'] == 'Jobs'
+
+    def test_parse_fields_enrichment(self):
+        html = '<html><body><div id="center_col"><ol><li class="g">' \
+               '<h3 class="r"><a href="http://a.example/">A</a></h3><div id="lclbox">' \
+               '<span class="rtng">4.5</span><a class="fl"><span>12 reviews</span></a></div>' \
+               '</li></ol></div></body></html>'
+        parser = get_parser_by_search_engine('google')(html, fields='organic_results.google_star_rating')
+        assert parser.fields['organic_results'] == {'google_star_rating', 'google_star_rating_reviews'}
+
+        serp = SERP()
+        serp.set_values_from_parser(parser)
+        link, = serp.links
+        assert link.link == 'http://a.example/' and link.google_star_rating == '4.5 - 12 reviews'
+        assert link.search_bar is None and link.image_thumbnail is None and link.video_thumbnail is None
+
+    def test_selector_stats(self):
+        selector_stats.reset()
+        selector_stats.enable()
+        try:
+            parser = self.get_parser_for_file('google', 'data/uncompressed_serp_pages/abrakadabra_google_de_ip.html')
+        finally:
+            selector_stats.enable(False)
+
+        stats = selector_stats.snapshot()
+        assert all(parser_name == 'GoogleParser' for parser_name, _ in stats)
+        assert all(stat.calls == stat.matches + stat.misses for stat in stats.values())
+        assert stats[('GoogleParser', 'cite')].matches >= len(parser.search_results['organic_results'])
+        assert 'cite' in selector_stats.report()
+
+    def test_parse_many(self):
+        pages = [('abrakadabra', 'data/uncompressed_serp_pages/abrakadabra_google_de_ip.html'),
+                 ('page 8', 'data/page_number_selector/google_8.html')]
+        items = [(query, open(file, 'r').read()) for query, file in pages]
+
+        results = list(parse_many(items, 'google', workers=2, batch_size=1))
+
+        assert [r.query for r in results] == ['abrakadabra', 'page 8']
+        for (query, file), result in zip(pages, results):
+            parser = self.get_parser_for_file('google', file, query=query)
+            assert result == parser.parse_result()
+            # pages without a knowledge graph box don't parse its details
+            assert not parser.knowledge_graph_box
+            assert not any(feature in vars(parser) for feature in parser.lazy_features)
+
+            serp = parse_serp(parser=result, query=query)
+            assert serp.num_results == parser.num_results
+            assert [l.link for l in serp.links] == [l.link for l in parse_serp(parser=parser, query=query).links]
+
+        knowledge_graph = '<html><body><div id="rhs"><ol><li class="g mnr-c rhsvw g-blk">' \
+                          '<div class="kno-ecr-pt kno-fb-ctx">Abrakadabra</div></li></ol></div></body></html>'
+        result = get_parser_by_search_engine('google')(knowledge_graph).parse_result()
+        assert result.knowledge_graph_box and result.knowledge_graph_title == 'Abrakadabra'
+
 
     ### test csv output
 
@@ -326,6 +624,321 @@ class GoogleScraperIntegrationTestCase(unittest.TestCase):
                 assert serp.effective_query, '{} must have an effective query when a keyword has no results.'.format(serp.search_engine_name)
 
 
+    def test_reparse_cache(self):
+
+        config = {
+            'SCRAPING': {
+                'keyword': 'asdfasdfa7654567654345654343sdfasd',
+                'search_engines': '*',
+                'num_pages_for_keyword': 1,
+                'scrape_method': 'selenium'
+            },
+            'GLOBAL': {
+                'cachedir': 'data/no_results/',
+                'do_caching': 'True',
+                'reparse_cache': 'True',
+                'reparse_workers': 2,
+                'verbosity': 1
+            },
+            'OUTPUT': {
+                'database_name': 'reparse_test'
+            }
+        }
+
+        try:
+            # parsing again replaces the serps of the first run
+            for i in range(2):
+                session = scrape_with_config(config)
+                serps = session.query(SERP).all()
+
+                assert len(serps) == len(os.listdir('data/no_results/')), len(serps)
+                assert {serp.search_engine_name for serp in serps} <= set(all_search_engines)
+                assert all(serp.has_no_results_for_query() for serp in serps)
+                assert session.query(Link).count() == sum(len(serp.links) for serp in serps)
+                self.close_database(session)
+        finally:
+            Config['GLOBAL']['reparse_cache'] = 'False'
+            os.remove('reparse_test.db')
+
+    def test_reparse_cache_without_keywords(self):
+        options = {'cachedir': 'reparse_cache_test/', 'do_caching': 'True', 'minimize_caching_files': 'False',
+                   'compress_cached_files': 'True'}
+        previous = {option: Config['GLOBAL'].get(option) for option in options}
+        Config['GLOBAL'].update(options)
+
+        session = get_session(path='reparse_test.db')()
+        try:
+            # a cache file with the header that records its search
+            parser = self.get_parser_for_file('google', 'data/uncompressed_serp_pages/abrakadabra_google_de_ip.html')
+            cache_results(parser, 'abrakadabra', 'google', 'http', 1, lock=threading.Lock())
+
+            # a cache file of an older version, its search is told by the title
+            with open('data/uncompressed_serp_pages/hello_bing_de_ip.html', 'rb') as f:
+                html = f.read()
+            with open(os.path.join('reparse_cache_test', cached_file_name('hello', 'bing', 'selenium', 1)), 'wb') as f:
+                f.write(html)
+
+            # a broken file and one of an unknown search are skipped
+            with open('reparse_cache_test/broken.cache.gz', 'wb') as f:
+                f.write(b'no gzip')
+            with open('reparse_cache_test/unknown.cache', 'wb') as f:
+                f.write(b'<html><body>no title</body></html>')
+
+            for i in range(2):
+                assert reparse_cached_files([], session, ScraperSearch(), workers=1) == 2
+
+            serps = session.query(SERP).order_by(SERP.query).all()
+            assert [(serp.query, serp.search_engine_name, serp.scrape_method) for serp in serps] == \
+                   [('abrakadabra', 'google', 'http'), ('hello', 'bing', 'selenium')]
+            assert all(serp.links for serp in serps) and len(serps[0].scraper_searches) == 2
+            assert session.query(Link).count() == sum(len(serp.links) for serp in serps)
+
+            # a batch that can't be written is skipped, the other batches are written
+            session.execute("CREATE TRIGGER no_hello BEFORE UPDATE ON serp WHEN NEW.query = 'hello' "
+                            "BEGIN SELECT RAISE(ABORT, 'hello is read-only'); END")
+            session.commit()
+            assert reparse_cached_files([], session, ScraperSearch(), workers=1, batch_size=1) == 1
+        finally:
+            Config['GLOBAL'].update(previous)
+            self.close_database(session)
+            os.remove('reparse_test.db')
+            shutil.rmtree('reparse_cache_test')
+
+    def test_fix_broken_cache_names(self):
+        previous = Config['GLOBAL'].get('cachedir')
+        Config['GLOBAL']['cachedir'] = 'fix_names_test/'
+        os.mkdir('fix_names_test')
+        try:
+            CompressedFile('fix_names_test/broken.cache.gz').write(
+                '<html><head><title>hello world - Google Search</title></head></html>')
+            with open('fix_names_test/untitled.cache', 'wb') as f:
+                f.write(b'<html></html>')
+
+            fix_broken_cache_names(None, 'google', 'http', 1)
+
+            assert sorted(os.listdir('fix_names_test')) == \
+                   sorted([cached_file_name('hello world', 'google', 'http', 1) + '.gz', 'untitled.cache'])
+        finally:
+            Config['GLOBAL']['cachedir'] = previous
+            shutil.rmtree('fix_names_test')
+
+    def test_parse_many_skips_broken_pages(self):
+        with open('data/uncompressed_serp_pages/abrakadabra_google_de_ip.html', 'rb') as f:
+            html = f.read()
+
+        results = list(parse_many([('broken', 12345), ('abrakadabra', html)], 'google', workers=1))
+        assert results[0] is None and results[1].search_results['organic_results']
+
+    def test_skip_unchanged_serps(self):
+        file = 'data/uncompressed_serp_pages/abrakadabra_google_de_ip.html'
+        parser = self.get_parser_for_file('google', file)
+        scraper = SimpleNamespace(query='abrakadabra', search_engine_name='google', scrape_method='http',
+                                  page_number=1, requested_at=None, requested_by='127.0.0.1',
+                                  status='successful', autocomplete=None)
+
+        # a database of an older version gets the fingerprint column
+        connection = sqlite3.connect('skip_test.db')
+        connection.execute('CREATE TABLE serp (id INTEGER PRIMARY KEY, query VARCHAR)')
+        connection.close()
+
+        session = get_session(path='skip_test.db')()
+        Config['GLOBAL']['skip_unchanged_serps'] = 'True'
+        try:
+            serps = []
+            for i in range(2):
+                scraper_search = ScraperSearch()
+                serp = parse_serp(parser=parser, scraper=scraper, query=scraper.query, session=session)
+                scraper_search.serps.append(serp)
+                session.add(serp)
+                session.commit()
+                serps.append(serp)
+
+            assert serps[0] is serps[1] and len(serps[0].scraper_searches) == 2
+            assert serps[0].fingerprint == serp_fingerprint(parser)
+            assert session.query(SERP).count() == 1
+            assert session.query(Link).count() == len(serps[0].links) > 0
+
+            # a page with other results is stored again
+            other = self.get_parser_for_file('google', 'data/page_number_selector/google_8.html')
+            serp = parse_serp(parser=other, scraper=scraper, query=scraper.query, session=session)
+            assert serp is not serps[0] and serp.fingerprint != serps[0].fingerprint
+        finally:
+            Config['GLOBAL']['skip_unchanged_serps'] = 'False'
+            self.close_database(session)
+            os.remove('skip_test.db')
+
+    def test_bulk_serp_writer(self):
+        scraper = SimpleNamespace(query='abrakadabra', search_engine_name='google', scrape_method='http',
+                                  page_number=1, requested_at=None, requested_by='127.0.0.1',
+                                  status='successful', autocomplete=None)
+        files = ['data/uncompressed_serp_pages/abrakadabra_google_de_ip.html',
+                 'data/page_number_selector/google_8.html']
+        parsers = [self.get_parser_for_file('google', file) for file in files]
+
+        session = get_session(path='bulk_test.db')()
+        try:
+            scraper_search = ScraperSearch()
+            session.add(scraper_search)
+            session.commit()
+
+            writer = BulkSerpWriter(session.get_bind(), scraper_search.id, batch_size=10)
+            for parser in parsers:
+                writer.add(serp_rows(parser=parser, scraper=scraper, query=scraper.query))
+            failed = SimpleNamespace(**dict(vars(scraper), query='failed', status='Network problem'))
+            writer.add(serp_rows(scraper=failed, query=failed.query))
+            assert writer.num_written == 0
+            writer.flush()
+            assert writer.num_written == 3
+
+            serps = session.query(SERP).order_by(SERP.id).all()
+            assert len(serps) == 3 and len(scraper_search.serps) == 3
+            assert serps[2].query == 'failed' and not serps[2].links
+
+            # the rows are the same as the ones of the ORM
+            for serp, parser in zip(serps, parsers):
+                expected = parse_serp(parser=parser, scraper=scraper, query=scraper.query)
+                session.add(expected)
+                session.commit()
+                for column in SERP.__table__.columns.keys():
+                    if column not in ('id', 'requested_at'):
+                        assert getattr(serp, column) == getattr(expected, column), column
+                assert [(link.link, link.rank, link.link_type, link.domain) for link in serp.links] == \
+                       [(link.link, link.rank, link.link_type, link.domain) for link in expected.links]
+
+            # a page that waits flush_interval seconds is written without another page arriving
+            writer = BulkSerpWriter(session.get_bind(), scraper_search.id, batch_size=10, flush_interval=0.1)
+            timed = SimpleNamespace(**dict(vars(scraper), query='timed'))
+            writer.add(serp_rows(parser=parsers[0], scraper=timed, query=timed.query))
+            timer = writer.timer
+            assert writer.num_written == 0 and timer is not None
+            timer.join(5)
+            assert writer.num_written == 1 and writer.timer is None
+            assert session.query(SERP).filter(SERP.query == 'timed').count() == 1
+        finally:
+            self.close_database(session)
+            os.remove('bulk_test.db')
+
+    def test_database_writer(self):
+        parser = self.get_parser_for_file('google', 'data/uncompressed_serp_pages/abrakadabra_google_de_ip.html')
+
+        session = get_session(path='writer_test.db')()
+        try:
+            for serp_writer_class in (SessionSerpWriter, BulkSerpWriter):
+                scraper_search = ScraperSearch()
+                session.add(scraper_search)
+                session.commit()
+
+                # a queue of two pages makes the workers wait for the writer
+                writer = DatabaseWriter(serp_writer_class(session.get_bind(), scraper_search.id), queue_size=2)
+                writer.start()
+                for i in range(10):
+                    scraper = SimpleNamespace(query='keyword {}'.format(i), search_engine_name='google',
+                                              scrape_method='http', page_number=1, requested_at=None,
+                                              requested_by='127.0.0.1', status='successful', autocomplete=None)
+                    writer.add(serp_rows(parser=parser, scraper=scraper, query=scraper.query))
+                writer.close()
+                assert not writer.is_alive()
+
+                session.expire_all()
+                assert sorted(serp.query for serp in scraper_search.serps) == ['keyword {}'.format(i) for i in range(10)]
+                assert len({len(serp.links) for serp in scraper_search.serps}) == 1
+                assert scraper_search.serps[0].links
+
+            # a failed batch doesn't stop the writer, but is raised when it is closed
+            writer = DatabaseWriter(BulkSerpWriter(session.get_bind(), scraper_search.id))
+            writer.start()
+            rows = serp_rows(parser=parser, scraper=scraper, query=scraper.query)
+            rows.serp['query'] = {'sqlite': "can't bind a dict"}
+            writer.add(rows)
+            writer.flush()
+            with self.assertRaises(DatabaseWriterException):
+                writer.close()
+            assert writer.num_failed_batches == 1 and not writer.is_alive()
+        finally:
+            self.close_database(session)
+            os.remove('writer_test.db')
+
+    def test_sqlite_profile(self):
+        session = get_session(path='profile_test.db')()
+        read_session = get_session(path='profile_test.db', read_only=True)()
+        try:
+            assert session.execute('PRAGMA journal_mode').scalar() == 'wal'
+            assert session.execute('PRAGMA synchronous').scalar() == 1
+            assert read_session.execute('PRAGMA temp_store').scalar() == 2
+
+            # the read-only session queries while a write transaction is open
+            session.add(ScraperSearch(keyword_file='keywords.txt'))
+            session.flush()
+            assert read_session.query(ScraperSearch).count() == 0
+            session.commit()
+            assert read_session.query(ScraperSearch).count() == 1
+
+            read_session.add(ScraperSearch(keyword_file='keywords.txt'))
+            with self.assertRaises(OperationalError):
+                read_session.commit()
+        finally:
+            self.close_database(read_session)
+            self.close_database(session)
+            os.remove('profile_test.db')
+
+    def test_schema_migration(self):
+        # a database of an older version without the indexes
+        connection = sqlite3.connect('migration_test.db')
+        connection.execute('CREATE TABLE serp (id INTEGER PRIMARY KEY, query VARCHAR, search_engine_name VARCHAR, '
+                           'scrape_method VARCHAR, page_number INTEGER)')
+        connection.execute('CREATE TABLE link (id INTEGER PRIMARY KEY, domain VARCHAR, serp_id INTEGER)')
+        connection.execute('CREATE TABLE proxy (id INTEGER PRIMARY KEY, ip VARCHAR, port INTEGER)')
+        connection.commit()
+        connection.close()
+
+        session = get_session(path='migration_test.db')()
+        try:
+            indexes = {table: {index['name'] for index in inspect(session.get_bind()).get_indexes(table)}
+                       for table in ('serp', 'link', 'proxy')}
+            assert indexes == {
+                'serp': {'ix_serp_query', 'ix_serp_lookup'},
+                'link': {'ix_link_serp_id', 'ix_link_domain'},
+                'proxy': {'unique_proxy'},
+            }
+
+            # the lookups don't scan the tables
+            lookups = [
+                ('SELECT id FROM serp WHERE query = ? ORDER BY id DESC LIMIT 1', ('a',)),
+                ('SELECT id FROM serp WHERE query = ? AND search_engine_name = ? AND scrape_method = ? '
+                 'AND page_number = ?', ('a', 'google', 'http', 1)),
+                ('SELECT id FROM link WHERE serp_id = ?', (1,)),
+                ('SELECT id FROM proxy WHERE ip = ?', ('127.0.0.1',)),
+            ]
+            for statement, parameters in lookups:
+                plan = ' '.join(row[-1] for row in session.get_bind().execute('EXPLAIN QUERY PLAN ' + statement,
+                                                                              *parameters))
+                assert 'USING' in plan and 'TEMP B-TREE' not in plan, plan
+        finally:
+            self.close_database(session)
+            os.remove('migration_test.db')
+
+    def test_set_values_from_adwords(self):
+        session = get_session(path='adwords_test.db')()
+        try:
+            for query in ('apples', 'peaches', 'apples'):
+                session.add(SERP(query=query, search_engine_name='google'))
+            session.commit()
+
+            metrics = {'average_monthly_search_volume': 1000, 'average_cpc': 0.5, 'competition': 0.8,
+                       'monthly_search_volumes': ['2015-01: 900', '2015-02: 1100']}
+            traffic = {'apples': metrics, 'peaches': dict(metrics, monthly_search_volumes=[]),
+                       'bananas': metrics}
+            set_values_from_adwords(session, traffic)
+
+            first, peaches, latest = session.query(SERP).order_by(SERP.id).all()
+            assert first.average_monthly_search_volume is None
+            assert (latest.average_monthly_search_volume, latest.average_cpc, latest.competition) == (1000, 0.5, 0.8)
+            assert latest.monthly_search_volumes == '2015-01: 900; 2015-02: 1100'
+            assert peaches.average_monthly_search_volume == 1000 and peaches.monthly_search_volumes is None
+        finally:
+            self.close_database(session)
+            os.remove('adwords_test.db')
+
     def test_no_results2_static(self):
 
         query = '"Find ich besser als einfach nur den Propheten zu zeichnen, denn das ist nur reine Provokation. Was Titanic macht ist Satire."'